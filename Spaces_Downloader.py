@@ -5,9 +5,10 @@ import subprocess
 import os
 import re
 import sys
-import shutil
 from pathlib import Path
-from playwright.async_api import async_playwright
+
+from space_url import normalize_space_url, validate_space_url
+from tool_registry import registry
 
 class TwitterSpacesDownloader:
     def __init__(self):
@@ -54,8 +55,8 @@ class TwitterSpacesDownloader:
         return True
     
     def check_command(self, command):
-        """Check if a command is available in PATH"""
-        return shutil.which(command) is not None
+        """Check if a command is available (discovery is cached on disk)"""
+        return registry.get(command) is not None
     
     def prompt_install_dependencies(self, missing_deps):
         """Ask user if they want to install missing dependencies"""
@@ -105,9 +106,8 @@ class TwitterSpacesDownloader:
         return True
     
     def validate_space_url(self, url):
-        """Validate Twitter Space URL format"""
-        pattern = r'^https://x\.com/i/spaces/[a-zA-Z0-9]+$'
-        return re.match(pattern, url) is not None
+        """Validate Twitter Space URL format (Space, broadcast or status links)"""
+        return validate_space_url(url)
     
     def sanitize_filename_timestamp(self, timestamp):
         """Ensure timestamp is safe for filename use"""
@@ -115,16 +115,20 @@ class TwitterSpacesDownloader:
     
     async def login_to_x(self, username, password, mfa_code=None, max_retries=3):
         """Login to X with retry logic"""
+        # Imported here so runs with valid cookies never pay for Playwright
+        from playwright.async_api import async_playwright
+        from lean_login import LeanLogin, describe_stats, save_storage_state, write_netscape_cookies
+
         print(f"\n🔐 Logging into X as {username}...")
         
         for attempt in range(max_retries):
             try:
                 async with async_playwright() as p:
-                    browser = await p.chromium.launch(headless=True)
-                    context = await browser.new_context()
-                    page = await context.new_page()
+                    # Only what the login form needs is loaded: no images, fonts or analytics
+                    login = LeanLogin()
+                    browser, context, page = await login.open(p)
 
-                    await page.goto("https://x.com/i/flow/login")
+                    await page.goto(login.login_url)
 
                     # Username entry
                     try:
@@ -167,21 +171,13 @@ class TwitterSpacesDownloader:
 
                     # Save cookies
                     cookies = await context.cookies()
-                    with open(self.cookies_file, "w") as f:
-                        f.write("# Netscape HTTP Cookie File\n")
-                        f.write("# This file is generated by the spaces downloader script.\n\n")
-                        for cookie in cookies:
-                            f.write(
-                                f"{cookie['domain']}\t"
-                                f"{'TRUE' if cookie['domain'].startswith('.') else 'FALSE'}\t"
-                                f"{cookie['path']}\t"
-                                f"{'TRUE' if cookie.get('secure', False) else 'FALSE'}\t"
-                                f"{int(cookie['expires']) if cookie['expires'] else 0}\t"
-                                f"{cookie['name']}\t"
-                                f"{cookie['value']}\n"
-                            )
+                    write_netscape_cookies(cookies, self.cookies_file,
+                                           ["This file is generated by the spaces downloader script."])
 
+                    # The whole browser session, so the next refresh is one page load
+                    await save_storage_state(context, self.cookies_file)
                     print("✅ Login completed! Cookies saved.")
+                    print(f"📊 {describe_stats(await login.measure())}")
                     await browser.close()
                     return True
 
@@ -193,6 +189,26 @@ class TwitterSpacesDownloader:
 
         return False
     
+    def restore_session(self):
+        """Refresh cookies from the browser session saved at the last login"""
+        from credentials import get_credential_manager
+        from lean_login import has_storage_state
+
+        if not has_storage_state(self.cookies_file):
+            return False
+        print("♻️  Restoring the saved browser session...")
+        try:
+            # Shared with any other refresh of this file already under way
+            restored = get_credential_manager(self.cookies_file).refresh().result()
+        except Exception as e:
+            print(f"⚠️  Could not restore the session: {e}")
+            return False
+        if restored:
+            print("✅ Session refreshed - no login needed.")
+        else:
+            print("⚠️  The saved session has expired - logging in again.")
+        return restored
+    
     def validate_cookies(self):
         """Check if cookies file exists and contains auth_token"""
         try:
@@ -309,10 +325,10 @@ class TwitterSpacesDownloader:
         while True:
             url = input("\n🔗 Enter Twitter Space URL: ").strip()
             if self.validate_space_url(url):
-                return url
+                return normalize_space_url(url)
             else:
                 print("❌ Invalid URL format. Please try again.")
-                print("💡 URL should be: https://x.com/i/spaces/[SPACE_ID]")
+                print("💡 URL should be: https://x.com/i/spaces/[SPACE_ID] (or a post sharing the Space)")
     
     def run(self):
         """Main application loop"""
@@ -324,8 +340,8 @@ class TwitterSpacesDownloader:
                 input("\nPress Enter to exit...")
                 return
             
-            # Check authentication
-            if not self.validate_cookies():
+            # Check authentication - a saved browser session is tried before a full login
+            if not self.validate_cookies() and not self.restore_session():
                 username, password, mfa_code = self.get_user_input()
                 if not username:
                     return
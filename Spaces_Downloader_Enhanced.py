@@ -3,27 +3,26 @@ import getpass
 import datetime
 import subprocess
 import os
-import re
 import sys
 import shutil
 import json
 import time
 from pathlib import Path
-from playwright.async_api import async_playwright
 
-def get_ffmpeg_path():
-    """Get path to FFmpeg - bundled or system"""
+from space_url import normalize_space_url, validate_space_url
+from tool_registry import find_tool_path, registry
+
+def get_ffmpeg_path(allow_install=False):
+    """Get path to FFmpeg - bundled or system.
+
+    Discovery is cached on disk. The winget install is only attempted when
+    allow_install is set, i.e. right before a download, never at startup.
+    """
+    ffmpeg_path = find_tool_path("ffmpeg")
+    if ffmpeg_path != "ffmpeg" or not allow_install:
+        return ffmpeg_path
+    
     if getattr(sys, 'frozen', False):
-        # Running as executable - try bundled FFmpeg first
-        bundled_ffmpeg = os.path.join(sys._MEIPASS, "ffmpeg.exe")
-        if os.path.exists(bundled_ffmpeg):
-            return bundled_ffmpeg
-        
-        # Fall back to system FFmpeg
-        system_ffmpeg = shutil.which("ffmpeg")
-        if system_ffmpeg:
-            return system_ffmpeg
-        
         # Try to install FFmpeg if not found
         print("⚠️  FFmpeg not found. Attempting to install...")
         try:
@@ -33,10 +32,7 @@ def get_ffmpeg_path():
             return shutil.which("ffmpeg") or "ffmpeg"
         except:
             print("❌ Could not install FFmpeg automatically")
-            return "ffmpeg"  # Hope it works
-    else:
-        # Running as script - use system FFmpeg
-        return shutil.which("ffmpeg") or "ffmpeg"
+    return "ffmpeg"  # Hope it works
 
 class TwitterSpacesDownloader:
     def __init__(self):
@@ -99,7 +95,7 @@ class TwitterSpacesDownloader:
         print("🔍 Checking dependencies...")
         
         # Check yt-dlp
-        if not shutil.which("yt-dlp"):
+        if not registry.get("yt-dlp"):
             print("📦 Installing yt-dlp...")
             try:
                 subprocess.run([sys.executable, "-m", "pip", "install", "yt-dlp"], 
@@ -109,11 +105,11 @@ class TwitterSpacesDownloader:
                 print("❌ Failed to install yt-dlp")
                 return False
         
-        # Check FFmpeg
+        # Check FFmpeg (no install attempt here - that waits for the first download)
         ffmpeg_path = get_ffmpeg_path()
-        if getattr(sys, 'frozen', False) and os.path.exists(os.path.join(sys._MEIPASS, "ffmpeg.exe")):
+        if getattr(sys, 'frozen', False) and ffmpeg_path.startswith(sys._MEIPASS):
             print("✅ Using bundled FFmpeg")
-        elif shutil.which("ffmpeg"):
+        elif ffmpeg_path != "ffmpeg":
             print("✅ System FFmpeg found")
         else:
             print("⚠️  FFmpeg not found - will attempt auto-installation during download")
@@ -140,23 +136,46 @@ class TwitterSpacesDownloader:
         except Exception:
             return False
 
+    def restore_session(self):
+        """Refresh cookies from the browser session saved at the last login"""
+        from credentials import get_credential_manager
+        from lean_login import has_storage_state
+
+        if not has_storage_state(self.cookies_file):
+            return False
+        print("♻️  Restoring the saved browser session...")
+        try:
+            # Shared with any other refresh of this file already under way
+            restored = get_credential_manager(self.cookies_file).refresh().result()
+        except Exception as e:
+            print(f"⚠️  Could not restore the session: {e}")
+            return False
+        if restored:
+            print("✅ Session refreshed - no login needed.")
+        else:
+            print("⚠️  The saved session has expired - logging in again.")
+        return restored
+
     async def login_to_x(self, username, password, mfa_code=None, max_retries=2):
         """Enhanced login with better error handling"""
+        # Imported here so runs with valid cookies never pay for Playwright
+        from playwright.async_api import async_playwright
+        from lean_login import LeanLogin, describe_stats, save_storage_state, write_netscape_cookies
+
         print(f"\n🔐 Logging into X as {username}...")
         
         for attempt in range(max_retries):
             try:
                 async with async_playwright() as p:
-                    browser = await p.chromium.launch(
-                        headless=True,
-                        args=['--disable-blink-features=AutomationControlled', '--no-sandbox']
-                    )
-                    context = await browser.new_context(
+                    # Only what the login form needs is loaded: no images, fonts or analytics
+                    login = LeanLogin()
+                    browser, context, page = await login.open(
+                        p,
+                        args=['--disable-blink-features=AutomationControlled', '--no-sandbox'],
                         user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
                     )
-                    page = await context.new_page()
 
-                    await page.goto("https://x.com/i/flow/login", wait_until='networkidle')
+                    await page.goto(login.login_url, wait_until='networkidle')
                     await page.wait_for_timeout(2000)
 
                     # Username entry
@@ -234,26 +253,19 @@ class TwitterSpacesDownloader:
                         continue
                     
                     # Save cookies
-                    with open(self.cookies_file, "w", encoding='utf-8') as f:
-                        f.write("# Netscape HTTP Cookie File\n")
-                        f.write("# Generated by Twitter Spaces Downloader\n")
-                        f.write(f"# Created: {datetime.datetime.now().isoformat()}\n\n")
-                        for cookie in cookies:
-                            f.write(
-                                f"{cookie['domain']}\t"
-                                f"{'TRUE' if cookie['domain'].startswith('.') else 'FALSE'}\t"
-                                f"{cookie['path']}\t"
-                                f"{'TRUE' if cookie.get('secure', False) else 'FALSE'}\t"
-                                f"{int(cookie['expires']) if cookie['expires'] else 0}\t"
-                                f"{cookie['name']}\t"
-                                f"{cookie['value']}\n"
-                            )
+                    write_netscape_cookies(cookies, self.cookies_file, [
+                        "Generated by Twitter Spaces Downloader",
+                        f"Created: {datetime.datetime.now().isoformat()}",
+                    ])
 
                     # Update settings
                     self.settings["last_login"] = datetime.datetime.now().isoformat()
                     self.save_settings()
 
+                    # The whole browser session, so the next refresh is one page load
+                    await save_storage_state(context, self.cookies_file)
                     print("✅ Login completed successfully!")
+                    print(f"📊 {describe_stats(await login.measure())}")
                     await browser.close()
                     return True
 
@@ -266,9 +278,8 @@ class TwitterSpacesDownloader:
         return False
     
     def validate_space_url(self, url):
-        """Validate Twitter Space URL format"""
-        pattern = r'^https://x\.com/i/spaces/[a-zA-Z0-9]+$'
-        return re.match(pattern, url) is not None
+        """Validate Twitter Space URL format (Space, broadcast or status links)"""
+        return validate_space_url(url)
     
     def download_twitter_space(self, url):
         """Download Twitter Space using yt-dlp with smart FFmpeg handling"""
@@ -279,8 +290,8 @@ class TwitterSpacesDownloader:
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
         output_format = str(self.downloads_dir / f"space_{timestamp}_%(uploader)s_%(upload_date)s_%(id)s.%(ext)s")
 
-        # Get FFmpeg path
-        ffmpeg_path = get_ffmpeg_path()
+        # Get FFmpeg path, installing it now if it is missing
+        ffmpeg_path = get_ffmpeg_path(allow_install=True)
 
         command = [
             "yt-dlp",
@@ -406,10 +417,10 @@ class TwitterSpacesDownloader:
                 continue
                 
             if self.validate_space_url(url):
-                return url
+                return normalize_space_url(url)
             else:
                 print("❌ Invalid URL format.")
-                print("💡 URL should be: https://x.com/i/spaces/[SPACE_ID]")
+                print("💡 URL should be: https://x.com/i/spaces/[SPACE_ID] (or a post sharing the Space)")
     
     def run(self):
         """Main application with enhanced flow"""
@@ -423,8 +434,8 @@ class TwitterSpacesDownloader:
                 print("\n⚠️  Some dependencies could not be installed.")
                 input("Press Enter to continue anyway, or Ctrl+C to exit...")
             
-            # Check authentication
-            if not self.validate_cookies():
+            # Check authentication - a saved browser session is tried before a full login
+            if not self.validate_cookies() and not self.restore_session():
                 print("\n🔑 Authentication required.")
                 username, password, mfa_code = self.get_user_credentials()
                 if not username:
@@ -1,13 +1,25 @@
 import asyncio
-import datetime
 import subprocess
 import streamlit as st
 from playwright.async_api import async_playwright
 import os
+import hashlib
 import nest_asyncio
-import threading
 import shutil
 import zipfile
+from pathlib import Path
+
+from audio_analysis import analyze_audio, extract_clip, peaks_path_for, read_peaks
+from credential_pool import classify_failure, get_pool
+from credentials import get_credential_manager
+from disk_preflight import InsufficientSpace, estimate_job_bytes, estimate_source_bytes, reservations
+from download_cache import download_cache
+from download_engine import DownloadJob, build_download_command, engine
+from lean_login import LeanLogin, describe_stats, has_storage_state, save_storage_state, write_netscape_cookies
+from file_server import file_server
+from job_queue import QUEUE_NAME, get_queue
+from retention import get_manager
+from space_url import SpaceKey, canonical_url, resolve_space_key
 
 #
 #    TODO's: Still have to post example URL's for both Twitter and Youtube (and any other services this will work on)
@@ -20,15 +32,40 @@ st.set_page_config(page_title="TwitterX Spaces Downloader", page_icon="🎹")
 
 DATA_DIR = os.getcwd()
 COOKIES_PATH = os.path.join(DATA_DIR, "cookies.txt")
-download_result = {}
 
-# --- Cleanup previous archives ---
-for file in os.listdir(DATA_DIR):
-    if file.startswith("twitter_space_") and file.endswith(".zip"):
-        try:
-            os.remove(os.path.join(DATA_DIR, file))
-        except Exception:
-            pass
+# Extra accounts' cookie files; downloads are spread over these and cookies.txt,
+# and an account X throttles sits out for a while
+ACCOUNTS_DIR = os.path.join(DATA_DIR, "accounts")
+credentials = get_pool(ACCOUNTS_DIR, COOKIES_PATH)
+
+# Refreshes cookies.txt from the saved browser session before it expires; every
+# session asking for a refresh at once shares one browser
+cookie_manager = get_credential_manager(COOKIES_PATH).start()
+
+# Whether visitors who give no credentials may download on the browser session
+# saved at the last login (someone else's X account) - for single-user deployments
+SHARE_SAVED_SESSION = os.environ.get("TSD_SHARE_SAVED_SESSION", "").lower() in ("1", "true", "yes")
+
+# Peak disk use of the zip step relative to the download: audio + its zip copy
+ZIP_PACKAGING_FACTOR = 2.0
+
+# Buckets drawn in the preview waveform, whatever the zoom
+PREVIEW_POINTS = 1500
+
+# Archives, preview audio and peaks are evicted by a background sweep (shared by
+# every session) once unused for ARCHIVE_MAX_AGE_HOURS, or oldest first while the
+# folder is over ARCHIVE_MAX_GB; files being downloaded or served are never touched
+ARCHIVE_MAX_AGE_HOURS = float(os.environ.get("TSD_ARCHIVE_MAX_AGE_HOURS", "24"))
+ARCHIVE_MAX_GB = float(os.environ.get("TSD_ARCHIVE_MAX_GB", "10"))
+
+archive_retention = get_manager(DATA_DIR, ["twitter_space_*"],
+                                max_age=ARCHIVE_MAX_AGE_HOURS * 3600,
+                                max_bytes=int(ARCHIVE_MAX_GB * 1024 ** 3)).start()
+file_server.retention = archive_retention
+
+# Every download is recorded on disk; ones a crash or restart cut short are
+# resumed (yt-dlp picks up its .part file) without anyone asking again
+job_queue = get_queue(os.path.join(DATA_DIR, QUEUE_NAME)).start()
 
 if not os.path.exists(os.path.expanduser("~/.cache/ms-playwright")):
     try:
@@ -37,14 +74,28 @@ if not os.path.exists(os.path.expanduser("~/.cache/ms-playwright")):
     except Exception as e:
         st.error(f"❌ Playwright install failed: {e}")
 
+def restore_session():
+    """Refresh cookies.txt from the browser session saved at the last login"""
+    with st.spinner("Restoring the saved session..."):
+        try:
+            restored = cookie_manager.refresh().result()
+        except Exception as e:
+            st.warning(f"⚠️ Could not restore the saved session: {e}")
+            return False
+    if restored:
+        st.success("♻️ Saved session restored - no login needed.")
+    else:
+        st.info("ℹ️ The saved session has expired - logging in again.")
+    return restored
+
 async def login_to_x(username, password, mfa_code=None, challenge_value=None):
     try:
         async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=True)
-            context = await browser.new_context()
-            page = await context.new_page()
+            # Only what the login form needs is loaded: no images, fonts or analytics
+            login = LeanLogin()
+            browser, context, page = await login.open(p)
 
-            await page.goto("https://x.com/i/flow/login")
+            await page.goto(login.login_url)
             await page.wait_for_selector("input[name='text']", timeout=20000)
             await page.fill("input[name='text']", username)
             await page.click("button:has-text('Next')")
@@ -101,88 +152,314 @@ async def login_to_x(username, password, mfa_code=None, challenge_value=None):
 
             await page.wait_for_timeout(5000)
             cookies = await context.cookies()
-            with open(COOKIES_PATH, "w") as f:
-                f.write("# Netscape HTTP Cookie File\n")
-                for cookie in cookies:
-                    f.write(
-                        f"{cookie['domain']}\t"
-                        f"{'TRUE' if cookie['domain'].startswith('.') else 'FALSE'}\t"
-                        f"{cookie['path']}\t"
-                        f"{'TRUE' if cookie.get('secure', False) else 'FALSE'}\t"
-                        f"{int(cookie['expires']) if cookie.get('expires') else 0}\t"
-                        f"{cookie['name']}\t"
-                        f"{cookie['value']}\n"
-                    )
+            write_netscape_cookies(cookies, COOKIES_PATH)
+            # The whole browser session, so the next refresh is one page load
+            await save_storage_state(context, COOKIES_PATH)
+            st.caption(f"📊 {describe_stats(await login.measure())}")
             await browser.close()
             return True
     except Exception as e:
         st.error(f"❌ Login failed: {e}")
         return False
 
+def pooled_cookies():
+    """A healthy account's cookies for a quick lookup, or cookies.txt if there is none"""
+    account = credentials.pick()
+    return str(account.path) if account else COOKIES_PATH
+
 async def async_download_twitter_space(url):
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    base_filename = f"twitter_space_{timestamp}"
+    clear_preview()
+    # Everyone asking for this Space - by any URL for it - shares one download and
+    # one set of files. Other sites' URLs are passed to yt-dlp as they are.
+    key = await resolve_space_key(url, pooled_cookies())
+    if isinstance(key, SpaceKey):
+        url = canonical_url(key)
+        base_filename = f"twitter_space_{key.id}"
+    else:
+        key = url.strip()
+        base_filename = "twitter_space_" + hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+    entry, started = download_cache.attach(key, lambda entry: fetch_space(url, base_filename, entry, key))
+    if not started:
+        if entry.done:
+            st.info("♻️ This Space was downloaded recently - reusing the archive.")
+        else:
+            st.info("🔗 This Space is already being downloaded - joining that download.")
+
+    progress_placeholder = st.empty()
+    # Clicking this reruns the script, which interrupts the next progress update and
+    # detaches this session; the last session to leave stops yt-dlp/ffmpeg and
+    # removes the partial files
+    st.button("🛑 Cancel download", key=f"cancel_{base_filename}",
+              on_click=lambda: st.session_state.update(download_cancelled=True))
+
+    def show_progress(entry):
+        if entry.status == "downloading":
+            downloaded = (entry.progress.get("downloaded_bytes") or 0) / (1024 * 1024)
+            progress_placeholder.text(f"⬇️ {downloaded:.1f} MB downloaded")
+        else:
+            progress_placeholder.text(f"⏳ {entry.status.capitalize()}...")
+
+    try:
+        result = await download_cache.wait(entry, on_update=show_progress)
+    except InsufficientSpace as e:
+        st.error(f"❌ {e}")
+        return
+    except Exception as e:
+        # The shared download crashed (yt-dlp missing, disk error, a bug) - show it
+        # like any other failed download instead of Streamlit's traceback page
+        progress_placeholder.empty()
+        show_download_result({"success": False, "stderr": f"Unexpected error: {e}"})
+        return
+    finally:
+        download_cache.detach(entry)
+    progress_placeholder.empty()
+
+    if result is None:
+        st.warning("🛑 Download cancelled.")
+        return
+    if result.get("command"):
+        st.code(" ".join(result["command"]), language="bash")
+    show_download_result(result)
+
+def resume_web_jobs():
+    """Restart the downloads an earlier process left unfinished.
+
+    Each runs with no session attached (so nothing cancels it) and later
+    requests for the Space join it as usual. Cheap to call on every rerun:
+    jobs claimed once are ours and aren't handed out again.
+    """
+    for queued in job_queue.claim("web"):
+        key = SpaceKey(*queued.spec["key"]) if isinstance(queued.spec["key"], list) else queued.spec["key"]
+        entry, started = download_cache.attach(key, lambda entry, queued=queued, key=key: fetch_space(
+            queued.url, queued.spec["base_filename"], entry, key, queued.id))
+        if not started:
+            # Already downloading (or done) under another row - this one won't run
+            download_cache.detach(entry)
+            job_queue.set_state(queued.id, "cancelled", "Duplicate")
+
+async def fetch_space(url, base_filename, entry, key, queue_id=None):
+    """Download, analyse and zip one Space on the shared download loop, recording
+    it in the job queue (queue_id if it's already there).
+
+    Runs without any session, so it reports through entry and its return
+    value only - never through st.* calls.
+    """
+    if queue_id is None:
+        spec = {"key": list(key) if isinstance(key, SpaceKey) else key, "base_filename": base_filename}
+        queue_id = job_queue.enqueue(url, spec, kind="web", claim=True)
+    job_queue.set_state(queue_id, "running")
+    try:
+        result = await download_space(url, base_filename, entry)
+    except asyncio.CancelledError:
+        # Every session left - cancelled on purpose, not interrupted
+        job_queue.set_state(queue_id, "cancelled")
+        raise
+    except Exception as e:
+        job_queue.set_state(queue_id, "failed", str(e))
+        raise
+    job_queue.set_state(queue_id, "done" if result["success"] else "failed",
+                        None if result["success"] else result.get("stderr", "")[-2000:])
+    return result
+
+async def download_space(url, base_filename, entry):
+    """fetch_space() minus the bookkeeping"""
     audio_path = os.path.join(DATA_DIR, f"{base_filename}.m4a")
     info_path = os.path.join(DATA_DIR, f"{base_filename}.info.json")
     zip_path = os.path.join(DATA_DIR, f"{base_filename}.zip")
 
-    command = [
-        "yt-dlp", "--verbose",
-        "--cookies", COOKIES_PATH,
-        "--no-clean-info-json",
-        "--write-info-json",
-        "--write-comments",
-        url,
-        "-o", audio_path
-    ]
-    st.code(" ".join(command), language="bash")
-
-    process = await asyncio.create_subprocess_exec(
-        *command,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE
-    )
-    stdout, stderr = await process.communicate()
-
-    if process.returncode == 0:
-        st.success("✅ Download successful.")
-        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zipf:
-            if os.path.exists(audio_path):
-                zipf.write(audio_path, os.path.basename(audio_path))
-                os.remove(audio_path)
-            if os.path.exists(info_path):
-                zipf.write(info_path, os.path.basename(info_path))
-                os.remove(info_path)
-
-        if os.path.exists(zip_path):
-            download_result["path"] = zip_path
-            download_result["name"] = os.path.basename(zip_path)
-        else:
-            st.error("⚠️ Archive missing after download.")
+    result = {"success": False, "command": [], "files": []}
+
+    def on_progress(job, progress):
+        entry.status = "downloading"
+        entry.progress = progress
+
+    # The audio and its zip copy exist side by side
+    entry.status = "checking the Space's size"
+    source_bytes = await estimate_source_bytes(url, pooled_cookies())
+    needed = estimate_job_bytes(source_bytes, ["m4a"], packaging_factor=ZIP_PACKAGING_FACTOR)
+    async with reservations.hold(DATA_DIR, needed,
+                                 on_wait=lambda nbytes: setattr(entry, "status", "waiting for disk space")):
+        # The least-loaded healthy account; if X throttles it or rejects its
+        # login, it leaves the rotation and the next account takes over. With
+        # every account throttled we wait for one, never falling back to
+        # cookies.txt (it's one of them, possibly the one sitting out)
+        job = None
+        for _ in range(max(1, len(credentials))):
+            account = await credentials.acquire_async(
+                on_wait=lambda seconds: setattr(entry, "status", f"every account is throttled - "
+                                                                 f"waiting {int(seconds / 60) + 1} min"))
+            if account is None:
+                break
+            command = build_download_command(url, "m4a", audio_path, str(account.path),
+                                             subtitles=False, write_info_json=True)
+            job = DownloadJob(command, out_dir=DATA_DIR, prefix=base_filename, url=url, format_ext="m4a",
+                              cancellable=True)
+            result["command"] = job.command
+            entry.status = f"starting yt-dlp ({account.name})"
+            failure = None
+            try:
+                await engine.run_job(job, on_progress=on_progress)
+                failure = None if job.success else classify_failure(job.stderr)
+            finally:
+                credentials.release(account, failure)
+            if failure is None:
+                break
+            if failure == "auth":
+                # Back in rotation once its cookies file is rewritten
+                await get_credential_manager(account.path).refresh_async()
+        if job is None:
+            result["stderr"] = credentials.unavailable_hint()
+            return result
+        if not job.success:
+            result["stderr"] = job.stderr
+            with open(os.path.join(DATA_DIR, "yt_dlp_error.log"), "w") as log_file:
+                log_file.write("YT-DLP Debug Information\n\n")
+                log_file.write("Command:\n" + ' '.join(job.command) + "\n\n")
+                log_file.write("STDERR:\n" + job.stderr)
+            return result
+
+        entry.status = "building the preview"
+        result.update(await build_peaks(audio_path))
+        entry.status = "packing the archive"
+        await asyncio.get_running_loop().run_in_executor(None, archive_download, audio_path, info_path,
+                                                         zip_path)
+
+    if os.path.exists(zip_path):
+        result.update(success=True, zip=zip_path, audio=audio_path, files=[zip_path, audio_path])
     else:
+        result["stderr"] = "Archive missing after download."
+    return result
+
+async def build_peaks(audio_path):
+    """Waveform peaks so the page can preview the Space without the zip"""
+    peaks_path = peaks_path_for(Path(audio_path))
+    try:
+        await analyze_audio(Path(audio_path), peaks_path=peaks_path)
+    except RuntimeError as e:
+        return {"preview_error": str(e)}
+    return {"peaks": str(peaks_path), "duration": read_peaks(peaks_path, max_points=1)["duration"]}
+
+def show_download_result(result):
+    """Show this session the outcome of a (possibly shared) download"""
+    if not result["success"]:
         st.error("❌ Download failed.")
-        st.text(stderr.decode())
-        with open(os.path.join(DATA_DIR, "yt_dlp_error.log"), "w") as log_file:
-            log_file.write("YT-DLP Debug Information\n\n")
-            log_file.write("Command:\n" + ' '.join(command) + "\n\n")
-            log_file.write("STDERR:\n" + stderr.decode())
+        st.text(result.get("stderr", ""))
+        return
 
-def start_background_loop(loop):
-    asyncio.set_event_loop(loop)
-    loop.run_forever()
+    st.success("✅ Download successful.")
+    publish_archive(result["zip"])
+    if result.get("preview_error"):
+        st.info(f"ℹ️ No preview available: {result['preview_error']}")
+        return
 
-background_loop = asyncio.new_event_loop()
-threading.Thread(target=start_background_loop, args=(background_loop,), daemon=True).start()
+    preview = {
+        "audio": result["audio"],
+        "peaks": result["peaks"],
+        "duration": result["duration"],
+        "token": None,
+        "url": None,
+    }
+    try:
+        # Lets the browser stream and seek the whole Space with Range requests
+        if file_server_reachable():
+            preview["token"], preview["url"] = file_server.publish(result["audio"])
+    except OSError:
+        pass
+    st.session_state["preview"] = preview
+
+def clear_preview():
+    """Stop serving this session's previous preview (the files are shared and
+    left to the retention sweep)"""
+    preview = st.session_state.pop("preview", None)
+    if preview and preview["token"]:
+        file_server.unpublish(preview["token"])
+
+def show_preview():
+    """Zoomable waveform of the last download, with clips played on demand"""
+    preview = st.session_state.get("preview")
+    if not preview or not os.path.exists(preview["peaks"]):
+        return
+    duration = preview["duration"]
+    if not duration or duration <= 0:
+        # Nothing decoded (empty or unreadable audio) - a 0..0 slider would raise
+        return
+    st.subheader("🔊 Preview")
+    start, end = st.slider("Zoom (seconds)", 0.0, duration, (0.0, duration), step=1.0)
+    peaks = read_peaks(preview["peaks"], start, end, max_points=PREVIEW_POINTS)
+    st.area_chart({"time": peaks["time"], "max": peaks["max"], "min": peaks["min"]},
+                  x="time", y=["max", "min"])
+    if preview["url"]:
+        st.audio(preview["url"], start_time=int(start))
+
+    if st.button(f"▶️ Play from {start:.0f}s"):
+        # Only the clip is decoded - the rest of the file is never read
+        clip = extract_clip(preview["audio"], start, end - start)
+        if clip:
+            st.audio(clip, format="audio/mpeg")
+        else:
+            st.warning("⚠️ Could not extract a clip from the audio.")
+
+def archive_download(audio_path, info_path, zip_path):
+    """Zip a finished download; the audio stays for the preview and later requests"""
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zipf:
+        if os.path.exists(audio_path):
+            zipf.write(audio_path, os.path.basename(audio_path))
+        if os.path.exists(info_path):
+            zipf.write(info_path, os.path.basename(info_path))
+            os.remove(info_path)
+
+def file_server_reachable():
+    """Whether this visitor's browser can reach the file server: it has a public
+    address (TSD_FILE_SERVER_URL), or the app is opened on this machine, where
+    the default http://localhost:<port> links work"""
+    if file_server.base_url:
+        return True
+    try:
+        host = st.context.headers.get("Host", "")
+    except AttributeError:
+        # Streamlit too old to tell (before 1.37)
+        return False
+    return host.rsplit(":", 1)[0].strip("[]") in ("localhost", "127.0.0.1", "::1")
+
+def publish_archive(zip_path):
+    """Serve the zip over HTTP instead of reading it into the session"""
+    previous = st.session_state.pop("archive", None)
+    if previous and previous["token"]:
+        file_server.unpublish(previous["token"])
+
+    archive = {"path": zip_path, "name": os.path.basename(zip_path), "token": None, "url": None}
+    if not file_server_reachable():
+        # A localhost link would point at the visitor's own machine
+        st.session_state["archive"] = archive
+        return
+    try:
+        archive["token"], archive["url"] = file_server.publish(zip_path)
+    except OSError as e:
+        st.warning(f"⚠️ File server unavailable ({e}) - falling back to an in-page download.")
+    st.session_state["archive"] = archive
+
+resume_web_jobs()
 
 st.title("🎹 TwitterX Spaces Downloader")
 st.caption("Download Twitter Spaces with yt-dlp + Playwright + Streamlit")
 
 uploaded_cookie = st.file_uploader("📂 Upload cookies.txt (to skip login)", type=["txt"])
+add_account = st.checkbox("Add as an extra account (downloads are spread across all accounts)")
 if uploaded_cookie:
-    with open(COOKIES_PATH, "wb") as out_file:
+    if add_account:
+        os.makedirs(ACCOUNTS_DIR, exist_ok=True)
+        cookie_path = os.path.join(ACCOUNTS_DIR, os.path.basename(uploaded_cookie.name))
+    else:
+        cookie_path = COOKIES_PATH
+    with open(cookie_path, "wb") as out_file:
         out_file.write(uploaded_cookie.read())
     st.success("✅ Cookies uploaded. Login step will be skipped.")
 
+if len(credentials) > 1:
+    with st.expander("🔑 Accounts"):
+        for line in credentials.status():
+            st.text(line)
+
 download_placeholder = st.empty()
 
 with st.form("login_form"):
@@ -201,8 +478,13 @@ if submit:
         with st.spinner("Downloading..."):
             asyncio.run(async_download_twitter_space(space_url))
     elif not username or not password:
-        st.warning("Please enter username and password or upload cookies.")
+        if SHARE_SAVED_SESSION and has_storage_state(COOKIES_PATH) and restore_session():
+            with st.spinner("Downloading..."):
+                asyncio.run(async_download_twitter_space(space_url))
+        else:
+            st.warning("Please enter username and password or upload cookies.")
     else:
+        # Always the visitor's own account - never the session someone else saved
         with st.spinner("Logging in..."):
             login_success = asyncio.run(login_to_x(username, password, mfa_code, challenge_value))
         if login_success:
@@ -210,11 +492,21 @@ if submit:
             with st.spinner("Downloading..."):
                 asyncio.run(async_download_twitter_space(space_url))
 
-if "path" in download_result and os.path.exists(download_result["path"]):
-    with open(download_result["path"], "rb") as zf:
-        download_placeholder.download_button(
-            label="📆 Download Archived Twitter Space",
-            data=zf,
-            file_name=download_result["name"],
-            mime="application/zip"
-        )
+show_preview()
+
+if st.session_state.pop("download_cancelled", False):
+    st.warning("🛑 Download cancelled. Unless another session is waiting for the same Space, "
+               "it was stopped and its partial files removed.")
+
+archive = st.session_state.get("archive")
+if archive and os.path.exists(archive["path"]):
+    if archive["url"]:
+        download_placeholder.link_button("📆 Download Archived Twitter Space", archive["url"])
+    else:
+        with open(archive["path"], "rb") as zf:
+            download_placeholder.download_button(
+                label="📆 Download Archived Twitter Space",
+                data=zf,
+                file_name=archive["name"],
+                mime="application/zip"
+            )
@@ -0,0 +1,143 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+
+# Ceiling on one job's parallel segment requests, and on all jobs' together
+MAX_JOB_CONCURRENCY = int(os.environ.get("TSD_MAX_JOB_REQUESTS", "16"))
+MAX_GLOBAL_CONCURRENCY = int(os.environ.get("TSD_MAX_SEGMENT_REQUESTS", "32"))
+
+# Estimated requests queued at the server (from how much slower requests got):
+# below QUEUE_LOW there's spare capacity, above QUEUE_HIGH we're only adding delay
+QUEUE_LOW = 1.0
+QUEUE_HIGH = 3.0
+
+INCREASE_STEP = 1
+LATENCY_DECREASE = 0.9      # too much queueing
+THROTTLE_DECREASE = 0.5     # 429, or too many 5xx/dropped connections
+
+# 5xx and network errors in a window tolerated as noise (share of the window)
+ERROR_TOLERANCE = 0.1
+
+# Window average paces remembered for the no-queueing baseline
+BASELINE_WINDOWS = 20
+
+# Wait before retrying a throttled request, unless the server says otherwise (Retry-After)
+THROTTLE_BACKOFF_SECONDS = 1.0
+MAX_RETRY_AFTER_SECONDS = 30
+
+# Shared by every job in the process; held for the duration of each request
+global_slots = threading.BoundedSemaphore(MAX_GLOBAL_CONCURRENCY)
+
+def classify_error(error):
+    """"throttled" (429), "overloaded" (5xx or a network error) or None (e.g. 404)"""
+    status = getattr(error, "status", None)
+    if status == 429:
+        return "throttled"
+    if (status is None and isinstance(error, OSError)) or (status is not None and status >= 500):
+        return "overloaded"
+    return None
+
+def retry_after(error):
+    """Seconds the server asked us to wait (Retry-After), capped"""
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return min(float(headers.get("retry-after")), MAX_RETRY_AFTER_SECONDS)
+    except (TypeError, ValueError):
+        return THROTTLE_BACKOFF_SECONDS
+
+class AIMDLimiter:
+    """Tunes how many requests a job keeps in flight (additive increase,
+    multiplicative decrease).
+
+    Results are judged per window (as many completed requests as the limit
+    allows in flight). Latency is compared as seconds per byte against the
+    best recent window: when requests aren't slowing down the limit grows by
+    one (doubles, until the first decrease), provided throughput didn't drop;
+    when they queue at the server it shrinks by 10%. A 429 halves it straight
+    away; 5xx and connection errors do once they're more than the odd one in
+    a window. Requests started before the last change don't count, as they
+    ran under the old limit. Thread-safe.
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=MAX_JOB_CONCURRENCY):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.limit = float(max(self.minimum, min(initial, self.maximum)))
+        self.lock = threading.Lock()
+        self.paces = deque(maxlen=BASELINE_WINDOWS)
+        self.previous_throughput = None
+        self.slow_start = True
+        self.created = self.changed_at = time.monotonic()
+        self.history = [(0.0, self.current)]     # (seconds since created, limit)
+        self.start_window(self.changed_at)
+
+    @property
+    def current(self):
+        """Requests to keep in flight right now"""
+        return max(self.minimum, int(self.limit))
+
+    @property
+    def adaptive(self):
+        return self.maximum > self.minimum
+
+    def start_window(self, now):
+        self.window_started = now
+        self.window_bytes = 0
+        self.window_seconds = 0.0
+        self.window_count = 0
+        self.window_errors = 0
+
+    def set_limit(self, limit, now):
+        if limit < self.limit:
+            self.slow_start = False
+        self.limit = max(float(self.minimum), min(limit, float(self.maximum)))
+        self.changed_at = now
+        if self.current != self.history[-1][1]:
+            self.history.append((now - self.created, self.current))
+        self.start_window(now)
+
+    def record(self, nbytes, started):
+        """A request that began at started (time.monotonic()) returned nbytes"""
+        now = time.monotonic()
+        with self.lock:
+            if started < self.changed_at:
+                return
+            self.window_bytes += nbytes
+            self.window_seconds += now - started
+            self.window_count += 1
+            if self.window_count >= self.current:
+                self.end_window(now)
+
+    def record_failure(self, started, error):
+        """A request failed; returns how long to wait before retrying it"""
+        kind = classify_error(error)
+        if kind is None:
+            return 0
+        with self.lock:
+            if started >= self.changed_at:
+                self.window_errors += 1
+                self.window_count += 1
+                if kind == "throttled" or self.window_errors > max(1, self.current * ERROR_TOLERANCE):
+                    self.set_limit(self.limit * THROTTLE_DECREASE, time.monotonic())
+        return retry_after(error) if kind == "throttled" else THROTTLE_BACKOFF_SECONDS * random.random()
+
+    def end_window(self, now):
+        throughput = self.window_bytes / max(now - self.window_started, 1e-6)
+        pace = self.window_seconds / max(self.window_bytes, 1)
+        self.paces.append(pace)
+        # The share of each request's time spent waiting, times requests in flight
+        queued = self.limit * (1 - min(self.paces) / pace)
+        previous, self.previous_throughput = self.previous_throughput, throughput
+        if queued > QUEUE_HIGH:
+            self.set_limit(self.limit * LATENCY_DECREASE, now)
+        elif queued < QUEUE_LOW and (previous is None or throughput >= previous * 0.9):
+            self.set_limit(self.limit * 2 if self.slow_start else self.limit + INCREASE_STEP, now)
+        else:
+            self.start_window(now)
+
+    def describe(self):
+        """e.g. "4 -> 12 requests in flight (peak 14, max 16)" for logs"""
+        limits = [limit for _, limit in self.history]
+        return f"{limits[0]} -> {limits[-1]} requests in flight (peak {max(limits)}, max {self.maximum})"
@@ -0,0 +1,422 @@
+import asyncio
+import json
+import os
+import struct
+import subprocess
+
+from download_engine import kill_process_tree, process_group_kwargs
+from tool_registry import registry
+
+# Mono 16-bit PCM is enough to measure loudness; trimming re-encodes from the
+# same stream, so it decodes at a rate fit for listening
+ANALYSIS_SAMPLE_RATE = 16000
+TRIM_SAMPLE_RATE = 48000
+
+# RMS is measured over frames of this length
+FRAME_SECONDS = 0.05
+
+# PCM read from ffmpeg per step - this (not the file length) bounds memory use
+CHUNK_SECONDS = 10
+
+SILENCE_THRESHOLD_DBFS = -45.0
+
+# Pauses shorter than this stay part of the speech around them
+MIN_SILENCE_SECONDS = 2.0
+
+# Silence kept on each side of speech when trimming, so cuts don't sound abrupt
+KEEP_SILENCE_SECONDS = 0.5
+
+# Encoders for the trimmed copy, which is built from decoded PCM
+TRIM_ENCODE_ARGS = {
+    "m4a": ["-c:a", "aac", "-b:a", "64k"],
+    "mp4": ["-c:a", "aac", "-b:a", "64k"],
+    "mp3": ["-c:a", "libmp3lame", "-q:a", "4"],
+    "opus": ["-c:a", "libopus", "-b:a", "48k"],
+}
+
+# Waveform peaks: min/max per 32 ms bucket, then each level 4x coarser
+PEAKS_BASE_SECONDS = 0.032
+PEAKS_LEVEL_FACTOR = 4
+PEAKS_LEVELS = 6
+
+# Peaks file layout: header, one (samples per bucket, bucket count) entry per
+# level, then each level's buckets as interleaved int8 min/max pairs
+PEAKS_MAGIC = b"TSPK"
+PEAKS_VERSION = 1
+PEAKS_HEADER = struct.Struct("<4sHHII")    # magic, version, levels, sample rate, total samples
+PEAKS_LEVEL = struct.Struct("<II")
+
+# Longest clip the preview extracts at a time
+CLIP_MAX_SECONDS = 30
+
+def load_numpy():
+    """numpy is only needed for analysis, so it is imported on first use"""
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("Speech analysis needs numpy - install it with: pip install numpy")
+    return numpy
+
+def index_path_for(media_path):
+    return media_path.with_name(f"{media_path.stem}.speech.json")
+
+def peaks_path_for(media_path):
+    return media_path.with_name(f"{media_path.stem}.peaks")
+
+def trimmed_path_for(media_path):
+    ext = "m4a" if media_path.suffix == ".mp4" else media_path.suffix.lstrip(".")
+    return media_path.with_name(f"{media_path.stem}.trimmed.{ext}")
+
+class SpeechDetector:
+    """Splits a stream of PCM chunks into speech and silence.
+
+    Frames are classified by RMS level in one vectorised step per chunk, and
+    only the boundaries between runs are handled in Python. Silences longer
+    than min_silence end a speech segment; with a sink, everything except
+    keep_silence on either side of such a silence is written on to the sink,
+    which produces the trimmed audio without a second pass.
+    """
+
+    def __init__(self, sample_rate, threshold_dbfs=SILENCE_THRESHOLD_DBFS,
+                 min_silence=MIN_SILENCE_SECONDS, keep_silence=KEEP_SILENCE_SECONDS, sink=None):
+        self.np = load_numpy()
+        self.sample_rate = sample_rate
+        self.frame_length = int(sample_rate * FRAME_SECONDS)
+        self.threshold_dbfs = threshold_dbfs
+        self.threshold = 32768 * 10 ** (threshold_dbfs / 20)
+        self.min_silence = int(sample_rate * min_silence)
+        self.keep_silence = min(int(sample_rate * keep_silence), self.min_silence // 2)
+        self.sink = sink
+
+        self.position = 0          # samples seen so far
+        self.speech = []           # [(start, end)] in samples
+        self.speech_start = None
+        self.silence_start = None
+        self.last_speech_end = 0
+        self.pending = []          # silence held back until we know whether it's kept
+        self.pending_length = 0
+        self.dropping = False      # inside a long silence
+
+    def emit(self, samples):
+        if self.sink is not None and len(samples):
+            self.sink.append(samples.tobytes())
+
+    def frame_levels(self, samples):
+        """RMS of each whole frame in a chunk (a trailing partial frame counts as one)"""
+        np = self.np
+        frames = len(samples) // self.frame_length
+        whole = samples[:frames * self.frame_length].astype(np.float32).reshape(frames, self.frame_length)
+        levels = np.sqrt(np.mean(whole * whole, axis=1))
+        if len(samples) % self.frame_length:
+            tail = samples[frames * self.frame_length:].astype(np.float32)
+            levels = np.append(levels, np.sqrt(np.mean(tail * tail)))
+        return levels
+
+    def feed(self, samples):
+        """Process the next chunk of int16 mono samples"""
+        np = self.np
+        if not len(samples):
+            return
+        loud = self.frame_levels(samples) >= self.threshold
+        # Split the chunk at every change between speech and silence
+        edges = np.flatnonzero(loud[1:] != loud[:-1]) + 1
+        starts = np.concatenate(([0], edges))
+        ends = np.concatenate((edges, [len(loud)]))
+        for start, end in zip(starts, ends):
+            run = samples[start * self.frame_length:end * self.frame_length]
+            if loud[start]:
+                self.on_speech(run)
+            else:
+                self.on_silence(run)
+            self.position += len(run)
+
+    def on_speech(self, run):
+        for held in self.pending:
+            self.emit(held)
+        self.pending = []
+        self.pending_length = 0
+        self.dropping = False
+        self.silence_start = None
+        if self.speech_start is None:
+            self.speech_start = self.position
+        self.emit(run)
+        self.last_speech_end = self.position + len(run)
+
+    def on_silence(self, run):
+        np = self.np
+        if self.silence_start is None:
+            self.silence_start = self.position
+        self.pending.append(run)
+        self.pending_length += len(run)
+
+        if self.dropping:
+            # Only the tail is needed, as lead-in for the next speech
+            held = np.concatenate(self.pending)
+            held = held[len(held) - self.keep_silence:]
+            self.pending = [held]
+            self.pending_length = len(held)
+        elif self.pending_length >= self.min_silence:
+            held = np.concatenate(self.pending)
+            # The pad after speech - a silence the file starts with has none
+            if self.last_speech_end:
+                self.emit(held[:self.keep_silence])
+            held = held[len(held) - self.keep_silence:]
+            self.pending = [held]
+            self.pending_length = len(held)
+            self.dropping = True
+            if self.speech_start is not None:
+                self.speech.append((self.speech_start, self.silence_start))
+                self.speech_start = None
+
+    def finish(self):
+        """Flush what's held back and return the speech/silence index"""
+        if not self.dropping:
+            for held in self.pending:
+                self.emit(held)
+        self.pending = []
+        if self.speech_start is not None:
+            self.speech.append((self.speech_start, self.last_speech_end))
+            self.speech_start = None
+
+        rate = self.sample_rate
+        speech = [[round(start / rate, 2), round(end / rate, 2)] for start, end in self.speech]
+        speech_seconds = sum(end - start for start, end in speech)
+        duration = self.position / rate
+        return {
+            "duration": round(duration, 2),
+            "speech_seconds": round(speech_seconds, 2),
+            "silence_seconds": round(duration - speech_seconds, 2),
+            "threshold_dbfs": self.threshold_dbfs,
+            "min_silence": self.min_silence / rate,
+            "keep_silence": self.keep_silence / rate,
+            "speech": speech,
+        }
+
+class PeaksBuilder:
+    """Min/max waveform peaks at several zoom levels, built chunk by chunk.
+
+    Only the finest level is accumulated while streaming (2 bytes per 32 ms,
+    under 3 MB for a 12-hour Space); the coarser levels are reduced from it
+    at the end.
+    """
+
+    def __init__(self, sample_rate):
+        self.np = load_numpy()
+        self.sample_rate = sample_rate
+        self.bucket = int(sample_rate * PEAKS_BASE_SECONDS)
+        self.carry = self.np.zeros(0, dtype=self.np.int16)
+        self.mins = []
+        self.maxs = []
+        self.total_samples = 0
+
+    def add_buckets(self, samples):
+        blocks = samples.reshape(-1, self.bucket)
+        # int16 -> int8 keeps the shape of the waveform at half the size
+        self.mins.append((blocks.min(axis=1) >> 8).astype(self.np.int8))
+        self.maxs.append((blocks.max(axis=1) >> 8).astype(self.np.int8))
+
+    def feed(self, samples):
+        np = self.np
+        self.total_samples += len(samples)
+        samples = np.concatenate((self.carry, samples))
+        whole = len(samples) - len(samples) % self.bucket
+        if whole:
+            self.add_buckets(samples[:whole])
+        self.carry = samples[whole:]
+
+    def finish(self):
+        """Return [(samples per bucket, int8 array of min/max pairs)], finest first"""
+        np = self.np
+        if len(self.carry):
+            padded = np.concatenate((self.carry, np.full(self.bucket - len(self.carry), self.carry[-1],
+                                                         dtype=np.int16)))
+            self.add_buckets(padded)
+            self.carry = padded[:0]
+        mins = np.concatenate(self.mins) if self.mins else np.zeros(0, dtype=np.int8)
+        maxs = np.concatenate(self.maxs) if self.maxs else np.zeros(0, dtype=np.int8)
+
+        levels = []
+        size = self.bucket
+        for _ in range(PEAKS_LEVELS):
+            levels.append((size, np.column_stack((mins, maxs)).ravel()))
+            if len(mins) <= 1:
+                break
+            starts = np.arange(0, len(mins), PEAKS_LEVEL_FACTOR)
+            mins = np.minimum.reduceat(mins, starts)
+            maxs = np.maximum.reduceat(maxs, starts)
+            size *= PEAKS_LEVEL_FACTOR
+        return levels
+
+    def write(self, path):
+        """Write the peaks file atomically"""
+        levels = self.finish()
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(PEAKS_HEADER.pack(PEAKS_MAGIC, PEAKS_VERSION, len(levels), self.sample_rate,
+                                      self.total_samples))
+            for size, pairs in levels:
+                f.write(PEAKS_LEVEL.pack(size, len(pairs) // 2))
+            for size, pairs in levels:
+                f.write(pairs.tobytes())
+        os.replace(tmp_path, path)
+
+def read_peaks(path, start=0.0, end=None, max_points=2000):
+    """Peaks between start and end seconds from a .peaks file, for plotting.
+
+    Picks the finest level that still fits in max_points buckets and reads
+    only that slice of the file. Returns {"time", "min", "max"} lists with
+    amplitudes in -1..1, plus the total "duration".
+    """
+    with open(path, 'rb') as f:
+        magic, version, level_count, sample_rate, total_samples = PEAKS_HEADER.unpack(
+            f.read(PEAKS_HEADER.size))
+        if magic != PEAKS_MAGIC or version != PEAKS_VERSION:
+            raise ValueError(f"{path} is not a peaks file")
+        levels = [PEAKS_LEVEL.unpack(f.read(PEAKS_LEVEL.size)) for _ in range(level_count)]
+
+        duration = total_samples / sample_rate
+        end = duration if end is None else min(end, duration)
+        offset = f.tell()
+        for level, (size, count) in enumerate(levels):
+            bucket_seconds = size / sample_rate
+            first = int(start / bucket_seconds)
+            last = min(count, int(end / bucket_seconds) + 1)
+            if last - first <= max_points or level == len(levels) - 1:
+                break
+            offset += count * 2
+
+        f.seek(offset + first * 2)
+        data = f.read(max(0, last - first) * 2)
+
+    pairs = struct.unpack(f"{len(data)}b", data)
+    return {
+        "time": [round((first + i) * bucket_seconds, 3) for i in range(len(pairs) // 2)],
+        "min": [value / 128 for value in pairs[0::2]],
+        "max": [value / 128 for value in pairs[1::2]],
+        "duration": duration,
+    }
+
+def extract_clip(media_path, start, seconds=CLIP_MAX_SECONDS):
+    """A short MP3 clip of media_path as bytes, or None if ffmpeg fails.
+
+    -ss before -i seeks in the input, so only the clip's part of the file is read.
+    """
+    command = [
+        registry.path("ffmpeg"), "-hide_banner", "-nostdin", "-v", "error",
+        "-ss", f"{max(0.0, start):.3f}", "-i", str(media_path),
+        "-t", f"{min(seconds, CLIP_MAX_SECONDS):.3f}",
+        "-vn", "-ac", "1", "-c:a", "libmp3lame", "-q:a", "5", "-f", "mp3", "pipe:1"
+    ]
+    try:
+        result = subprocess.run(command, capture_output=True, timeout=60)
+    except Exception:
+        return None
+    return result.stdout if result.returncode == 0 and result.stdout else None
+
+def build_analysis_command(source, sample_rate, outputs=()):
+    """ffmpeg decoding source to mono PCM on stdout.
+
+    outputs is a list of (target, args) written by the same process, so a
+    format conversion and the analysis share one decode of the source.
+    """
+    command = [registry.path("ffmpeg"), "-hide_banner", "-nostdin", "-y", "-i", str(source)]
+    for target, args in outputs:
+        command.extend(["-map", "0:a", *args, str(target)])
+    command.extend(["-map", "0:a", "-ac", "1", "-ar", str(sample_rate), "-f", "s16le", "pipe:1"])
+    return command
+
+def build_encode_command(target, sample_rate):
+    """ffmpeg encoding mono PCM from stdin into target"""
+    format_ext = target.suffix.lstrip(".")
+    return [
+        registry.path("ffmpeg"), "-hide_banner", "-nostdin", "-y",
+        "-f", "s16le", "-ar", str(sample_rate), "-ac", "1", "-i", "pipe:0",
+        *TRIM_ENCODE_ARGS.get(format_ext, TRIM_ENCODE_ARGS["m4a"]),
+        str(target)
+    ]
+
+async def start_process(command, stdin=asyncio.subprocess.DEVNULL):
+    return await asyncio.create_subprocess_exec(
+        *[str(arg) for arg in command],
+        stdin=stdin,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        **process_group_kwargs()
+    )
+
+async def analyze_audio(source, index_path=None, trim_path=None, outputs=(), peaks_path=None):
+    """Build the speech index and/or waveform peaks for source in a single streaming pass.
+
+    Also writes trim_path (source without long silences) and any conversion
+    outputs in that same pass. Returns the index dict (None without
+    index_path); raises RuntimeError if ffmpeg fails or numpy is missing.
+    """
+    np = load_numpy()
+    sample_rate = TRIM_SAMPLE_RATE if trim_path else ANALYSIS_SAMPLE_RATE
+    pending_writes = []
+    detector = None
+    if index_path or trim_path:
+        detector = SpeechDetector(sample_rate, sink=pending_writes if trim_path else None)
+    peaks = PeaksBuilder(sample_rate) if peaks_path else None
+    chunk_bytes = sample_rate * CHUNK_SECONDS * 2
+
+    processes = []
+    try:
+        decoder = await start_process(build_analysis_command(source, sample_rate, outputs))
+        processes.append(decoder)
+        encoder = None
+        if trim_path:
+            encoder = await start_process(build_encode_command(trim_path, sample_rate),
+                                          stdin=asyncio.subprocess.PIPE)
+            processes.append(encoder)
+        stderr_reads = [asyncio.ensure_future(p.stderr.read()) for p in processes]
+        drains = [asyncio.ensure_future(encoder.stdout.read())] if encoder else []
+
+        async def flush():
+            for data in pending_writes:
+                encoder.stdin.write(data)
+            pending_writes.clear()
+            await encoder.stdin.drain()
+
+        while True:
+            try:
+                data = await decoder.stdout.readexactly(chunk_bytes)
+            except asyncio.IncompleteReadError as e:
+                data = e.partial
+            # An odd trailing byte would not make a whole sample
+            samples = np.frombuffer(data[:len(data) - len(data) % 2], dtype="<i2")
+            if detector:
+                detector.feed(samples)
+            if peaks:
+                peaks.feed(samples)
+            if encoder:
+                await flush()
+            if len(data) < chunk_bytes:
+                break
+
+        index = detector.finish() if detector else None
+        if encoder:
+            await flush()
+            encoder.stdin.close()
+        stderrs = await asyncio.gather(*stderr_reads)
+        await asyncio.gather(*drains)
+        for process, stderr in zip(processes, stderrs):
+            if await process.wait() != 0:
+                raise RuntimeError(f"FFmpeg exited with code {process.returncode}: "
+                                   f"{stderr.decode(errors='replace').strip()[-300:]}")
+    except BaseException:
+        for process in processes:
+            if process.returncode is None:
+                kill_process_tree(process.pid, force=True)
+                await process.wait()
+        raise
+
+    if peaks:
+        peaks.write(peaks_path)
+    if index is not None and index_path:
+        index["source"] = source.name
+        if trim_path:
+            index["trimmed"] = trim_path.name
+        with open(index_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, separators=(",", ":"))
+    return index
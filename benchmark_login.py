@@ -0,0 +1,173 @@
+"""Compare the Playwright login with and without resource blocking, against a
+local mock of the X login page (no network, no account needed).
+
+    python benchmark_login.py --runs 3
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from lean_login import LeanLogin, describe_stats
+
+IMAGE_COUNT = 30
+IMAGE_BYTES = 150 * 1024
+FONT_BYTES = 1024 * 1024
+VIDEO_BYTES = 6 * 1024 * 1024
+
+# The flow the real login goes through: username, Next, password, Log in
+LOGIN_PAGE = """<!DOCTYPE html>
+<html><head>
+<link rel="stylesheet" href="/static/app.css">
+<script src="{third_party}/analytics.js"></script>
+</head><body>
+<video src="/static/intro.mp4" autoplay muted loop></video>
+<div id="images">{images}</div>
+<div id="flow">
+  <input name="text" autocomplete="username">
+  <button id="next">Next</button>
+</div>
+<script src="/static/app.js"></script>
+</body></html>"""
+
+APP_JS = """
+document.getElementById('next').onclick = () => setTimeout(() => {
+  document.getElementById('flow').innerHTML =
+    '<input name="password" type="password"><button id="login">Log in</button>';
+  document.getElementById('login').onclick = () => {
+    document.cookie = 'auth_token=mock; path=/';
+    location.href = '/home';
+  };
+}, 200);
+"""
+
+APP_CSS = """
+@font-face { font-family: Chirp; src: url(/static/chirp.woff2); }
+body { font-family: Chirp, sans-serif; }
+"""
+
+# A third party (different host) that keeps phoning home like real analytics
+ANALYTICS_JS = """
+setInterval(() => { new Image().src = '{third_party}/pixel.gif?t=' + Date.now(); }, 100);
+"""
+
+HOME_PAGE = """<!DOCTYPE html>
+<html><head><link rel="stylesheet" href="/static/app.css">
+<script src="{third_party}/analytics.js"></script></head>
+<body><div>{images}</div></body></html>"""
+
+class MockXHandler(BaseHTTPRequestHandler):
+    blobs = {}
+
+    def log_message(self, format, *args):
+        pass
+
+    def blob(self, name, size):
+        if name not in self.blobs:
+            self.blobs[name] = os.urandom(size)
+        return self.blobs[name]
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        third_party = f"http://localhost:{self.server.server_address[1]}"
+        images = "".join(f'<img src="/static/img{i}.jpg" width="40">' for i in range(IMAGE_COUNT))
+        routes = {
+            "/i/flow/login": ("text/html", LOGIN_PAGE.format(third_party=third_party, images=images)),
+            "/home": ("text/html", HOME_PAGE.format(third_party=third_party, images=images)),
+            "/static/app.js": ("application/javascript", APP_JS),
+            "/static/app.css": ("text/css", APP_CSS),
+            "/analytics.js": ("application/javascript", ANALYTICS_JS.replace("{third_party}", third_party)),
+        }
+        if path in routes:
+            content_type, body = routes[path]
+            body = body.encode("utf-8")
+        elif path.startswith("/static/img"):
+            content_type, body = "image/jpeg", self.blob(path, IMAGE_BYTES)
+        elif path == "/static/chirp.woff2":
+            content_type, body = "font/woff2", self.blob(path, FONT_BYTES)
+        elif path == "/static/intro.mp4":
+            content_type, body = "video/mp4", self.blob(path, VIDEO_BYTES)
+        elif path == "/pixel.gif":
+            content_type, body = "image/gif", b"GIF89a"
+        else:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+
+def start_mock_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockXHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+async def run_login(playwright, login_url, blocking):
+    """One mock login; returns LeanLogin's stats"""
+    login = LeanLogin(login_url=login_url, blocking=blocking)
+    browser, context, page = await login.open(playwright)
+    try:
+        await page.goto(login.login_url)
+        await page.fill("input[name='text']", "mock_user")
+        await page.click("button:has-text('Next')")
+        await page.wait_for_selector("input[name='password']", timeout=10000)
+        await page.fill("input[name='password']", "mock_password")
+        await page.click("button:has-text('Log in')")
+        await page.wait_for_url("**/home", timeout=10000)
+        await page.wait_for_load_state("load")
+        cookies = await context.cookies()
+        if not any(cookie["name"] == "auth_token" for cookie in cookies):
+            raise RuntimeError("mock login did not set auth_token")
+        return await login.measure()
+    finally:
+        await browser.close()
+
+async def benchmark(runs):
+    from playwright.async_api import async_playwright
+
+    server = start_mock_server()
+    login_url = f"http://127.0.0.1:{server.server_address[1]}/i/flow/login"
+    results = {}
+    async with async_playwright() as p:
+        for blocking in (False, True):
+            label = "lean" if blocking else "full"
+            results[label] = []
+            for run in range(runs):
+                stats = await run_login(p, login_url, blocking)
+                results[label].append(stats)
+                print(f"   {label} #{run + 1}: {describe_stats(stats)}")
+    server.shutdown()
+    return results
+
+def median(values):
+    values = [value for value in values if value is not None]
+    return statistics.median(values) if values else None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3, help="logins per mode (default: 3)")
+    args = parser.parse_args()
+
+    print("🧪 Mock X login: full page load vs. lean (blocked resources)")
+    results = asyncio.run(benchmark(args.runs))
+
+    print("\n📊 Medians")
+    print(f"{'':6} {'seconds':>8} {'requests':>9} {'MB in':>7} {'JS heap MB':>11} {'browser MB':>11}")
+    for label, runs in results.items():
+        seconds = median([stats["seconds"] for stats in runs])
+        requests = median([stats["requests"] - stats["blocked"] for stats in runs])
+        received = median([stats["bytes_received"] for stats in runs])
+        heap = median([stats["js_heap_bytes"] for stats in runs])
+        memory = median([stats["browser_bytes"] for stats in runs])
+        mb = lambda value: f"{value / (1024 * 1024):.1f}" if value is not None else "n/a"
+        print(f"{label:6} {seconds:8.2f} {requests:9.0f} {mb(received):>7} {mb(heap):>11} {mb(memory):>11}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""Compare fixed and adaptive segment concurrency against a local HLS stand-in
+with limited bandwidth, a throttling threshold and injected errors.
+
+    python benchmark_segments.py --bandwidth 8 --per-connection 1 --throttle-at 24 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from hls_download import SegmentDownloader
+
+CHUNK_BYTES = 16 * 1024
+
+class MockCDN:
+    """Bandwidth shared by all requests, a per-connection cap, a first-byte
+    delay, 429s above a number of concurrent requests and random 503s"""
+
+    def __init__(self, segments, segment_bytes, bandwidth, per_connection, latency, throttle_at, error_rate):
+        self.segments = segments
+        self.segment_bytes = segment_bytes
+        self.bandwidth = bandwidth
+        self.per_connection = per_connection
+        self.latency = latency
+        self.throttle_at = throttle_at
+        self.error_rate = error_rate
+        self.body = os.urandom(segment_bytes)
+        self.lock = threading.Lock()
+        self.next_free = 0.0
+        self.active = 0
+        self.errors = {429: 0, 503: 0}
+
+    def playlist(self):
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-TARGETDURATION:3", "#EXT-X-MEDIA-SEQUENCE:0"]
+        for index in range(self.segments):
+            lines += ["#EXTINF:3.000,", f"/seg/{index}.aac"]
+        lines.append("#EXT-X-ENDLIST")
+        return "\n".join(lines) + "\n"
+
+    def reserve(self, size):
+        """When the shared link has sent size more bytes"""
+        with self.lock:
+            start = max(time.monotonic(), self.next_free)
+            self.next_free = start + size / self.bandwidth
+            return self.next_free
+
+    def refuse(self):
+        """The status to fail a new request with, or None"""
+        with self.lock:
+            if self.throttle_at and self.active >= self.throttle_at:
+                status = 429
+            elif random.random() < self.error_rate:
+                status = 503
+            else:
+                self.active += 1
+                return None
+            self.errors[status] += 1
+            return status
+
+    def finish(self):
+        with self.lock:
+            self.active -= 1
+
+def make_handler(cdn):
+    class MockCDNHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_body(self, status, body, content_type, headers=()):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_HEAD(self):
+            self.send_response(200)
+            self.send_header("Content-Length", str(cdn.segment_bytes))
+            self.end_headers()
+
+        def do_GET(self):
+            if self.path == "/playlist.m3u8":
+                self.send_body(200, cdn.playlist().encode(), "application/vnd.apple.mpegurl")
+                return
+            status = cdn.refuse()
+            if status:
+                self.send_body(status, b"", "text/plain", [("Retry-After", "1")] if status == 429 else [])
+                return
+            try:
+                time.sleep(cdn.latency)
+                self.send_response(200)
+                self.send_header("Content-Type", "audio/aac")
+                self.send_header("Content-Length", str(cdn.segment_bytes))
+                self.end_headers()
+                paced = time.monotonic()
+                for offset in range(0, cdn.segment_bytes, CHUNK_BYTES):
+                    chunk = cdn.body[offset:offset + CHUNK_BYTES]
+                    paced += len(chunk) / cdn.per_connection
+                    delay = max(paced, cdn.reserve(len(chunk))) - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    self.wfile.write(chunk)
+            finally:
+                cdn.finish()
+
+    return MockCDNHandler
+
+def start_mock_cdn(cdn):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(cdn))
+    server.daemon_threads = True
+    server.request_queue_size = 128
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def run_download(playlist_url, workers):
+    """One full download; returns (seconds, segments missing, limiter)"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        downloader = SegmentDownloader(playlist_url, work_dir, workers=workers)
+        started = time.perf_counter()
+        problems = asyncio.run(downloader.download(max_repairs=1))
+        return time.perf_counter() - started, len(problems), downloader.limiter
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--segments", type=int, default=400)
+    parser.add_argument("--segment-kb", type=int, default=64)
+    parser.add_argument("--bandwidth", type=float, default=8, help="MB/s shared by all requests (default: 8)")
+    parser.add_argument("--per-connection", type=float, default=1, help="MB/s per request (default: 1)")
+    parser.add_argument("--latency", type=float, default=0.03, help="seconds to first byte (default: 0.03)")
+    parser.add_argument("--throttle-at", type=int, default=24, help="429 above this many requests (0: never)")
+    parser.add_argument("--error-rate", type=float, default=0.01, help="share of requests failing with 503")
+    parser.add_argument("--fixed", type=int, nargs="*", default=[2, 4, 8, 16, 32],
+                        help="fixed concurrencies to compare (default: 2 4 8 16 32)")
+    args = parser.parse_args()
+
+    mb = 1024 * 1024
+    cdn = MockCDN(args.segments, args.segment_kb * 1024, args.bandwidth * mb, args.per_connection * mb,
+                  args.latency, args.throttle_at, args.error_rate)
+    server = start_mock_cdn(cdn)
+    playlist_url = f"http://127.0.0.1:{server.server_address[1]}/playlist.m3u8"
+
+    request_seconds = args.latency + args.segment_kb / 1024 / args.per_connection
+    knee = args.bandwidth * mb * request_seconds / (args.segment_kb * 1024)
+    print(f"🧪 Mock CDN: {args.bandwidth:g} MB/s shared, {args.per_connection:g} MB/s per request, "
+          f"429 above {args.throttle_at or 'never'}, {args.error_rate:.0%} 503s")
+    print(f"   Link saturates at about {knee:.1f} requests in flight\n")
+    print(f"{'':10} {'seconds':>8} {'MB/s':>6} {'429s':>5} {'503s':>5} {'missing':>8}  limit")
+    for workers in list(args.fixed) + [None]:
+        cdn.errors = {429: 0, 503: 0}
+        seconds, missing, limiter = run_download(playlist_url, workers)
+        throughput = args.segments * args.segment_kb / 1024 / seconds
+        label = f"fixed {workers}" if workers else "adaptive"
+        limit = limiter.describe() if limiter.adaptive else ""
+        print(f"{label:10} {seconds:8.2f} {throughput:6.2f} {cdn.errors[429]:5} {cdn.errors[503]:5} {missing:8}  {limit}")
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,34 @@ import shutil
 import subprocess
 import urllib.request
 import zipfile
+import time
+
+# Helper modules imported by clean_final_downloader.py
+APP_MODULES = [
+    "adaptive_concurrency.py",
+    "audio_analysis.py",
+    "clean_final_downloader.py",
+    "credential_pool.py",
+    "credentials.py",
+    "disk_preflight.py",
+    "download_engine.py",
+    "embedded_ytdlp.py",
+    "hls_download.py",
+    "hls_playlist.py",
+    "http_pool.py",
+    "job_queue.py",
+    "job_scheduler.py",
+    "lean_login.py",
+    "object_upload.py",
+    "retention.py",
+    "space_url.py",
+    "space_metadata.py",
+    "spaces_api.py",
+    "tool_registry.py",
+]
+
+# Maximum launch-to-prompt time for the built exe
+STARTUP_BUDGET_MS = 3000
 
 def download_file(url, filename):
     """Download a file from URL"""
@@ -11,6 +39,16 @@ def download_file(url, filename):
     urllib.request.urlretrieve(url, filename)
     print(f"✅ Downloaded {filename}")
 
+def measure_startup(exe_path, runs=3):
+    """Launch the exe in probe mode and return the best launch-to-prompt time in ms"""
+    env = dict(os.environ, TSD_STARTUP_PROBE="1")
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([exe_path], env=env, check=True, capture_output=True, timeout=60)
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings)
+
 def main():
     print("=" * 70)
     print("🔨 BUILDING STANDALONE TWITTER SPACES DOWNLOADER")
@@ -40,17 +78,18 @@ def main():
     with zipfile.ZipFile(ffmpeg_zip, 'r') as zip_ref:
         zip_ref.extractall(build_dir)
     
-    # Find ffmpeg.exe in extracted folders
-    ffmpeg_exe = None
-    for root, dirs, files in os.walk(build_dir):
-        if "ffmpeg.exe" in files:
-            ffmpeg_exe = os.path.join(root, "ffmpeg.exe")
-            break
-    
-    if ffmpeg_exe:
-        # Move ffmpeg.exe to build_dir root
-        shutil.move(ffmpeg_exe, os.path.join(build_dir, "ffmpeg.exe"))
-        print("✅ FFmpeg ready")
+    # Find ffmpeg.exe (and ffprobe.exe, used to verify outputs) in extracted folders
+    for exe_name in ["ffmpeg.exe", "ffprobe.exe"]:
+        exe_path = None
+        for root, dirs, files in os.walk(build_dir):
+            if exe_name in files and root != build_dir:
+                exe_path = os.path.join(root, exe_name)
+                break
+        
+        if exe_path:
+            # Move it to build_dir root
+            shutil.move(exe_path, os.path.join(build_dir, exe_name))
+    print("✅ FFmpeg ready")
     
     # Clean up FFmpeg zip and folders
     os.remove(ffmpeg_zip)
@@ -59,8 +98,9 @@ def main():
         if os.path.isdir(item_path) and "ffmpeg" in item.lower():
             shutil.rmtree(item_path)
     
-    # Step 3: Copy the main script
-    shutil.copy("clean_final_downloader.py", build_dir)
+    # Step 3: Copy the main script and its helper modules
+    for module in APP_MODULES:
+        shutil.copy(module, build_dir)
     
     # Step 4: Create the spec file
     spec_content = '''# -*- mode: python ; coding: utf-8 -*-
@@ -70,7 +110,8 @@ a = Analysis(
     pathex=[],
     binaries=[
         ('yt-dlp.exe', '.'),
-        ('ffmpeg.exe', '.')
+        ('ffmpeg.exe', '.'),
+        ('ffprobe.exe', '.')
     ],
     datas=[],
     hiddenimports=[
@@ -136,6 +177,15 @@ exe = EXE(
         shutil.copy("dist/TwitterSpacesDownloader.exe", final_exe)
         print(f"📂 Copied to: {os.path.abspath(final_exe)}")
         
+        # Step 6: Check launch-to-prompt time against the budget
+        print("\n⏱️  Measuring startup time...")
+        startup_ms = measure_startup(os.path.abspath("dist/TwitterSpacesDownloader.exe"))
+        if startup_ms > STARTUP_BUDGET_MS:
+            print(f"❌ Startup took {startup_ms:.0f} ms (budget {STARTUP_BUDGET_MS} ms)")
+            os.chdir("..")
+            sys.exit(1)
+        print(f"✅ Startup: {startup_ms:.0f} ms (budget {STARTUP_BUDGET_MS} ms)")
+        
     except subprocess.CalledProcessError as e:
         print(f"❌ Build failed: {e}")
     
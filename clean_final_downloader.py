@@ -1,60 +1,32 @@
+import time
+LAUNCH_TIME = time.perf_counter()
+
 import datetime
-import subprocess
 import os
-import re
 import sys
-import shutil
 import json
-import webbrowser
-import time
-from pathlib import Path
 
-def get_bundled_path(filename):
-    """Get path to bundled file in PyInstaller exe"""
-    if getattr(sys, 'frozen', False):
-        # Running as compiled exe
-        return os.path.join(sys._MEIPASS, filename)
-    else:
-        # Running as script - look in current directory
-        return filename
+# Only what the menu needs to reach its first prompt; the rest (the download
+# engine, asyncio, HTTP, uploads) is imported by the functions that use it
+from tool_registry import ToolError, get_app_dir, registry
+
+# Launch-to-prompt budget checked by build_standalone.py
+STARTUP_PROBE_ENV = "TSD_STARTUP_PROBE"
+
+# Everything a download leaves in the Downloads folder, incl. --native segment folders
+DOWNLOAD_PATTERNS = ["space_*", ".space_*.segments"]
 
 def get_ffmpeg_path():
-    """Get path to FFmpeg - bundled or system"""
-    # First check for bundled ffmpeg
-    bundled_ffmpeg = get_bundled_path("ffmpeg.exe")
-    if os.path.exists(bundled_ffmpeg):
-        return bundled_ffmpeg
-    
-    # Then check system
-    system_ffmpeg = shutil.which("ffmpeg")
-    if system_ffmpeg:
-        return system_ffmpeg
-    
-    # If not found, return the filename and hope for the best
-    return "ffmpeg"
+    """Get path to FFmpeg - bundled or system (discovered once per session)"""
+    return registry.path("ffmpeg")
 
 def get_ytdlp_path():
-    """Get path to yt-dlp - bundled or system"""
-    # First check for bundled yt-dlp
-    bundled_ytdlp = get_bundled_path("yt-dlp.exe")
-    if os.path.exists(bundled_ytdlp):
-        return bundled_ytdlp
-    
-    # Then check system
-    system_ytdlp = shutil.which("yt-dlp")
-    if system_ytdlp:
-        return system_ytdlp
-    
-    # If not found, return the filename
-    return "yt-dlp"
+    """Get path to yt-dlp - bundled or system (discovered once per session)"""
+    return registry.path("yt-dlp")
 
 class TwitterSpacesDownloader:
     def __init__(self):
-        if getattr(sys, 'frozen', False):
-            self.app_dir = Path.home() / "TwitterSpacesDownloader"
-        else:
-            self.app_dir = Path(__file__).parent
-        
+        self.app_dir = get_app_dir()
         self.app_dir.mkdir(exist_ok=True)
         self.downloads_dir = self.app_dir / "Downloads"
         self.cookies_file = self.app_dir / "cookies.txt"
@@ -63,6 +35,7 @@ class TwitterSpacesDownloader:
         
         self.downloads_dir.mkdir(exist_ok=True)
         self.settings = self.load_settings()
+        self.dependencies_checked = False
         
     def load_settings(self):
         """Load user settings"""
@@ -71,7 +44,10 @@ class TwitterSpacesDownloader:
             "username": "",
             "save_username": False,
             "preferred_format": "m4a",
-            "preferred_format_name": "🎶 M4A (Audio Only)"
+            "preferred_format_name": "🎶 M4A (Audio Only)",
+            "keep_partial_downloads": False,
+            "downloads_max_age_days": None,
+            "downloads_max_gb": None
         }
         
         try:
@@ -94,7 +70,8 @@ class TwitterSpacesDownloader:
     
     def print_header(self):
         """Print a nice header for the application"""
-        os.system('cls' if os.name == 'nt' else 'clear')
+        if sys.stdout.isatty():
+            os.system('cls' if os.name == 'nt' else 'clear')
         print("=" * 70)
         print("🎙️         TWITTER SPACES DOWNLOADER         🎙️")
         print("=" * 70)
@@ -106,16 +83,16 @@ class TwitterSpacesDownloader:
         print("🔍 Checking dependencies...")
         
         # Check yt-dlp
-        ytdlp_path = get_ytdlp_path()
-        if os.path.exists(ytdlp_path):
-            print("✅ yt-dlp found")
+        ytdlp = registry.get("yt-dlp")
+        if ytdlp:
+            print(f"✅ yt-dlp found ({ytdlp.get('version') or 'unknown version'})")
         else:
             print("❌ yt-dlp not found - downloads may fail")
             return False
         
         # Check FFmpeg
-        ffmpeg_path = get_ffmpeg_path()
-        if os.path.exists(ffmpeg_path):
+        ffmpeg = registry.get("ffmpeg")
+        if ffmpeg:
             print("✅ FFmpeg found")
         else:
             print("⚠️  FFmpeg not found - audio conversion may fail")
@@ -123,6 +100,29 @@ class TwitterSpacesDownloader:
         print("✅ Dependencies check complete!")
         return True
     
+    def ensure_dependencies(self):
+        """Run the dependency check once, on first use rather than at startup"""
+        if self.dependencies_checked:
+            return True
+        self.dependencies_checked = True
+        if not self.check_dependencies():
+            print("\\n⚠️  Some dependencies are missing.")
+            print("💡 This standalone version should include all dependencies.")
+            return False
+        return True
+    
+    def report_startup_time(self):
+        """Print launch-to-prompt time and exit when probed by the build script"""
+        if not os.environ.get(STARTUP_PROBE_ENV):
+            return
+        elapsed_ms = (time.perf_counter() - LAUNCH_TIME) * 1000
+        print(f"startup_ms={elapsed_ms:.0f}")
+        sys.exit(0)
+    
+    def start_retention(self):
+        """Clean up old downloads in the background if settings.json sets a limit"""
+        return start_download_retention(self.downloads_dir, self.settings)
+    
     def validate_cookies(self):
         """Check if cookies file exists and contains auth_token"""
         try:
@@ -164,6 +164,7 @@ class TwitterSpacesDownloader:
         
         print("\\n🌐 Opening Twitter in your browser...")
         try:
+            import webbrowser
             webbrowser.open("https://x.com")
             print("✅ Browser opened with Twitter")
         except:
@@ -228,32 +229,13 @@ class TwitterSpacesDownloader:
     
     def validate_space_url(self, url):
         """Validate Twitter Space URL format - supports multiple formats"""
-        # Clean the URL first
-        url = url.strip()
-        
-        # Remove any query parameters or fragments for validation
-        url_clean = url.split('?')[0].split('#')[0]
-        
-        patterns = [
-            r'https://x\.com/i/spaces/[a-zA-Z0-9_-]+',
-            r'https://twitter\.com/i/spaces/[a-zA-Z0-9_-]+',
-            r'https://x\.com/i/broadcasts/[a-zA-Z0-9_-]+',
-            r'https://twitter\.com/i/broadcasts/[a-zA-Z0-9_-]+',
-            r'https://x\.com/[^/]+/status/[0-9]+',
-            r'https://twitter\.com/[^/]+/status/[0-9]+'
-        ]
-        
-        # Use search instead of match to be more flexible
-        for pattern in patterns:
-            if re.search(pattern, url_clean):
-                return True
-        
-        return False
+        from spaces_api import validate_space_url
+        return validate_space_url(url)
     
     def normalize_space_url(self, url):
         """Normalize different URL formats to work with yt-dlp"""
-        url = url.replace("twitter.com", "x.com")
-        return url
+        from spaces_api import normalize_space_url
+        return normalize_space_url(url)
     
     def get_format_choice(self):
         """Let user choose download format with smart defaults"""
@@ -301,61 +283,32 @@ class TwitterSpacesDownloader:
     
     def download_twitter_space(self, url, format_ext="m4a"):
         """Download Twitter Space using yt-dlp with format selection and CC support"""
+        import asyncio
+        from disk_preflight import InsufficientSpace
+        from download_engine import engine
+        from spaces_api import MEDIA_SUFFIXES, describe_error, write_error_log
+        
         if not self.validate_space_url(url):
             print("❌ Invalid Twitter Space/Broadcast URL format")
             return False
 
+        self.ensure_dependencies()
         normalized_url = self.normalize_space_url(url)
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
         
         # Determine output format and settings
-        if format_ext == "mp4":
-            # For MP4, we want video if available, but will accept audio-only in MP4 container
-            output_format = str(self.downloads_dir / f"space_{timestamp}_%(uploader)s_%(upload_date)s_%(id)s.mp4")
-            # Try to get video first, fall back to audio wrapped in MP4
-            format_selector = "best[ext=mp4]/bestvideo+bestaudio/best"
-        else:
-            output_format = str(self.downloads_dir / f"space_{timestamp}_%(uploader)s_%(upload_date)s_%(id)s.{format_ext}")
-            format_selector = "bestaudio/best"
-
-        ytdlp_path = get_ytdlp_path()
-        ffmpeg_path = get_ffmpeg_path()
+        job = engine.create_job(normalized_url, format_ext, self.downloads_dir, self.cookies_file,
+                                prefix=f"space_{timestamp}",
+                                keep_partial=self.settings.get("keep_partial_downloads", False))
+        command = job.command
 
-        command = [
-            ytdlp_path,
-            "--cookies", str(self.cookies_file),
-            "--no-clean-info-json",
-            "--write-comments",
-            "--write-subs",          # Download subtitles
-            "--write-auto-subs",     # Download auto-generated subtitles
-            "--sub-langs", "all",    # Download all available subtitle languages
-            "--convert-subs", "srt", # Convert to SRT format
-            "--ffmpeg-location", ffmpeg_path,
-            "--no-warnings"
-        ]
-        
-        if format_ext == "mp4":
-            # For MP4, we want to keep video if available, or remux audio to MP4 container
-            command.extend([
-                "--remux-video", "mp4",  # Ensure MP4 container even for audio-only
-                "--embed-subs",          # Embed subtitles in video
-                "--merge-output-format", "mp4"  # Force MP4 output
-            ])
-        else:
-            # For audio formats, extract audio
-            command.extend(["--extract-audio"])
-            if format_ext == "mp3":
-                command.extend(["--audio-format", "mp3"])
-            elif format_ext == "m4a":
-                command.extend(["--audio-format", "m4a"])
-            elif format_ext == "opus":
-                command.extend(["--audio-format", "opus"])
-        
-        command.extend([
-            "-f", format_selector,
-            normalized_url,
-            "-o", output_format
-        ])
+        # Fail now rather than hours into the job if a tool can't handle this command
+        try:
+            registry.preflight(command, format_ext, ytdlp=not engine.in_process)
+        except ToolError as e:
+            print(f"❌ {e}")
+            print("💡 Update yt-dlp/FFmpeg or choose a different format.")
+            return False
 
         print(f"\\n⬇️  Starting download...")
         print(f"🎯 URL: {normalized_url}")
@@ -369,19 +322,11 @@ class TwitterSpacesDownloader:
         print("\\n🔄 Download in progress...")
 
         try:
-            process = subprocess.Popen(
-                command, 
-                stdout=subprocess.PIPE, 
-                stderr=subprocess.PIPE, 
-                text=True,
-                bufsize=1,
-                universal_newlines=True
-            )
+            asyncio.run(self.run_download(job, normalized_url, format_ext))
+            stdout, stderr = job.stdout, job.stderr
+            print()
             
-            stdout, stderr = process.communicate()
-            result_code = process.returncode
-            
-            if result_code == 0:
+            if job.success:
                 print("\\n✅ Download completed successfully!")
                 
                 # Look for downloaded files
@@ -389,7 +334,7 @@ class TwitterSpacesDownloader:
                 if downloaded_files:
                     main_file = None
                     for f in downloaded_files:
-                        if f.suffix.lower() in ['.mp4', '.m4a', '.mp3', '.opus']:
+                        if f.suffix.lower() in MEDIA_SUFFIXES:
                             main_file = f
                             break
                     
@@ -413,43 +358,53 @@ class TwitterSpacesDownloader:
             else:
                 print("\\n❌ Download failed!")
                 
-                error_output = stderr.lower()
-                if "ffmpeg" in error_output:
-                    print("💡 FFmpeg issue detected. FFmpeg may not be properly bundled.")
-                elif "auth" in error_output or "forbidden" in error_output:
-                    print("💡 Authentication issue - your cookies may have expired.")
+                print(f"💡 {describe_error(stderr, format_ext)}")
+                if "auth" in stderr.lower() or "forbidden" in stderr.lower():
                     print("💡 Try refreshing authentication (option in main menu).")
-                elif "not found" in error_output or "unavailable" in error_output:
-                    print("💡 Space not found or no longer available.")
-                elif "private" in error_output:
-                    print("💡 This appears to be a private Space.")
-                elif "format" in error_output:
-                    print(f"💡 The requested {format_ext.upper()} format may not be available.")
-                    print("💡 Try a different format option.")
-                else:
-                    print("💡 Check the error log for details.")
                 
-                with open(self.error_log, "w", encoding='utf-8') as log_file:
-                    log_file.write(f"Error Log - {datetime.datetime.now()}\\n")
-                    log_file.write("=" * 50 + "\\n")
-                    log_file.write(f"URL: {url}\\n")
-                    log_file.write(f"Format: {format_ext}\\n")
-                    log_file.write(f"Command: {' '.join(command)}\\n\\n")
-                    log_file.write("STDOUT:\\n")
-                    log_file.write(stdout + "\\n\\n")
-                    log_file.write("STDERR:\\n")
-                    log_file.write(stderr)
+                write_error_log(self.error_log, url, format_ext, command, stdout, stderr)
                 
                 return False
                 
+        except InsufficientSpace as e:
+            print(f"\\n❌ {e}")
+            print("💡 Free up disk space and try again.")
+            return False
         except KeyboardInterrupt:
+            # The engine has already stopped yt-dlp/FFmpeg and tidied the partial files
             print("\\n❌ Download cancelled by user (Ctrl+C)")
-            print("💡 The partial download may be saved to your downloads folder")
+            if job.keep_partial:
+                print("💡 Partial files were kept in your downloads folder")
+            else:
+                print(f"🧹 Removed {len(job.removed_files)} partial file(s)")
             return False
         except Exception as e:
             print(f"❌ Unexpected error: {e}")
             return False
     
+    async def run_download(self, job, url, format_ext):
+        """Reserve the estimated disk space, then run the download job"""
+        from disk_preflight import estimate_job_bytes, estimate_source_bytes, format_bytes, reservations
+        from download_engine import engine
+        
+        source_bytes = await estimate_source_bytes(url, self.cookies_file)
+        needed = estimate_job_bytes(source_bytes, [format_ext])
+        if source_bytes:
+            print(f"📏 Estimated size: {format_bytes(source_bytes)}")
+        async with reservations.hold(self.downloads_dir, needed, wait=False):
+            await engine.run_job(job, on_progress=self.print_progress)
+    
+    def print_progress(self, job, progress):
+        """Show a single updating progress line for the running download"""
+        parts = []
+        if progress.get("downloaded_bytes"):
+            parts.append(f"{progress['downloaded_bytes'] / (1024 * 1024):.1f} MB")
+        if progress.get("speed"):
+            parts.append(f"{progress['speed'] / (1024 * 1024):.2f} MB/s")
+        if progress.get("fragment_index") and progress.get("fragment_count"):
+            parts.append(f"segment {progress['fragment_index']:.0f}/{progress['fragment_count']:.0f}")
+        print("\r⬇️  " + "  |  ".join(parts) + " " * 10, end="", flush=True)
+    
     def get_space_url(self):
         """Get and validate Space URL with helpful hints"""
         print("\\n" + "=" * 70)
@@ -491,10 +446,9 @@ class TwitterSpacesDownloader:
             print("🚀 Starting Twitter Spaces Downloader...")
             print("✨ Standalone version - no Python required!")
             
-            if not self.check_dependencies():
-                print("\\n⚠️  Some dependencies are missing.")
-                print("💡 This standalone version should include all dependencies.")
-                input("Press Enter to continue anyway, or Ctrl+C to exit...")
+            # Dependencies are checked on the first download, not here
+            self.report_startup_time()
+            self.start_retention()
             
             while True:
                 if not self.validate_cookies():
@@ -585,7 +539,238 @@ class TwitterSpacesDownloader:
             if getattr(sys, 'frozen', False):
                 input("Press Enter to exit...")
 
+def start_download_retention(downloads_dir, settings):
+    """Start evicting downloads older than downloads_max_age_days, or oldest first
+    while the folder is over downloads_max_gb. Off unless one of them is set."""
+    max_age_days = settings.get("downloads_max_age_days")
+    max_gb = settings.get("downloads_max_gb")
+    if not max_age_days and not max_gb:
+        return None
+    from retention import get_manager
+    return get_manager(downloads_dir, DOWNLOAD_PATTERNS,
+                       max_age=max_age_days * 86400 if max_age_days else None,
+                       max_bytes=int(max_gb * 1024 ** 3) if max_gb else None).start()
+
+def parse_args(argv=None):
+    """Command line options - with no URLs the interactive menu is used"""
+    import argparse
+    from download_engine import YTDLP_MODES, engine
+    from spaces_api import SUPPORTED_FORMATS
+    
+    parser = argparse.ArgumentParser(
+        prog="TwitterSpacesDownloader",
+        description="Download Twitter/X Spaces. Pass one or more URLs to run without prompts."
+    )
+    parser.add_argument("urls", nargs="*", metavar="URL", help="Space, broadcast or status URL")
+    parser.add_argument("-f", "--format", dest="formats", action="append", choices=SUPPORTED_FORMATS,
+                        help="output format, may be repeated (default: m4a)")
+    parser.add_argument("-o", "--out-dir", help="folder to save downloads to")
+    parser.add_argument("--cookies", help="Netscape cookies.txt with an x.com auth_token")
+    parser.add_argument("--accounts",
+                        help="folder of extra cookies .txt files, one per account; jobs are spread "
+                             "across them and throttled accounts rest (default: accounts/ next to cookies.txt)")
+    parser.add_argument("-a", "--batch-file",
+                        help="file with one URL per line, optionally followed by a priority ('-' for stdin)")
+    parser.add_argument("--priority", type=int, default=0,
+                        help="priority of these URLs; higher goes first, equal ones shortest Space first "
+                             "(default: 0)")
+    parser.add_argument("--keep-partial", action="store_true",
+                        help="keep .part files of cancelled/failed downloads so they can resume")
+    parser.add_argument("--native", action="store_true",
+                        help="fetch and verify HLS segments directly; reruns repair only bad segments")
+    parser.add_argument("--speech-index", action="store_true",
+                        help="write <file>.speech.json listing where people are talking (needs numpy)")
+    parser.add_argument("--trim-silence", action="store_true",
+                        help="also write <file>.trimmed.<ext> without long silences (needs numpy)")
+    parser.add_argument("--upload", metavar="s3://BUCKET/PREFIX",
+                        help="upload finished files to S3-compatible storage while the next Space downloads "
+                             "(needs boto3)")
+    parser.add_argument("--upload-endpoint", metavar="URL",
+                        help="S3-compatible endpoint, e.g. http://localhost:9000 for MinIO "
+                             "(default: $TSD_S3_ENDPOINT_URL, or AWS)")
+    parser.add_argument("--yt-dlp-mode", choices=YTDLP_MODES, default=engine.ytdlp_mode,
+                        help="run yt-dlp in this process (faster per job) or as a subprocess; "
+                             "auto uses the yt_dlp module when installed (default: %(default)s)")
+    parser.add_argument("--queue", nargs="?", const=True, metavar="PATH",
+                        help="keep jobs in a database that survives crashes and restarts; unfinished jobs "
+                             "from earlier runs are picked up and resumed (default: jobs.db next to cookies.txt)")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="how many Spaces to download at once (default: 1)")
+    parser.add_argument("--json", action="store_true", help="print one JSON result per URL")
+    return parser.parse_args(argv)
+
+def read_batch_file(batch_file):
+    """(URL, priority or None) pairs from a batch file, skipping blank lines and # comments"""
+    handle = sys.stdin if batch_file == "-" else open(batch_file, 'r', encoding='utf-8')
+    entries = []
+    with handle:
+        for line in handle:
+            fields = line.split()
+            if not fields or fields[0].startswith("#"):
+                continue
+            priority = int(fields[1]) if len(fields) > 1 and fields[1].lstrip("-").isdigit() else None
+            entries.append((fields[0], priority))
+    return entries
+
+def print_result(result, as_json=False):
+    """Report one finished download on stdout/stderr"""
+    if as_json:
+        print(json.dumps({
+            "url": result.url,
+            "success": result.success,
+            "files": [str(f) for f in result.files],
+            "subtitles": [str(f) for f in result.subtitles],
+            "error": result.error,
+            "hint": result.hint,
+            "warnings": result.warnings,
+            "speech_index": str(result.speech_index) if result.speech_index else None,
+            "trimmed": str(result.trimmed) if result.trimmed else None,
+        }), flush=True)
+    elif result.success:
+        for f in result.files:
+            print(f"✅ {result.url} -> {f}")
+        if result.speech_index:
+            print(f"🗣️  {result.url} -> {result.speech_index}")
+        if result.trimmed:
+            print(f"✂️  {result.url} -> {result.trimmed}")
+        for warning in result.warnings:
+            print(f"⚠️  {warning}", file=sys.stderr)
+    else:
+        print(f"❌ {result.url}: {result.error}", file=sys.stderr)
+        if result.hint:
+            print(f"💡 {result.hint}", file=sys.stderr)
+
+def print_upload(path, record, error, as_json=False):
+    """Report one finished upload"""
+    if as_json:
+        print(json.dumps({"upload": str(path), "object": record["url"] if record else None,
+                          "error": error}), flush=True)
+    elif error:
+        print(f"❌ Upload of {path.name} failed: {error}", file=sys.stderr)
+    else:
+        print(f"☁️  {path.name} -> {record['url']}")
+
+def print_http_stats(as_json=False):
+    """Connection reuse of the shared HTTP pool (--native downloads)"""
+    from http_pool import stats as http_stats
+    
+    stats = http_stats()
+    if not stats["requests"]:
+        return
+    if as_json:
+        print(json.dumps({"http": stats}), file=sys.stderr, flush=True)
+    else:
+        print(f"🔌 HTTP: {stats['requests']} requests over {stats['connections']} connections "
+              f"({stats['reuse_ratio']:.0%} reused, {stats['backend']})", file=sys.stderr)
+
+def print_latency_stats(stats, as_json=False):
+    """Mean and tail latency per scheduler lane"""
+    if as_json:
+        print(json.dumps({"latency": stats}), file=sys.stderr, flush=True)
+        return
+    for lane, summary in stats.items():
+        if summary["jobs"]:
+            print(f"⏱️  {lane}: {summary['jobs']} job(s), mean {summary['mean']:.1f}s, "
+                  f"p95 {summary['p95']:.1f}s, max {summary['max']:.1f}s", file=sys.stderr)
+
+def result_files(result):
+    """Every file a download produced, sidecars included"""
+    extras = [result.speech_index, result.trimmed]
+    return list(result.files) + list(result.subtitles) + [path for path in extras if path]
+
+def run_headless(args):
+    """Download every URL given on the command line; returns the exit code"""
+    import asyncio
+    from credential_pool import CredentialPool
+    from credentials import get_credential_manager
+    from download_engine import engine
+    from job_queue import QUEUE_NAME, JobQueue
+    from job_scheduler import JobScheduler
+    from object_upload import S3_ENDPOINT_URL, ObjectUploader, UploadQueue, load_boto3
+    
+    engine.ytdlp_mode = args.yt_dlp_mode
+    urls = list(args.urls)
+    priorities = {}
+    if args.batch_file:
+        for url, priority in read_batch_file(args.batch_file):
+            urls.append(url)
+            if priority is not None:
+                priorities[url] = priority
+    
+    uploads = None
+    if args.upload:
+        try:
+            load_boto3()
+            uploader = ObjectUploader(args.upload, endpoint_url=args.upload_endpoint or S3_ENDPOINT_URL)
+        except (RuntimeError, ValueError) as e:
+            print(f"❌ {e}", file=sys.stderr)
+            return 1
+        uploads = UploadQueue(uploader, on_done=lambda path, record, error: print_upload(path, record, error,
+                                                                                         args.json))
+    
+    if not args.out_dir:
+        TwitterSpacesDownloader().start_retention()
+    
+    def on_state(job):
+        if job.state == "waiting_for_space" and not args.json:
+            print(f"⏳ {job.url}: waiting for disk space", file=sys.stderr)
+        elif job.state == "waiting_for_account" and not args.json:
+            print(f"⏳ {job.url}: every account is throttled - waiting for one to come back", file=sys.stderr)
+        elif job.result is not None and job.state != "running":
+            print_result(job.result, args.json)
+            if uploads and job.result.success:
+                for path in result_files(job.result):
+                    uploads.submit(path)
+    
+    # --cookies pins every job to one account; otherwise spread them over the pool
+    credentials = None
+    if not args.cookies:
+        app_dir = get_app_dir()
+        credentials = CredentialPool.from_directory(args.accounts or app_dir / "accounts",
+                                                    default=app_dir / "cookies.txt")
+    
+    # Sessions saved at login are refreshed in the background before their cookies expire
+    for cookies_file in [args.cookies] if args.cookies else credentials.paths():
+        get_credential_manager(cookies_file).start()
+    
+    queue = None
+    if args.queue:
+        queue = JobQueue(get_app_dir() / QUEUE_NAME if args.queue is True else args.queue).start()
+        queue.recover("cli")
+        pending = queue.counts("cli").get("pending", 0)
+        if pending and not args.json:
+            print(f"♻️ Picking up {pending} queued job(s) from an earlier run", file=sys.stderr)
+    
+    scheduler = JobScheduler(max_concurrent=args.jobs, on_state=on_state, credentials=credentials, queue=queue)
+    jobs = asyncio.run(scheduler.run_batch(
+        urls,
+        resume=bool(queue),
+        priorities=priorities,
+        priority=args.priority,
+        formats=args.formats or ["m4a"],
+        out_dir=args.out_dir,
+        cookies=args.cookies,
+        keep_partial=args.keep_partial,
+        native=args.native,
+        speech_index=args.speech_index,
+        trim_silence=args.trim_silence
+    ))
+    failed = any(not job.result.success for job in jobs)
+    if args.native:
+        print_http_stats(args.json)
+    if len(jobs) > 1:
+        print_latency_stats(scheduler.latency_stats(), args.json)
+    if uploads:
+        failed = any(error for _, _, error in uploads.join()) or failed
+    return 1 if failed else 0
+
 def main():
+    # A bare launch goes straight to the menu without loading the CLI's dependencies
+    if len(sys.argv) > 1:
+        args = parse_args()
+        if args.urls or args.batch_file or args.queue:
+            sys.exit(run_headless(args))
+    
     downloader = TwitterSpacesDownloader()
     downloader.run()
 
@@ -0,0 +1,233 @@
+import asyncio
+import re
+import threading
+import time
+from pathlib import Path
+
+# How long a throttled account sits out; doubles with each strike in a row
+THROTTLE_COOLDOWN_SECONDS = 15 * 60
+MAX_COOLDOWN_SECONDS = 4 * 3600
+
+# Longest a job waits for a throttled account to come back before failing
+MAX_ACCOUNT_WAIT_SECONDS = 30 * 60
+
+# Regexes over the lowercased stderr. Status codes only count after "HTTP Error"/"status"
+# - bare digits also turn up inside Space, broadcast and chunk ids
+STATUS = r"\b(?:http error|status(?: code)?|response code)[ :=]*"
+THROTTLE_MARKERS = [STATUS + r"429\b", r"too many requests", r"rate[ -]limit"]
+AUTH_MARKERS = [STATUS + r"40[13]\b", r"\bforbidden\b", r"\bunauthorized\b", r"login required",
+                r"authentication", r"auth token", r"not logged in"]
+
+def classify_failure(stderr):
+    """What a failed yt-dlp run says about its account: "throttled", "auth" or None"""
+    text = (stderr or "").lower()
+    if any(re.search(marker, text) for marker in THROTTLE_MARKERS):
+        return "throttled"
+    if any(re.search(marker, text) for marker in AUTH_MARKERS):
+        return "auth"
+    return None
+
+def read_auth_cookie(path):
+    """(has an x.com auth_token, its expiry timestamp or None) for a Netscape cookie file"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+    except OSError:
+        return False, None
+    for line in lines:
+        fields = line.rstrip("\n").split("\t")
+        if len(fields) >= 7 and fields[5] == "auth_token" and fields[0].lstrip(".").endswith("x.com"):
+            expires = int(fields[4]) if fields[4].isdigit() and int(fields[4]) > 0 else None
+            return True, expires
+    return False, None
+
+class Account:
+    """One cookie jar and what we know about it"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.name = self.path.stem
+        self.active = 0              # jobs currently using it
+        self.state = "unknown"       # healthy, throttled, expired, invalid
+        self.expires_at = None
+        self.cooldown_until = 0
+        self.strikes = 0
+        self.last_used = 0
+        self.completed = 0
+        self.mtime = None
+
+    def check(self, now):
+        """Re-read the cookie file if it changed, and update the state"""
+        try:
+            mtime = self.path.stat().st_mtime
+        except OSError:
+            self.state = "invalid"
+            return
+        if mtime != self.mtime:
+            # A rewritten jar (fresh login) gets a clean slate
+            self.mtime = mtime
+            valid, self.expires_at = read_auth_cookie(self.path)
+            self.state = "healthy" if valid else "invalid"
+            self.cooldown_until = 0
+            self.strikes = 0
+        if self.state in ("healthy", "throttled"):
+            if self.expires_at and self.expires_at <= now:
+                self.state = "expired"
+            elif self.cooldown_until > now:
+                self.state = "throttled"
+            else:
+                self.state = "healthy"
+
+class CredentialPool:
+    """Several X accounts' cookie jars shared out between concurrent jobs.
+
+    acquire() hands out the healthy account with the fewest running jobs
+    (the least recently used on a tie); release() reports how the job went.
+    A throttled account sits out a cooldown, one whose login stopped working
+    stays out until its cookie file is replaced. Thread-safe: the web loader
+    calls it from many sessions.
+    """
+
+    def __init__(self, paths=(), directory=None, cooldown=THROTTLE_COOLDOWN_SECONDS):
+        self.directory = Path(directory) if directory else None
+        self.cooldown = cooldown
+        self.accounts = {}
+        self.lock = threading.Lock()
+        for path in paths:
+            self.add(path)
+
+    @classmethod
+    def from_directory(cls, directory, default=None, **options):
+        """Every *.txt jar in directory (picked up as they appear), plus the default cookies.txt"""
+        return cls([default] if default else [], directory=directory, **options)
+
+    def discover(self):
+        """Add cookie jars dropped into the accounts folder since the last look"""
+        if not self.directory or not self.directory.is_dir():
+            return
+        for path in sorted(self.directory.glob("*.txt")):
+            self.add(path)
+
+    def add(self, path):
+        with self.lock:
+            key = str(Path(path).resolve())
+            if key not in self.accounts:
+                self.accounts[key] = Account(path)
+            return self.accounts[key]
+
+    def paths(self):
+        """Every account's cookies file, healthy or not"""
+        self.discover()
+        with self.lock:
+            return [account.path for account in self.accounts.values()]
+
+    def __len__(self):
+        return len(self.accounts)
+
+    def healthy(self):
+        self.discover()
+        with self.lock:
+            return self._healthy(time.time())
+
+    def _healthy(self, now):
+        # Call with the lock held
+        for account in self.accounts.values():
+            account.check(now)
+        return [account for account in self.accounts.values() if account.state == "healthy"]
+
+    def _choose(self, now):
+        # Call with the lock held
+        candidates = self._healthy(now)
+        if not candidates:
+            return None
+        return min(candidates, key=lambda account: (account.active, account.last_used))
+
+    def pick(self):
+        """The account acquire() would hand out, without taking it (for quick lookups)"""
+        self.discover()
+        with self.lock:
+            return self._choose(time.time())
+
+    def acquire(self):
+        """Take the least-loaded healthy account, or None if there isn't one"""
+        self.discover()
+        now = time.time()
+        with self.lock:
+            # Chosen and counted in one go, so concurrent callers spread out
+            account = self._choose(now)
+            if account:
+                account.active += 1
+                account.last_used = now
+            return account
+
+    async def acquire_async(self, max_wait=MAX_ACCOUNT_WAIT_SECONDS, on_wait=None):
+        """acquire(), waiting out the cooldown when every account is throttled.
+
+        Returns None if no account is healthy and none comes back within
+        max_wait. on_wait(seconds) is called before each wait.
+        """
+        deadline = time.time() + max_wait
+        while True:
+            account = self.acquire()
+            if account:
+                return account
+            back = self.next_available_at()
+            if back is None or back > deadline:
+                return None
+            if on_wait:
+                on_wait(back - time.time())
+            await asyncio.sleep(max(0.0, back - time.time()) + 1)
+
+    def unavailable_hint(self):
+        """Why acquire() came back empty, for the user"""
+        back = self.next_available_at()
+        if back:
+            return f"Every account is throttled by X - try again in {max(1, int((back - time.time()) / 60))} min."
+        return "No account has working cookies - log in again or add a cookies file to the accounts folder."
+
+    def release(self, account, failure=None):
+        """Return an account; failure is classify_failure()'s verdict for the job"""
+        now = time.time()
+        with self.lock:
+            account.active = max(0, account.active - 1)
+            if failure == "throttled":
+                account.strikes += 1
+                cooldown = min(self.cooldown * 2 ** (account.strikes - 1), MAX_COOLDOWN_SECONDS)
+                account.cooldown_until = now + cooldown
+                account.state = "throttled"
+            elif failure == "auth":
+                account.state = "expired"
+                account.expires_at = now
+            else:
+                account.strikes = 0
+                account.completed += 1
+
+    def next_available_at(self):
+        """When the soonest throttled account comes back, or None"""
+        with self.lock:
+            times = [account.cooldown_until for account in self.accounts.values()
+                     if account.state == "throttled"]
+        return min(times) if times else None
+
+    def status(self):
+        """One line per account, for logs and the UI"""
+        self.healthy()
+        lines = []
+        now = time.time()
+        for account in self.accounts.values():
+            line = f"{account.name}: {account.state}, {account.active} running, {account.completed} done"
+            if account.state == "throttled":
+                line += f", back in {int(account.cooldown_until - now)}s"
+            lines.append(line)
+        return lines
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(directory, default=None):
+    """The process-wide pool for an accounts folder, created on first use"""
+    key = (str(directory), str(default))
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = CredentialPool.from_directory(directory, default)
+        return _pools[key]
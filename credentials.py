@@ -0,0 +1,161 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+
+from credential_pool import read_auth_cookie
+
+# Refresh ahead of time when the auth_token expires within this
+REFRESH_MARGIN_SECONDS = 24 * 3600
+
+# How often the background refresher looks at the cookies
+CHECK_INTERVAL_SECONDS = 30 * 60
+
+# A refresh lock older than this was left behind by a crashed process
+LOCK_STALE_SECONDS = 5 * 60
+LOCK_POLL_SECONDS = 1.0
+
+def cookies_usable(cookies_file, now=None):
+    """Whether the file has an x.com auth_token that hasn't expired"""
+    valid, expires = read_auth_cookie(cookies_file)
+    return valid and not (expires and expires <= (now or time.time()))
+
+def default_refresher(cookies_file):
+    # Restoring the saved browser session is the only refresh that needs no one at the keyboard
+    from lean_login import has_storage_state, refresh_session
+
+    if not has_storage_state(cookies_file):
+        return False
+    return asyncio.run(refresh_session(cookies_file))
+
+class CredentialManager:
+    """Keeps one cookies file fresh for any number of concurrent workers.
+
+    refresh() is single-flight: while a refresh runs, every other caller gets
+    the same future instead of starting a browser of its own, and a lock file
+    does the same across processes. Workers whose cookies still work never
+    wait on it. start() refreshes in the background before the auth_token
+    expires. The refresher writes the cookies atomically (see
+    lean_login.write_netscape_cookies).
+    """
+
+    def __init__(self, cookies_file, refresher=default_refresher, margin=REFRESH_MARGIN_SECONDS,
+                 interval=CHECK_INTERVAL_SECONDS):
+        self.cookies_file = Path(cookies_file)
+        self.lock_path = self.cookies_file.with_name(f".{self.cookies_file.name}.refresh.lock")
+        self.refresher = refresher
+        self.margin = margin
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.inflight = None
+        self.last_result = None
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def needs_refresh(self, now=None):
+        """Unusable, or about to expire"""
+        now = now or time.time()
+        valid, expires = read_auth_cookie(self.cookies_file)
+        return not valid or bool(expires and expires <= now + self.margin)
+
+    def refresh(self):
+        """Start a refresh, or join the one already running; returns a Future of True/False"""
+        with self.lock:
+            if self.inflight is None:
+                self.inflight = Future()
+                threading.Thread(target=self._run_refresh, args=(self.inflight,), daemon=True).start()
+            return self.inflight
+
+    async def refresh_async(self):
+        """refresh() for coroutines - awaiting it leaves the event loop free"""
+        return await asyncio.wrap_future(self.refresh())
+
+    async def ensure(self):
+        """The cookies file, refreshed first only if it can't be used as it is"""
+        if not cookies_usable(self.cookies_file):
+            await self.refresh_async()
+        return self.cookies_file
+
+    def _run_refresh(self, future):
+        try:
+            result = self._refresh_locked()
+        except Exception:
+            result = False
+        self.last_result = result
+        with self.lock:
+            self.inflight = None
+        future.set_result(result)
+
+    def _refresh_locked(self):
+        before = self._mtime()
+        if not self._acquire_file_lock():
+            # Another process refreshed while we waited - use its result
+            return self._mtime() != before and cookies_usable(self.cookies_file)
+        try:
+            return bool(self.refresher(self.cookies_file))
+        finally:
+            try:
+                self.lock_path.unlink()
+            except OSError:
+                pass
+
+    def _mtime(self):
+        try:
+            return self.cookies_file.stat().st_mtime_ns
+        except OSError:
+            return None
+
+    def _acquire_file_lock(self):
+        """Take the cross-process lock; False if another process held it (and has now finished)"""
+        waited = False
+        while True:
+            try:
+                fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    if time.time() - self.lock_path.stat().st_mtime > LOCK_STALE_SECONDS:
+                        self.lock_path.unlink()
+                        continue
+                except OSError:
+                    continue
+                waited = True
+                time.sleep(LOCK_POLL_SECONDS)
+                continue
+            if waited:
+                os.close(fd)
+                self.lock_path.unlink()
+                return False
+            with os.fdopen(fd, 'w') as f:
+                f.write(str(os.getpid()))
+            return True
+
+    def run(self):
+        while not self.stop_event.is_set():
+            if self.needs_refresh():
+                self.refresh().result()
+            if self.stop_event.wait(self.interval):
+                return
+
+    def start(self):
+        """Refresh ahead of expiry on a daemon thread"""
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+def get_credential_manager(cookies_file):
+    """The process-wide manager for a cookies file, created (not started) on first use"""
+    key = str(Path(cookies_file).resolve())
+    with _managers_lock:
+        if key not in _managers:
+            _managers[key] = CredentialManager(cookies_file)
+        return _managers[key]
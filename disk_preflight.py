@@ -0,0 +1,172 @@
+import asyncio
+import os
+import shutil
+import threading
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from hls_playlist import head_content_length, load_media_playlist
+from space_metadata import fetch_metadata
+
+# Spaces audio is ~64 kbit/s AAC; used when neither metadata nor playlist says otherwise
+DEFAULT_AUDIO_BITRATE = 64000
+
+# Assumed length of a Space that is still live (its playlist has no end yet)
+LIVE_ESTIMATE_SECONDS = 4 * 3600
+
+# Peak disk use per output format, relative to the downloaded source: the source
+# and the converted file exist side by side until yt-dlp deletes the source
+FORMAT_PEAK_FACTOR = {
+    "m4a": 2.0,
+    "mp4": 2.0,
+    "opus": 2.0,
+    "mp3": 3.0,
+}
+
+SAFETY_MARGIN = 1.1
+MIN_FREE_BYTES = 200 * 1024 * 1024
+
+# Seconds between re-checks while a job waits for space
+SPACE_POLL_SECONDS = 5
+
+class InsufficientSpace(Exception):
+    """Raised when a job can never fit on the target disk"""
+
+def format_bytes(nbytes):
+    """Human readable size for messages"""
+    return f"{nbytes / (1024 * 1024 * 1024):.2f} GB" if nbytes >= 1024 ** 3 else f"{nbytes / (1024 * 1024):.0f} MB"
+
+def pick_playlist_url(info):
+    """The HLS playlist yt-dlp would download from, if the metadata has one"""
+    candidates = [info] + list(reversed(info.get("formats") or []))
+    for fmt in candidates:
+        if fmt.get("url") and "m3u8" in (fmt.get("protocol") or ""):
+            return fmt["url"]
+    return None
+
+def estimate_from_info(info):
+    """Source size from metadata alone (filesize, or duration x bitrate)"""
+    for fmt in [info] + list(info.get("formats") or []):
+        size = fmt.get("filesize") or fmt.get("filesize_approx")
+        if size:
+            return int(size)
+    duration = info.get("duration")
+    if duration and not info.get("is_live"):
+        kbps = info.get("abr") or info.get("tbr")
+        bitrate = kbps * 1000 if kbps else DEFAULT_AUDIO_BITRATE
+        return int(duration * bitrate / 8)
+    return None
+
+def estimate_from_playlist(playlist_url):
+    """Source size from the playlist: total duration x bitrate.
+
+    Only playlist text is fetched. When the bitrate isn't advertised, a HEAD of
+    the first segment gives bytes per second without transferring media.
+    """
+    playlist = load_media_playlist(playlist_url)
+    duration = playlist.duration if playlist.ended else max(playlist.duration, LIVE_ESTIMATE_SECONDS)
+
+    if playlist.bandwidth:
+        return int(duration * playlist.bandwidth / 8)
+    if playlist.segments:
+        first = playlist.segments[0]
+        size = head_content_length(first.uri)
+        if size and first.duration:
+            return int(duration * size / first.duration)
+    return int(duration * DEFAULT_AUDIO_BITRATE / 8)
+
+async def estimate_source_bytes(url, cookies_file):
+    """Estimated size of the downloaded Space, or None if it can't be worked out"""
+    info = await fetch_metadata(url, cookies_file)
+    if not info:
+        return None
+
+    size = estimate_from_info(info)
+    if size:
+        return size
+
+    playlist_url = pick_playlist_url(info)
+    if not playlist_url:
+        return None
+    try:
+        return await asyncio.get_running_loop().run_in_executor(None, estimate_from_playlist, playlist_url)
+    except Exception:
+        return None
+
+def estimate_job_bytes(source_bytes, formats, packaging_factor=1.0):
+    """Peak disk needed by a job: formats run one after another, outputs accumulate.
+
+    packaging_factor covers extra copies made afterwards (e.g. 2.0 when the
+    outputs are zipped next to the originals).
+    """
+    if not source_bytes:
+        return 0
+    outputs = len(formats) - 1
+    peak = max(FORMAT_PEAK_FACTOR.get(f, 2.0) for f in formats) + outputs
+    return int(source_bytes * peak * packaging_factor * SAFETY_MARGIN)
+
+class DiskReservations:
+    """Tracks space promised to running jobs, per filesystem.
+
+    Thread-safe and loop-agnostic: the CLI uses one event loop, but every
+    Streamlit session runs its own.
+    """
+
+    def __init__(self, min_free=MIN_FREE_BYTES):
+        self.min_free = min_free
+        self.reserved = {}
+        self.lock = threading.Lock()
+
+    def device(self, path):
+        return os.stat(path).st_dev
+
+    def available(self, path):
+        """Free bytes not yet promised to a running job"""
+        with self.lock:
+            return shutil.disk_usage(path).free - self.reserved.get(self.device(path), 0) - self.min_free
+
+    def capacity(self, path):
+        """Space the job could get once every running job has released its reservation"""
+        return shutil.disk_usage(path).free - self.min_free
+
+    def try_reserve(self, path, nbytes):
+        with self.lock:
+            device = self.device(path)
+            free = shutil.disk_usage(path).free - self.reserved.get(device, 0) - self.min_free
+            if nbytes > free:
+                return False
+            self.reserved[device] = self.reserved.get(device, 0) + nbytes
+            return True
+
+    def release(self, path, nbytes):
+        with self.lock:
+            device = self.device(path)
+            self.reserved[device] = max(0, self.reserved.get(device, 0) - nbytes)
+
+    @asynccontextmanager
+    async def hold(self, path, nbytes, wait=True, on_wait=None):
+        """Reserve nbytes on path's disk for the duration of the block.
+
+        Waits (polling) while other jobs hold the space; raises
+        InsufficientSpace if it can never fit, or right away if wait is False.
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        waiting = False
+        while not self.try_reserve(path, nbytes):
+            if not wait or nbytes > self.capacity(path):
+                raise InsufficientSpace(
+                    f"Not enough disk space in {path}: need {format_bytes(nbytes)}, "
+                    f"{format_bytes(max(0, self.available(path)))} available"
+                )
+            if on_wait and not waiting:
+                on_wait(nbytes)
+            waiting = True
+            await asyncio.sleep(SPACE_POLL_SECONDS)
+        try:
+            yield nbytes
+        finally:
+            self.release(path, nbytes)
+
+# Shared by every job in the process
+reservations = DiskReservations()
@@ -0,0 +1,130 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Finished downloads remembered per process (their files are evicted by retention)
+MAX_CACHED_DOWNLOADS = 64
+
+# Seconds between progress refreshes for sessions waiting on a shared download
+WAIT_POLL_SECONDS = 0.5
+
+class SharedDownload:
+    """One download that any number of sessions can wait on.
+
+    The download coroutine updates status/progress as it goes; waiters only
+    read them, so they never touch each other's UI.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.future = None
+        self.status = "queued"
+        self.progress = {}
+        self.waiters = 0
+        self.created_at = time.time()
+
+    @property
+    def done(self):
+        return self.future is not None and self.future.done()
+
+    def succeeded(self):
+        if not self.done or self.future.cancelled() or self.future.exception() is not None:
+            return False
+        return self.future.result().get("success", True)
+
+class DownloadCache:
+    """Coalesces requests for the same Space onto one download and keeps the result.
+
+    Keys are space_url.SpaceKey values, so every URL spelling of a Space
+    (including status URLs, once resolved) shares one entry.
+
+    Downloads run on a private event loop thread, so a waiting session being
+    rerun or closed doesn't cancel a download other sessions still want; it
+    is cancelled only when its last waiter detaches. A finished result is
+    reused while all of its files still exist.
+    """
+
+    def __init__(self, max_entries=MAX_CACHED_DOWNLOADS):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        # Re-entrant: cancelling a future runs its done callback on the spot
+        self.lock = threading.RLock()
+        self.loop = None
+
+    def get_loop(self):
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+            threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        return self.loop
+
+    def is_reusable(self, entry):
+        if not entry.done:
+            return True
+        if not entry.succeeded():
+            return False
+        return all(os.path.exists(path) for path in entry.future.result().get("files", []))
+
+    def attach(self, key, download):
+        """Join the download for key, starting download(entry) if there is none.
+
+        download is a coroutine function returning a dict with "success" and a
+        "files" list.
+        Returns (entry, started) - started is False when joining or reusing.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and self.is_reusable(entry):
+                entry.waiters += 1
+                self.entries.move_to_end(key)
+                return entry, False
+
+            entry = SharedDownload(key)
+            entry.waiters = 1
+            entry.future = asyncio.run_coroutine_threadsafe(download(entry), self.get_loop())
+            entry.future.add_done_callback(lambda future: self.forget_failed(entry))
+            self.entries[key] = entry
+            self.evict()
+            return entry, True
+
+    def detach(self, entry):
+        """A session stopped waiting; cancel the download if nobody else wants it"""
+        with self.lock:
+            entry.waiters -= 1
+            if entry.waiters <= 0 and not entry.done:
+                entry.future.cancel()
+                if self.entries.get(entry.key) is entry:
+                    del self.entries[entry.key]
+
+    def forget_failed(self, entry):
+        # Failures aren't cached - the next request tries again
+        if entry.succeeded():
+            return
+        with self.lock:
+            if self.entries.get(entry.key) is entry:
+                del self.entries[entry.key]
+
+    def evict(self):
+        # Oldest finished entries go first; in-flight ones are never dropped
+        for key in list(self.entries):
+            if len(self.entries) <= self.max_entries:
+                break
+            if self.entries[key].done:
+                del self.entries[key]
+
+    async def wait(self, entry, on_update=None):
+        """Wait (on the caller's own loop) for a shared download and return its result.
+
+        Returns None if the download was cancelled; re-raises its exception if it failed.
+        """
+        while not entry.done:
+            if on_update:
+                on_update(entry)
+            await asyncio.sleep(WAIT_POLL_SECONDS)
+        if entry.future.cancelled():
+            return None
+        return entry.future.result()
+
+# One cache per process, shared by every Streamlit session
+download_cache = DownloadCache()
@@ -0,0 +1,451 @@
+import asyncio
+import datetime
+import itertools
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import uuid
+import weakref
+from collections import deque
+from concurrent.futures import Future
+from pathlib import Path
+
+from embedded_ytdlp import EmbeddedRunner
+from retention import pinned
+from tool_registry import registry
+
+# Emitted by yt-dlp once per progress update (with --newline)
+PROGRESS_PREFIX = "[progress]"
+PROGRESS_TEMPLATE = (
+    "download:" + PROGRESS_PREFIX +
+    " %(progress.downloaded_bytes)s %(progress.total_bytes_estimate)s"
+    " %(progress.speed)s %(progress.eta)s %(progress.fragment_index)s %(progress.fragment_count)s"
+)
+PROGRESS_FIELDS = ["downloaded_bytes", "total_bytes", "speed", "eta", "fragment_index", "fragment_count"]
+
+# How yt-dlp jobs run: "in-process" drives the yt_dlp module directly, "subprocess"
+# shells out to the executable, "auto" uses the module whenever it can be imported
+YTDLP_MODES = ["auto", "in-process", "subprocess"]
+YTDLP_MODE = os.environ.get("TSD_YTDLP_MODE", "auto")
+
+# How many stdout lines to keep per job for error logs
+OUTPUT_TAIL_LINES = 200
+
+# Seconds a cancelled process tree gets to exit before it is killed
+STOP_GRACE_SECONDS = 5
+
+# Filename markers of yt-dlp/ffmpeg intermediates; the first three let yt-dlp resume
+RESUMABLE_MARKERS = [".part", ".ytdl", ".part-Frag"]
+TEMP_MARKERS = [".temp.", ".tmp"]
+
+_job_ids = itertools.count(1)
+
+def build_download_command(url, format_ext, output_template, cookies_file,
+                           subtitles=True, write_info_json=False, progress=True):
+    """Build the yt-dlp command line for one Space in one output format"""
+    if format_ext == "mp4":
+        # Try to get video first, fall back to audio wrapped in MP4
+        format_selector = "best[ext=mp4]/bestvideo+bestaudio/best"
+    else:
+        format_selector = "bestaudio/best"
+
+    command = [
+        registry.path("yt-dlp"),
+        "--cookies", str(cookies_file),
+        "--no-clean-info-json",
+        "--write-comments",
+    ]
+
+    if write_info_json:
+        command.append("--write-info-json")
+
+    if subtitles:
+        command.extend([
+            "--write-subs",          # Download subtitles
+            "--write-auto-subs",     # Download auto-generated subtitles
+            "--sub-langs", "all",    # Download all available subtitle languages
+            "--convert-subs", "srt", # Convert to SRT format
+        ])
+
+    command.extend([
+        "--ffmpeg-location", registry.path("ffmpeg"),
+        "--no-warnings"
+    ])
+
+    if progress:
+        command.extend(["--newline", "--progress-template", PROGRESS_TEMPLATE])
+
+    if format_ext == "mp4":
+        # Keep video if available, or remux audio to MP4 container
+        command.extend([
+            "--remux-video", "mp4",
+            "--merge-output-format", "mp4"
+        ])
+        if subtitles:
+            command.append("--embed-subs")
+    else:
+        command.extend(["--extract-audio", "--audio-format", format_ext])
+
+    command.extend([
+        "-f", format_selector,
+        url,
+        "-o", str(output_template)
+    ])
+    return command
+
+# ffmpeg arguments turning assembled ADTS AAC into each output format
+CONVERT_ARGS = {
+    "m4a": ["-vn", "-c:a", "copy", "-bsf:a", "aac_adtstoasc"],
+    "mp4": ["-vn", "-c:a", "copy", "-bsf:a", "aac_adtstoasc"],
+    "mp3": ["-vn", "-c:a", "libmp3lame", "-q:a", "4"],
+    "opus": ["-vn", "-c:a", "libopus", "-b:a", "48k"],
+}
+
+def build_convert_command(source, target, extra_args=()):
+    """Build an ffmpeg command that converts one local file into another"""
+    return [
+        registry.path("ffmpeg"),
+        "-hide_banner", "-nostdin", "-y",
+        "-i", str(source),
+        *extra_args,
+        str(target)
+    ]
+
+def process_group_kwargs():
+    """Start a child in its own process group so the whole tree can be signalled"""
+    if sys.platform == "win32":
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {"start_new_session": True}
+
+def kill_process_tree(pid, force=False):
+    """Signal a process and every descendant (yt-dlp and the ffmpeg it spawned)"""
+    if sys.platform == "win32":
+        args = ["taskkill", "/PID", str(pid), "/T"]
+        if force:
+            args.append("/F")
+        subprocess.run(args, capture_output=True)
+        return
+    try:
+        os.killpg(pid, signal.SIGKILL if force else signal.SIGTERM)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+def new_prefix():
+    """File name prefix for a new download, unique even among jobs started the same second
+    (a job's files, cleanup and retention pin are all found by this prefix)"""
+    return f"space_{datetime.datetime.now():%Y%m%d_%H%M%S}_{uuid.uuid4().hex[:8]}"
+
+def cleanup_partial_files(out_dir, prefix, keep_resumable=False):
+    """Delete leftovers of an unfinished job and return the paths removed.
+
+    With keep_resumable the .part/.ytdl files stay so a rerun of the same
+    command can pick up where it stopped; other temp files always go.
+    """
+    if not out_dir or not prefix:
+        return []
+    markers = TEMP_MARKERS if keep_resumable else TEMP_MARKERS + RESUMABLE_MARKERS
+    removed = []
+    for path in Path(out_dir).glob(f"{prefix}*"):
+        if any(marker in path.name for marker in markers):
+            try:
+                path.unlink()
+                removed.append(path)
+            except OSError:
+                pass
+    return removed
+
+async def run_capture(command, timeout=None):
+    """Run a short helper command (metadata lookups, probes) outside the job slots.
+
+    Returns (returncode, stdout, stderr). The process tree is killed if the
+    caller is cancelled or the timeout expires.
+    """
+    process = await asyncio.create_subprocess_exec(
+        *[str(arg) for arg in command],
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        **process_group_kwargs()
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except BaseException:
+        kill_process_tree(process.pid, force=True)
+        await process.wait()
+        raise
+    return process.returncode, stdout.decode(errors="replace"), stderr.decode(errors="replace")
+
+def parse_progress_line(line):
+    """Parse a [progress] line into a dict of numbers (None where yt-dlp printed NA)"""
+    values = line[len(PROGRESS_PREFIX):].split()
+    progress = {}
+    for name, value in zip(PROGRESS_FIELDS, values):
+        try:
+            progress[name] = float(value)
+        except ValueError:
+            progress[name] = None
+    return progress
+
+class DownloadJob:
+    """One subprocess run (a yt-dlp download or an ffmpeg conversion) and its outcome"""
+
+    def __init__(self, command, out_dir=None, prefix=None, url=None, format_ext=None,
+                 keep_partial=False, cancellable=False):
+        self.id = next(_job_ids)
+        self.command = [str(arg) for arg in command]
+        self.out_dir = Path(out_dir) if out_dir else None
+        self.prefix = prefix
+        self.url = url
+        self.format_ext = format_ext
+        self.keep_partial = keep_partial
+        # Expected to be cancelled mid-run (e.g. by the web loader); such jobs
+        # always get a process, which - unlike a thread - can be killed
+        self.cancellable = cancellable
+
+        self.state = "queued"
+        self.returncode = None
+        self.progress = {}
+        self.stdout_tail = deque(maxlen=OUTPUT_TAIL_LINES)
+        self.stderr = ""
+        self.started_at = None
+        self.finished_at = None
+        self.process = None
+        self.thread_run = None
+        self.cancel_event = None
+        self.task = None
+        self.removed_files = []
+
+    @property
+    def success(self):
+        return self.state == "done"
+
+    @property
+    def is_ytdlp(self):
+        return Path(self.command[0]).stem.lower() in ("yt-dlp", "yt_dlp")
+
+    @property
+    def stdout(self):
+        return "\n".join(self.stdout_tail)
+
+    def output_files(self, pattern="*"):
+        """Files in out_dir written by this job (matched on its filename prefix)"""
+        if not self.out_dir or not self.prefix:
+            return []
+        return sorted(self.out_dir.glob(f"{self.prefix}_{pattern}"))
+
+class DownloadEngine:
+    """Runs download/convert jobs as asyncio subprocesses on one event loop.
+
+    A semaphore caps how many subprocesses run at once; everything else
+    (streaming output, progress, timeouts, cancellation) is plain asyncio,
+    so a single loop can supervise many jobs without a thread per job.
+
+    yt-dlp jobs can instead run in-process (see ytdlp_mode), on an executor
+    thread each, reusing initialized YoutubeDL instances between jobs. When
+    the yt_dlp module can't be imported (e.g. only the bundled exe is there)
+    they fall back to the subprocess.
+    """
+
+    def __init__(self, max_concurrent=4, ytdlp_mode=YTDLP_MODE):
+        self.max_concurrent = max_concurrent
+        self.ytdlp_mode = ytdlp_mode
+        self.embedded = EmbeddedRunner()
+        self.jobs = {}
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    @property
+    def in_process(self):
+        """Whether yt-dlp jobs run through the yt_dlp module rather than the executable"""
+        return self.ytdlp_mode != "subprocess" and self.embedded.available
+
+    @property
+    def semaphore(self):
+        # One per event loop: the CLI calls asyncio.run() per download, while
+        # the web loader keeps a long-lived background loop
+        loop = asyncio.get_running_loop()
+        if loop not in self._semaphores:
+            self._semaphores[loop] = asyncio.Semaphore(self.max_concurrent)
+        return self._semaphores[loop]
+
+    def create_job(self, url, format_ext, out_dir, cookies_file, prefix=None, keep_partial=False,
+                   **options):
+        """Build a yt-dlp job saving to out_dir/<prefix>_<uploader>_<date>_<id>.<ext>"""
+        if prefix is None:
+            prefix = new_prefix()
+        output_template = Path(out_dir) / f"{prefix}_%(uploader)s_%(upload_date)s_%(id)s.{format_ext}"
+        command = build_download_command(url, format_ext, output_template, cookies_file, **options)
+        return DownloadJob(command, out_dir=out_dir, prefix=prefix, url=url, format_ext=format_ext,
+                           keep_partial=keep_partial)
+
+    async def extract_info(self, command, timeout=None):
+        """Run a --dump-single-json yt-dlp command and return its info dict, or None.
+
+        In-process when downloads are (so a yt_dlp module without the
+        executable works too); the lookup writes no files, so one that times
+        out is simply abandoned on its thread.
+        """
+        if self.in_process:
+            future = Future()
+
+            def target():
+                try:
+                    future.set_result(self.embedded.extract_info(command[1:]))
+                except BaseException as e:
+                    future.set_exception(e)
+
+            threading.Thread(target=target, name="yt-dlp lookup", daemon=True).start()
+            try:
+                return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+            except (Exception, asyncio.TimeoutError):
+                return None
+        try:
+            returncode, stdout, stderr = await run_capture(command, timeout)
+            if returncode != 0 or not stdout.strip():
+                return None
+            return json.loads(stdout)
+        except (OSError, ValueError, asyncio.TimeoutError):
+            return None
+
+    def submit(self, job, timeout=None, on_progress=None, on_output=None):
+        """Start a job in the background and return its asyncio task"""
+        job.task = asyncio.ensure_future(self.run_job(job, timeout, on_progress, on_output))
+        return job.task
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job; returns False if there is no such job"""
+        job = self.jobs.get(job_id)
+        if not job or not job.task or job.task.done():
+            return False
+        job.task.cancel()
+        return True
+
+    async def run_job(self, job, timeout=None, on_progress=None, on_output=None):
+        """Run a job to completion and return it with state/returncode filled in.
+
+        on_progress(job, progress) is called for each yt-dlp progress update and
+        on_output(job, line) for every other stdout line.
+        """
+        self.jobs[job.id] = job
+        # Pinned so the retention sweep never evicts a download that is still being written
+        with pinned(job.out_dir, job.prefix):
+            try:
+                async with self.semaphore:
+                    job.state = "running"
+                    job.started_at = datetime.datetime.now()
+                    try:
+                        # A thread can't be killed, so jobs that may need stopping get a process
+                        embedded = job.is_ytdlp and self.in_process and timeout is None and not job.cancellable
+                        run = self._run_in_process if embedded else self._run_process
+                        await asyncio.wait_for(run(job, on_progress, on_output), timeout)
+                        job.state = "done" if job.returncode == 0 else "failed"
+                    except asyncio.TimeoutError:
+                        job.state = "timeout"
+                    finally:
+                        job.finished_at = datetime.datetime.now()
+            except BaseException:
+                # Cancelled (task.cancel(), Ctrl+C, a Streamlit rerun) while queued or running.
+                # The semaphore is already released here, so the slot is free while we clean up.
+                job.state = "cancelled"
+                await self._stop_process(job)
+                raise
+            finally:
+                self.jobs.pop(job.id, None)
+
+        if job.state == "timeout":
+            await self._stop_process(job)
+        elif job.state == "failed":
+            job.removed_files = cleanup_partial_files(job.out_dir, job.prefix, job.keep_partial)
+        return job
+
+    async def _run_process(self, job, on_progress, on_output):
+        job.process = await asyncio.create_subprocess_exec(
+            *job.command,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            **process_group_kwargs()
+        )
+
+        async def read_stdout():
+            async for raw in job.process.stdout:
+                line = raw.decode(errors="replace").rstrip()
+                if line.startswith(PROGRESS_PREFIX):
+                    job.progress = parse_progress_line(line)
+                    if on_progress:
+                        on_progress(job, job.progress)
+                    continue
+                job.stdout_tail.append(line)
+                if on_output:
+                    on_output(job, line)
+
+        async def read_stderr():
+            job.stderr = (await job.process.stderr.read()).decode(errors="replace")
+
+        await asyncio.gather(read_stdout(), read_stderr())
+        job.returncode = await job.process.wait()
+
+    async def _run_in_process(self, job, on_progress, on_output):
+        loop = asyncio.get_running_loop()
+        job.cancel_event = threading.Event()
+
+        def report(progress):
+            # Called on the yt-dlp thread; callbacks run on the loop like in subprocess mode
+            def deliver():
+                job.progress = progress
+                if on_progress:
+                    on_progress(job, progress)
+            loop.call_soon_threadsafe(deliver)
+
+        # A daemon thread rather than the default executor, so Ctrl+C doesn't wait on
+        # it at interpreter exit (asyncio.run() joins executor threads)
+        future = Future()
+
+        def target():
+            try:
+                future.set_result(self.embedded.run(job, job.cancel_event, report))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=target, name=f"yt-dlp job {job.id}", daemon=True).start()
+        job.thread_run = asyncio.wrap_future(future)
+        job.returncode = await asyncio.shield(job.thread_run)
+
+    async def _stop_process(self, job, grace=STOP_GRACE_SECONDS):
+        """Stop a job's whole process tree and remove its partial files.
+
+        The group is asked to exit first (so ffmpeg can close its output), then
+        killed outright. The kill is sent even if yt-dlp itself already exited,
+        since an orphaned ffmpeg grandchild keeps the group alive.
+        """
+        if job.cancel_event is not None:
+            # In-process: yt-dlp stops at its next progress/postprocessor hook. The
+            # thread can't be killed, so wait for it - cleaning up or reporting the
+            # job over while it still writes would leave files behind.
+            job.cancel_event.set()
+            try:
+                job.returncode = await asyncio.shield(job.thread_run)
+            except Exception:
+                pass
+        process = job.process
+        if process:
+            if process.returncode is None:
+                kill_process_tree(process.pid)
+                try:
+                    await asyncio.wait_for(asyncio.shield(process.wait()), grace)
+                except asyncio.TimeoutError:
+                    pass
+            kill_process_tree(process.pid, force=True)
+            if process.returncode is None:
+                await process.wait()
+            job.returncode = process.returncode
+        job.removed_files = cleanup_partial_files(job.out_dir, job.prefix, job.keep_partial)
+
+    async def run_all(self, jobs, timeout=None, on_progress=None, on_output=None):
+        """Run several jobs concurrently (bounded by max_concurrent) and return them"""
+        return await asyncio.gather(*(self.run_job(job, timeout, on_progress, on_output) for job in jobs))
+
+# Shared by the CLI, the library API and the web loader
+engine = DownloadEngine()
@@ -0,0 +1,194 @@
+import threading
+from collections import OrderedDict
+
+# Options that differ between the jobs of a batch; everything else must match
+# for a YoutubeDL instance to be reused
+PER_JOB_OPTIONS = ["outtmpl"]
+
+# Idle instances kept for reuse (one per distinct option set)
+MAX_IDLE_INSTANCES = 8
+
+def load_yt_dlp():
+    """The yt_dlp module if it can be imported (and is new enough), else None"""
+    try:
+        import yt_dlp
+    except ImportError:
+        return None
+    return yt_dlp if hasattr(yt_dlp, "parse_options") else None
+
+class JobLogger:
+    """Hands yt-dlp's messages to whichever job is using the instance"""
+
+    def __init__(self):
+        self.job = None
+        self.errors = []
+
+    def debug(self, message):
+        if self.job and not message.startswith("[debug] "):
+            self.job.stdout_tail.append(message)
+
+    def info(self, message):
+        self.debug(message)
+
+    def warning(self, message):
+        self.errors.append(message)
+
+    def error(self, message):
+        self.errors.append(message)
+
+class EmbeddedInstance:
+    """One initialized YoutubeDL plus the hooks that report to the current job"""
+
+    def __init__(self, yt_dlp, options):
+        self.logger = JobLogger()
+        self.report = None
+        self.cancel_event = None
+        self.cancelled_error = yt_dlp.utils.DownloadCancelled
+        self.ydl = yt_dlp.YoutubeDL(dict(
+            options,
+            logger=self.logger,
+            noprogress=True,
+            progress_hooks=[self.progress_hook],
+            postprocessor_hooks=[self.postprocessor_hook],
+        ))
+
+    def check_cancelled(self):
+        # Hooks are the only place yt-dlp lets us interrupt it
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise self.cancelled_error()
+
+    def progress_hook(self, status):
+        self.check_cancelled()
+        if status.get("status") == "downloading" and self.report:
+            self.report({
+                "downloaded_bytes": status.get("downloaded_bytes"),
+                "total_bytes": status.get("total_bytes") or status.get("total_bytes_estimate"),
+                "speed": status.get("speed"),
+                "eta": status.get("eta"),
+                "fragment_index": status.get("fragment_index"),
+                "fragment_count": status.get("fragment_count"),
+            })
+
+    def postprocessor_hook(self, status):
+        self.check_cancelled()
+        if self.logger.job:
+            self.logger.job.stdout_tail.append(f"[{status.get('postprocessor')}] {status.get('status')}")
+        if status.get("status") == "started" and self.report:
+            self.report({"postprocessor": status.get("postprocessor")})
+
+class EmbeddedRunner:
+    """Runs yt-dlp command lines through yt_dlp.YoutubeDL inside this process.
+
+    The command line a DownloadJob already carries is parsed with yt-dlp's own
+    option parser, so both engine modes download exactly the same thing. Each
+    initialized YoutubeDL (extractors loaded, cookies read) goes back to an
+    idle pool after a successful job and is reused by the next job with the
+    same options, e.g. the rest of a batch. run() blocks, so it is meant for
+    an executor thread.
+    """
+
+    def __init__(self, max_idle=MAX_IDLE_INSTANCES):
+        self.max_idle = max_idle
+        self.idle = OrderedDict()     # option key -> [EmbeddedInstance, ...]
+        self.lock = threading.Lock()
+        self._yt_dlp = None
+
+    @property
+    def available(self):
+        if self._yt_dlp is None:
+            self._yt_dlp = load_yt_dlp() or False
+        return bool(self._yt_dlp)
+
+    def options_key(self, options):
+        return repr(sorted((name, repr(value)) for name, value in options.items()
+                           if name not in PER_JOB_OPTIONS))
+
+    def checkout(self, options):
+        key = self.options_key(options)
+        with self.lock:
+            instances = self.idle.get(key)
+            instance = instances.pop() if instances else None
+            if instances == []:
+                del self.idle[key]
+        if instance is None:
+            instance = EmbeddedInstance(self._yt_dlp, options)
+        else:
+            outtmpl = options.get("outtmpl")
+            if isinstance(outtmpl, dict):
+                outtmpl = dict(instance.ydl.params["outtmpl"], **outtmpl)
+            instance.ydl.params["outtmpl"] = outtmpl
+        return key, instance
+
+    def checkin(self, key, instance):
+        with self.lock:
+            self.idle.setdefault(key, []).append(instance)
+            self.idle.move_to_end(key)
+            while sum(len(instances) for instances in self.idle.values()) > self.max_idle:
+                oldest = next(iter(self.idle))
+                self.idle[oldest].pop(0)
+                if not self.idle[oldest]:
+                    del self.idle[oldest]
+
+    def extract_info(self, args):
+        """Metadata for a yt-dlp command line (--dump-single-json style) without
+        downloading; returns the info dict, or None if yt-dlp failed"""
+        try:
+            parsed = self._yt_dlp.parse_options(args)
+        except (Exception, SystemExit):
+            return None
+        # The JSON is returned, not printed
+        options = dict(parsed.ydl_opts, dumpjson=False, dump_single_json=False, forcejson=False,
+                       simulate=True, quiet=True)
+        key, instance = self.checkout(options)
+        instance.logger.errors = []
+        info = None
+        try:
+            info = instance.ydl.sanitize_info(instance.ydl.extract_info(parsed.urls[0], download=False))
+        except Exception:
+            pass
+        finally:
+            try:
+                instance.ydl.save_cookies()
+            except Exception:
+                pass
+        if info is not None:
+            self.checkin(key, instance)
+        return info
+
+    def run(self, job, cancel_event, report):
+        """Run job.command in-process; returns yt-dlp's exit code.
+
+        report(progress) is called from this thread for each update; setting
+        cancel_event stops the download at the next hook call.
+        """
+        try:
+            parsed = self._yt_dlp.parse_options(job.command[1:])
+        except (Exception, SystemExit) as e:
+            # optparse exits on options it doesn't know
+            job.stderr = f"ERROR: yt-dlp {self._yt_dlp.version.__version__} rejected the options: {e}"
+            return 2
+        key, instance = self.checkout(parsed.ydl_opts)
+        instance.logger.job = job
+        instance.logger.errors = []
+        instance.report = report
+        instance.cancel_event = cancel_event
+        returncode = 1
+        try:
+            returncode = instance.ydl.download(parsed.urls)
+        except self._yt_dlp.utils.DownloadCancelled:
+            instance.logger.errors.append("Download cancelled")
+        except Exception as e:
+            instance.logger.errors.append(f"ERROR: {e}")
+        finally:
+            job.stderr = "\n".join(instance.logger.errors)
+            instance.logger.job = None
+            instance.report = None
+            instance.cancel_event = None
+            try:
+                instance.ydl.save_cookies()
+            except Exception:
+                pass
+        # An instance that saw an error keeps a non-zero exit code, so only clean ones are reused
+        if returncode == 0:
+            self.checkin(key, instance)
+        return returncode
@@ -0,0 +1,205 @@
+import mimetypes
+import os
+import re
+import secrets
+import threading
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import quote, unquote
+
+# Where the server listens and the address browsers use to reach it
+# (set TSD_FILE_SERVER_URL when the host sits behind a proxy; without it the web
+# loader only links browsers on this machine here, others get an in-page download)
+FILE_SERVER_HOST = os.environ.get("TSD_FILE_SERVER_HOST", "0.0.0.0")
+FILE_SERVER_PORT = int(os.environ.get("TSD_FILE_SERVER_PORT", "8502"))
+FILE_SERVER_URL = os.environ.get("TSD_FILE_SERVER_URL")
+
+RANGE_PATTERN = re.compile(r"bytes=(\d*)-(\d*)$")
+
+# Served inline so <audio> elements can stream and seek; everything else downloads
+INLINE_SUFFIXES = ['.m4a', '.mp3', '.mp4', '.opus']
+
+def parse_range(header, size):
+    """(start, end) inclusive for a single-range Range header, or None for the whole file.
+
+    Raises ValueError when the range can't be satisfied. Multi-range requests
+    are answered with the whole file, which HTTP allows.
+    """
+    match = RANGE_PATTERN.match(header.strip()) if header else None
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError("empty suffix range")
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError("range not satisfiable")
+    return start, end
+
+class FileRequestHandler(BaseHTTPRequestHandler):
+    """Serves published files with Range support, sending the body with sendfile()"""
+
+    protocol_version = "HTTP/1.1"
+    server_version = "SpacesFileServer"
+
+    def do_HEAD(self):
+        self.serve(send_body=False)
+
+    def do_GET(self):
+        self.serve(send_body=True)
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_empty(self, status, headers=()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def serve(self, send_body):
+        parts = self.path.split("?")[0].strip("/").split("/")
+        entry = self.server.files.lookup(parts[1]) if len(parts) == 3 and parts[0] == "files" else None
+        if not entry:
+            self.send_empty(404)
+            return
+
+        path, name = entry
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            self.send_empty(404)
+            return
+
+        with f:
+            stat = os.fstat(f.fileno())
+            size = stat.st_size
+            etag = f'"{stat.st_mtime_ns:x}-{size:x}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_empty(304, [("ETag", etag)])
+                return
+
+            range_header = self.headers.get("Range")
+            if self.headers.get("If-Range") not in (None, etag):
+                range_header = None
+            try:
+                byte_range = parse_range(range_header, size)
+            except ValueError:
+                self.send_empty(416, [("Content-Range", f"bytes */{size}")])
+                return
+
+            start, end = byte_range or (0, size - 1)
+            length = max(0, end - start + 1)
+            self.send_response(206 if byte_range else 200)
+            self.send_header("Content-Type", mimetypes.guess_type(name)[0] or "application/octet-stream")
+            self.send_header("Content-Length", str(length))
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", self.date_time_string(int(stat.st_mtime)))
+            disposition = "inline" if Path(name).suffix in INLINE_SUFFIXES else "attachment"
+            self.send_header("Content-Disposition", f"{disposition}; filename*=UTF-8''{quote(name)}")
+            if byte_range:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            self.end_headers()
+
+            if send_body and length:
+                retention = self.server.retention
+                try:
+                    # Pinned while the transfer runs, so eviction can't pull the file mid-download
+                    with retention.in_use(path) if retention else nullcontext():
+                        # Zero-copy where the OS supports it; the file never passes through Python
+                        self.connection.sendfile(f, start, length)
+                except (BrokenPipeError, ConnectionResetError):
+                    # Browsers drop connections all the time while seeking
+                    self.close_connection = True
+
+class PublishedFiles:
+    """Token -> file mapping; only files published here can be fetched"""
+
+    def __init__(self):
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def add(self, path, name=None):
+        token = secrets.token_urlsafe(16)
+        with self.lock:
+            self.entries[token] = (str(path), name or Path(path).name)
+        return token
+
+    def remove(self, token):
+        with self.lock:
+            self.entries.pop(token, None)
+
+    def lookup(self, token):
+        with self.lock:
+            return self.entries.get(unquote(token))
+
+    def is_published(self, path):
+        path = str(path)
+        with self.lock:
+            return any(entry_path == path for entry_path, _ in self.entries.values())
+
+class FileServer:
+    """Small threaded HTTP server for handing large files straight to the browser.
+
+    Files are only reachable through the unguessable URL publish() returns.
+    The server is started on first use and shared by every Streamlit session
+    in the process. With a retention manager, each transfer pins its file and
+    counts as a use for LRU eviction.
+    """
+
+    def __init__(self, host=FILE_SERVER_HOST, port=FILE_SERVER_PORT, base_url=FILE_SERVER_URL,
+                 retention=None):
+        self.host = host
+        self.port = port
+        self.base_url = base_url
+        self.retention = retention
+        self.files = PublishedFiles()
+        self.httpd = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Start serving in a background thread; raises OSError if the port is taken"""
+        with self.lock:
+            if self.httpd:
+                return
+            httpd = ThreadingHTTPServer((self.host, self.port), FileRequestHandler)
+            httpd.daemon_threads = True
+            httpd.files = self.files
+            httpd.retention = self.retention
+            self.port = httpd.server_address[1]
+            threading.Thread(target=httpd.serve_forever, daemon=True).start()
+            self.httpd = httpd
+
+    def stop(self):
+        with self.lock:
+            if self.httpd:
+                self.httpd.shutdown()
+                self.httpd.server_close()
+                self.httpd = None
+
+    def publish(self, path, name=None):
+        """Make a file downloadable and return (token, url)"""
+        self.start()
+        name = name or Path(path).name
+        token = self.files.add(path, name)
+        base = self.base_url or f"http://localhost:{self.port}"
+        return token, f"{base.rstrip('/')}/files/{token}/{quote(name)}"
+
+    def unpublish(self, token):
+        self.files.remove(token)
+
+    def is_published(self, path):
+        return self.files.is_published(path)
+
+# One server per process, shared by every session
+file_server = FileServer()
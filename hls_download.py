@@ -0,0 +1,402 @@
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import http_pool
+from adaptive_concurrency import AIMDLimiter, global_slots
+from hls_playlist import USER_AGENT, load_media_playlist
+from tool_registry import registry
+
+MANIFEST_NAME = "manifest.json"
+
+# Segments are appended to this one file as they arrive; the manifest records where
+DATA_NAME = "segments.data"
+
+# A segment whose decoded length differs from its #EXTINF by more than this is re-fetched
+SEGMENT_DURATION_TOLERANCE = 0.5
+
+# Allowed gap between the assembled file's duration and the playlist's
+OUTPUT_DURATION_TOLERANCE = 2.0
+OUTPUT_DURATION_TOLERANCE_RATIO = 0.005
+
+# Parallel segment requests a job starts with; adaptive control takes it from there
+DEFAULT_WORKERS = 4
+FETCH_RETRIES = 3
+
+ADTS_SAMPLE_RATES = [96000, 88200, 64000, 48000, 44100, 32000, 24000, 22050, 16000, 12000, 11025, 8000, 7350]
+
+class SourceChanged(Exception):
+    """The playlist no longer matches the one the stored segments came from"""
+
+def playlist_fingerprint(playlist):
+    """Identity of a playlist's content; query strings (signed tokens) are ignored"""
+    digest = hashlib.sha1()
+    for segment in playlist.segments:
+        digest.update(f"{segment.index}|{urlsplit(segment.uri).path}|{segment.duration:.3f}\n".encode())
+    return digest.hexdigest()
+
+def adts_duration(data):
+    """Seconds of audio in an ADTS AAC segment, or None if it isn't ADTS.
+
+    Walks the frame headers only (no decoding): every ADTS frame holds 1024
+    samples per raw data block. A leading ID3 tag (HLS timestamps) is skipped.
+    """
+    pos = 0
+    if data[:3] == b"ID3" and len(data) >= 10:
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        pos = 10 + size
+
+    samples = 0
+    sample_rate = None
+    while pos + 7 <= len(data):
+        if data[pos] != 0xFF or (data[pos + 1] & 0xF6) != 0xF0:
+            return None
+        rate_index = (data[pos + 2] >> 2) & 0x0F
+        frame_length = ((data[pos + 3] & 0x03) << 11) | (data[pos + 4] << 3) | (data[pos + 5] >> 5)
+        if rate_index >= len(ADTS_SAMPLE_RATES) or frame_length < 7:
+            return None
+        sample_rate = ADTS_SAMPLE_RATES[rate_index]
+        samples += ((data[pos + 6] & 0x03) + 1) * 1024
+        pos += frame_length
+
+    if not sample_rate:
+        return None
+    return samples / sample_rate
+
+def probe_duration(path):
+    """Duration of a media file from ffprobe, or None if it can't be read"""
+    command = [
+        registry.path("ffprobe"),
+        "-v", "error",
+        "-show_entries", "format=duration",
+        "-of", "default=noprint_wrappers=1:nokey=1",
+        str(path)
+    ]
+    try:
+        result = subprocess.run(command, capture_output=True, text=True, timeout=60)
+        return float(result.stdout.strip())
+    except Exception:
+        return None
+
+def duration_matches(actual, expected):
+    """Whether an output's duration is close enough to the playlist's"""
+    if actual is None or not expected:
+        return True
+    tolerance = max(OUTPUT_DURATION_TOLERANCE, expected * OUTPUT_DURATION_TOLERANCE_RATIO)
+    return abs(actual - expected) <= tolerance
+
+def write_at(path, data, offset):
+    """Write data at offset without touching the rest of the file (or its size)"""
+    fd = os.open(path, os.O_WRONLY | getattr(os, "O_BINARY", 0))
+    try:
+        view = memoryview(data)
+        if not hasattr(os, "pwrite"):
+            # Windows: no pwrite, but the descriptor is ours alone
+            os.lseek(fd, offset, os.SEEK_SET)
+        while view:
+            written = os.pwrite(fd, view, offset) if hasattr(os, "pwrite") else os.write(fd, view)
+            view = view[written:]
+            offset += written
+    finally:
+        os.close(fd)
+
+def read_at(path, size, offset):
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        return f.read(size)
+
+def copy_range(source, out, offset, size):
+    """Append size bytes of the open file source, from offset, to the open file out"""
+    # File-to-file sendfile (no copy through Python) is Linux only
+    if sys.platform.startswith("linux"):
+        out.flush()
+        while size > 0:
+            sent = os.sendfile(out.fileno(), source.fileno(), offset, size)
+            if not sent:
+                break
+            offset += sent
+            size -= sent
+        out.seek(0, os.SEEK_END)
+    else:
+        source.seek(offset)
+        while size > 0:
+            chunk = source.read(min(size, 1024 * 1024))
+            if not chunk:
+                break
+            out.write(chunk)
+            size -= len(chunk)
+
+def fetch_bytes(url, timeout=30):
+    # Through the shared pool: segments of every job reuse the CDN connections
+    return http_pool.request("GET", url, {"User-Agent": USER_AGENT}, timeout).body
+
+class SegmentDownloader:
+    """Downloads an HLS media playlist segment by segment into work_dir.
+
+    Each segment is written once, appended to one data file in whatever
+    order it arrives (its size comes from the GET itself - nothing is probed
+    up front or held back in memory). Putting them in playlist order is left
+    to assemble(): a hard link when they happened to arrive in order, else
+    a single kernel-side copy.
+
+    Every stored segment is recorded in manifest.json with its size, SHA-256
+    and measured duration, so an interrupted or damaged download can be
+    verified and repaired by re-fetching only the bad segments. If the
+    playlist itself changed, SourceChanged is raised and the caller starts over.
+
+    The number of segments fetched in parallel adapts to how the CDN responds
+    (see AIMDLimiter) unless workers fixes it.
+    """
+
+    def __init__(self, playlist_url, work_dir, workers=None):
+        self.playlist_url = playlist_url
+        self.work_dir = Path(work_dir)
+        if workers:
+            self.limiter = AIMDLimiter(initial=workers, minimum=workers, maximum=workers)
+        else:
+            self.limiter = AIMDLimiter(initial=DEFAULT_WORKERS)
+        self.playlist = None
+        self.manifest = None
+        # End of the data file: where the next segment goes
+        self.data_size = 0
+        self.data_lock = threading.Lock()
+
+    @property
+    def manifest_path(self):
+        return self.work_dir / MANIFEST_NAME
+
+    @property
+    def data_path(self):
+        return self.work_dir / DATA_NAME
+
+    def segment_path(self, index):
+        # Where earlier versions kept segments that had no planned place in the data file
+        return self.work_dir / f"{index:08d}.seg"
+
+    def load_manifest(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception:
+            return None
+
+    def save_manifest(self):
+        """Write the manifest atomically so a crash never leaves it half-written"""
+        tmp_path = self.manifest_path.with_suffix(".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+
+    def open(self, playlist=None):
+        """Load the playlist (unless it was fetched ahead) and the manifest of any earlier attempt"""
+        self.playlist = playlist or load_media_playlist(self.playlist_url)
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        fingerprint = playlist_fingerprint(self.playlist)
+
+        manifest = self.load_manifest()
+        if manifest and manifest.get("fingerprint") != fingerprint:
+            raise SourceChanged(f"Playlist changed since the segments in {self.work_dir} were fetched")
+
+        self.manifest = manifest or {
+            "playlist_url": self.playlist_url,
+            "fingerprint": fingerprint,
+            "expected_duration": self.playlist.duration,
+            "ended": self.playlist.ended,
+            "segments": {},
+        }
+        # Anything past the recorded segments (an interrupted write) is overwritten
+        self.data_path.touch()
+        self.data_size = max([record["offset"] + record["size"] for record in self.manifest["segments"].values()
+                              if "offset" in record] or [0])
+        return self.playlist
+
+    def append(self, data):
+        """Write data after everything stored so far; returns its offset"""
+        with self.data_lock:
+            offset = self.data_size
+            self.data_size += len(data)
+        # Only the reservation is serialised - the writes themselves overlap
+        write_at(self.data_path, data, offset)
+        return offset
+
+    def reset(self):
+        """Throw away everything fetched so far"""
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+        self.manifest = None
+
+    def fetch_segment(self, segment):
+        """Fetch one segment with retries, store it and return its manifest record"""
+        last_error = None
+        for _ in range(FETCH_RETRIES):
+            # The global cap is shared with the other jobs' segment requests
+            with global_slots:
+                started = time.monotonic()
+                try:
+                    data = fetch_bytes(segment.uri)
+                except Exception as e:
+                    last_error = e
+                    wait = self.limiter.record_failure(started, e)
+                else:
+                    self.limiter.record(len(data), started)
+                    break
+            time.sleep(wait)
+        else:
+            raise last_error
+
+        return {
+            "offset": self.append(data),
+            "size": len(data),
+            "sha256": hashlib.sha256(data).hexdigest(),
+            "duration": adts_duration(data),
+            "expected_duration": segment.duration,
+        }
+
+    def check_segment(self, segment):
+        """Why a stored segment is bad, or None if it verifies"""
+        record = self.manifest["segments"].get(str(segment.index))
+        if not record:
+            return "missing"
+        if "offset" in record:
+            if not self.data_path.exists():
+                return "missing"
+            data = read_at(self.data_path, record["size"], record["offset"])
+        else:
+            path = self.segment_path(segment.index)
+            if not path.exists():
+                return "missing"
+            if path.stat().st_size != record["size"]:
+                return "size mismatch"
+            with open(path, 'rb') as f:
+                data = f.read()
+        if len(data) != record["size"]:
+            return "size mismatch"
+        if hashlib.sha256(data).hexdigest() != record["sha256"]:
+            return "checksum mismatch"
+        if record["duration"] is not None and abs(record["duration"] - segment.duration) > SEGMENT_DURATION_TOLERANCE:
+            return "duration mismatch"
+        return None
+
+    def verify(self):
+        """{segment index: problem} for every segment that needs (re-)fetching"""
+        problems = {}
+        for segment in self.playlist.segments:
+            problem = self.check_segment(segment)
+            if problem:
+                problems[segment.index] = problem
+        return problems
+
+    async def fetch_segments(self, segments, on_progress=None):
+        """Fetch the given segments concurrently, recording each in the manifest.
+
+        As many fetches run at once as the limiter currently allows. A segment
+        that still fails after its retries is simply left out of the manifest;
+        the next verify() reports it as missing.
+        """
+        loop = asyncio.get_running_loop()
+        pending = list(segments)
+        running = {}
+        done = 0
+
+        def record(future, segment):
+            nonlocal done
+            if future.cancelled() or future.exception():
+                return False
+            self.manifest["segments"][str(segment.index)] = future.result()
+            done += 1
+            if on_progress:
+                on_progress(done, len(segments))
+            return True
+
+        # Not a with block: leaving it would shut the pool down with wait=True,
+        # blocking the event loop until every in-flight fetch finished
+        pool = ThreadPoolExecutor(max_workers=self.limiter.maximum)
+        try:
+            while pending or running:
+                while pending and len(running) < self.limiter.current:
+                    segment = pending.pop(0)
+                    running[loop.run_in_executor(pool, self.fetch_segment, segment)] = segment
+                finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for future in finished:
+                    if record(future, running.pop(future)) and done % 50 == 0:
+                        self.save_manifest()
+        finally:
+            # On cancellation: drop the queued fetches, let the ones already
+            # running finish off the loop, and keep what they stored
+            pool.shutdown(wait=False, cancel_futures=True)
+            if running:
+                try:
+                    await asyncio.wait(running)
+                finally:
+                    for future, segment in running.items():
+                        if future.done():
+                            record(future, segment)
+                    self.save_manifest()
+            else:
+                self.save_manifest()
+
+    async def download(self, on_progress=None, max_repairs=2):
+        """Fetch every segment that isn't already stored and verified.
+
+        Returns {index: problem} for segments still bad after max_repairs
+        extra passes (empty on success).
+        """
+        loop = asyncio.get_running_loop()
+        if self.playlist is None:
+            await loop.run_in_executor(None, self.open)
+        by_index = {segment.index: segment for segment in self.playlist.segments}
+
+        # Hashing every stored segment takes a while on a long Space - off the event loop
+        problems = await loop.run_in_executor(None, self.verify)
+        for _ in range(max_repairs + 1):
+            if not problems:
+                break
+            await self.fetch_segments([by_index[index] for index in problems], on_progress)
+            problems = await loop.run_in_executor(None, self.verify)
+        return problems
+
+    def assemble(self, out_path):
+        """The verified segments, in playlist order, as out_path.
+
+        When the data file holds exactly the segments, already in playlist
+        order, out_path is just a hard link to it; otherwise the pieces are
+        copied together.
+        """
+        out_path = Path(out_path)
+        out_path.unlink(missing_ok=True)
+        records = [self.manifest["segments"][str(segment.index)] for segment in self.playlist.segments]
+        position = 0
+        in_order = True
+        for record in records:
+            if record.get("offset") != position:
+                in_order = False
+                break
+            position += record["size"]
+        if in_order and self.data_path.stat().st_size == position:
+            try:
+                os.link(self.data_path, out_path)
+                return out_path
+            except OSError:
+                pass    # e.g. FAT/exFAT: no hard links
+
+        with open(out_path, 'wb') as out:
+            data = open(self.data_path, 'rb') if self.data_path.exists() else None
+            try:
+                for segment, record in zip(self.playlist.segments, records):
+                    if "offset" in record:
+                        copy_range(data, out, record["offset"], record["size"])
+                    else:
+                        with open(self.segment_path(segment.index), 'rb') as f:
+                            shutil.copyfileobj(f, out)
+            finally:
+                if data:
+                    data.close()
+        return out_path
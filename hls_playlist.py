@@ -0,0 +1,98 @@
+import re
+from urllib.parse import urljoin
+
+import http_pool
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+
+ATTRIBUTE_PATTERN = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+class Segment:
+    """One media segment of an HLS playlist"""
+
+    def __init__(self, index, uri, duration):
+        self.index = index
+        self.uri = uri
+        self.duration = duration
+
+class Playlist:
+    """Parsed HLS playlist - either a master (variants) or a media playlist (segments)"""
+
+    def __init__(self, url):
+        self.url = url
+        self.segments = []
+        self.variants = []       # [(bandwidth, uri)] for master playlists
+        self.target_duration = None
+        self.media_sequence = 0
+        self.ended = False
+        self.bandwidth = None    # bits/s, when the master playlist told us
+
+    @property
+    def is_master(self):
+        return bool(self.variants)
+
+    @property
+    def duration(self):
+        return sum(segment.duration for segment in self.segments)
+
+def parse_attributes(text):
+    """Parse an attribute list like BANDWIDTH=64000,CODECS="mp4a.40.2" """
+    return {key: value.strip('"') for key, value in ATTRIBUTE_PATTERN.findall(text)}
+
+def parse_playlist(text, url):
+    """Parse m3u8 text; segment and variant URIs are resolved against url"""
+    playlist = Playlist(url)
+    pending_duration = None
+    pending_bandwidth = None
+
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("#EXTINF:"):
+            pending_duration = float(line[len("#EXTINF:"):].split(",")[0])
+        elif line.startswith("#EXT-X-STREAM-INF:"):
+            attributes = parse_attributes(line[len("#EXT-X-STREAM-INF:"):])
+            bandwidth = attributes.get("AVERAGE-BANDWIDTH") or attributes.get("BANDWIDTH")
+            pending_bandwidth = int(bandwidth) if bandwidth else 0
+        elif line.startswith("#EXT-X-TARGETDURATION:"):
+            playlist.target_duration = float(line.split(":", 1)[1])
+        elif line.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+            playlist.media_sequence = int(line.split(":", 1)[1])
+        elif line.startswith("#EXT-X-ENDLIST"):
+            playlist.ended = True
+        elif not line.startswith("#"):
+            uri = urljoin(url, line)
+            if pending_bandwidth is not None:
+                playlist.variants.append((pending_bandwidth, uri))
+                pending_bandwidth = None
+            elif pending_duration is not None:
+                index = playlist.media_sequence + len(playlist.segments)
+                playlist.segments.append(Segment(index, uri, pending_duration))
+                pending_duration = None
+
+    return playlist
+
+def fetch_text(url, headers=None, timeout=15):
+    """GET a playlist and return it as text (over the shared keep-alive pool)"""
+    return http_pool.request("GET", url, {"User-Agent": USER_AGENT, **(headers or {})}, timeout).text
+
+def head_content_length(url, headers=None, timeout=15):
+    """Size of a resource from a HEAD request (no body is transferred), or None"""
+    try:
+        response = http_pool.request("HEAD", url, {"User-Agent": USER_AGENT, **(headers or {})}, timeout)
+    except Exception:
+        return None
+    length = response.headers.get("content-length")
+    return int(length) if length else None
+
+def load_media_playlist(url, headers=None):
+    """Fetch a playlist, following a master playlist to its best variant"""
+    playlist = parse_playlist(fetch_text(url, headers), url)
+    if not playlist.is_master:
+        return playlist
+
+    bandwidth, variant_url = max(playlist.variants)
+    media = parse_playlist(fetch_text(variant_url, headers), variant_url)
+    media.bandwidth = bandwidth or None
+    return media
@@ -0,0 +1,325 @@
+import base64
+import http.client
+import os
+import socket
+import ssl
+import threading
+import time
+import urllib.request
+from urllib.parse import unquote, urljoin, urlsplit
+
+# Which client to use: "stdlib" (http.client keep-alive, with the DNS cache),
+# "httpx" (HTTP/2 when the h2 package is installed), or "auto" for httpx when it
+# is importable. stdlib is the default because httpx resolves every new
+# connection itself - its public API has no hook for DNSCache
+HTTP_BACKEND = os.environ.get("TSD_HTTP_BACKEND", "stdlib")
+
+# Resolved addresses are reused this long
+DNS_TTL_SECONDS = 300
+
+# Idle keep-alive connections kept per host, and how long before they're dropped
+# (just under the usual 60s server-side keep-alive timeout)
+MAX_IDLE_PER_HOST = 16
+IDLE_TIMEOUT_SECONDS = 50
+
+MAX_REDIRECTS = 5
+REDIRECT_STATUSES = [301, 302, 303, 307, 308]
+
+# Errors that mean a reused keep-alive connection was closed by the server meanwhile
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine,
+                           ConnectionResetError, BrokenPipeError, ConnectionAbortedError)
+
+class HTTPStatusError(Exception):
+    """A response with a 4xx/5xx status"""
+
+    def __init__(self, url, status, headers=None):
+        super().__init__(f"HTTP {status} for {url}")
+        self.url = url
+        self.status = status
+        self.headers = headers or {}
+
+class Response:
+    def __init__(self, url, status, headers, body):
+        self.url = url
+        self.status = status
+        self.headers = {name.lower(): value for name, value in headers}
+        self.body = body
+
+    @property
+    def text(self):
+        return self.body.decode("utf-8", errors="replace")
+
+class PoolStats:
+    """Counters for judging connection reuse"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.dns_lookups = 0
+        self.dns_hits = 0
+
+    def count(self, name, amount=1):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def snapshot(self, backend):
+        with self.lock:
+            requests, connections = self.requests, self.connections
+            return {
+                "backend": backend,
+                "requests": requests,
+                "connections": connections,
+                # Share of requests that didn't need a new TCP/TLS handshake
+                "reuse_ratio": 1 - connections / requests if requests else None,
+                "dns_lookups": self.dns_lookups,
+                "dns_hits": self.dns_hits,
+            }
+
+class DNSCache:
+    """getaddrinfo() results per host, kept for DNS_TTL_SECONDS"""
+
+    def __init__(self, stats, ttl=DNS_TTL_SECONDS):
+        self.stats = stats
+        self.ttl = ttl
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def resolve(self, host, port):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get((host, port))
+            if entry and entry[0] > now:
+                self.stats.count("dns_hits")
+                return entry[1]
+        addresses = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        self.stats.count("dns_lookups")
+        with self.lock:
+            self.entries[(host, port)] = (now + self.ttl, addresses)
+        return addresses
+
+    def forget(self, host, port):
+        with self.lock:
+            self.entries.pop((host, port), None)
+
+    def create_connection(self, host, port, timeout):
+        """socket.create_connection(), but from the cached addresses"""
+        last_error = None
+        for family, type_, proto, _, address in self.resolve(host, port):
+            sock = socket.socket(family, type_, proto)
+            try:
+                sock.settimeout(timeout)
+                sock.connect(address)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                return sock
+            except OSError as e:
+                sock.close()
+                last_error = e
+        # The addresses may have moved - resolve again next time
+        self.forget(host, port)
+        raise last_error or OSError(f"Could not connect to {host}:{port}")
+
+class CachedDNSHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, host, port=None, timeout=None, dns=None):
+        super().__init__(host, port, timeout=timeout)
+        self.dns = dns
+
+    def connect(self):
+        self.sock = self.dns.create_connection(self.host, self.port, self.timeout)
+
+class CachedDNSHTTPSConnection(http.client.HTTPSConnection):
+    def __init__(self, host, port=None, timeout=None, dns=None, ssl_context=None):
+        super().__init__(host, port, timeout=timeout, context=ssl_context)
+        self.dns = dns
+        self.ssl_context = ssl_context
+
+    def connect(self):
+        sock = self.dns.create_connection(self.host, self.port, self.timeout)
+        # SNI and certificate checks still use the host name, not the cached address
+        self.sock = self.ssl_context.wrap_socket(sock, server_hostname=self.host)
+
+def proxy_auth_headers(proxy):
+    """Proxy-Authorization for a proxy URL with user:password in it"""
+    parts = urlsplit(proxy)
+    if parts.username is None:
+        return {}
+    credentials = f"{unquote(parts.username)}:{unquote(parts.password or '')}"
+    return {"Proxy-Authorization": "Basic " + base64.b64encode(credentials.encode()).decode()}
+
+class StdlibPool:
+    """Keep-alive connections per host over http.client, with cached DNS. Thread-safe.
+
+    Honours HTTP(S)_PROXY and NO_PROXY like urllib: plain HTTP goes through the
+    proxy, HTTPS through a CONNECT tunnel (both still kept alive).
+    """
+
+    name = "stdlib"
+
+    def __init__(self, max_idle_per_host=MAX_IDLE_PER_HOST, idle_timeout=IDLE_TIMEOUT_SECONDS):
+        self.max_idle_per_host = max_idle_per_host
+        self.idle_timeout = idle_timeout
+        self.stats = PoolStats()
+        self.dns = DNSCache(self.stats)
+        self.ssl_context = ssl.create_default_context()
+        self.proxies = urllib.request.getproxies()
+        self.idle = {}      # (scheme, host, port, proxy) -> [(connection, idle since)]
+        self.lock = threading.Lock()
+
+    def proxy_for(self, scheme, host):
+        """The proxy URL to reach host through, or None"""
+        proxy = self.proxies.get(scheme)
+        if not proxy or urllib.request.proxy_bypass(host):
+            return None
+        return proxy if "://" in proxy else "http://" + proxy
+
+    def checkout(self, key, timeout):
+        """(connection, reused) - an idle keep-alive connection if there is a fresh one"""
+        now = time.monotonic()
+        with self.lock:
+            connections = self.idle.get(key, [])
+            while connections:
+                connection, idle_since = connections.pop()
+                if now - idle_since < self.idle_timeout:
+                    if connection.sock:
+                        connection.sock.settimeout(timeout)
+                    return connection, True
+                connection.close()
+        scheme, host, port, proxy = key
+        if proxy:
+            # The proxy resolves the target's name, so the DNS cache isn't involved
+            proxy_parts = urlsplit(proxy)
+            proxy_port = proxy_parts.port or 80
+            if scheme == "https":
+                connection = http.client.HTTPSConnection(proxy_parts.hostname, proxy_port, timeout=timeout,
+                                                         context=self.ssl_context)
+                connection.set_tunnel(host, port, headers=proxy_auth_headers(proxy))
+            else:
+                connection = http.client.HTTPConnection(proxy_parts.hostname, proxy_port, timeout=timeout)
+        elif scheme == "https":
+            connection = CachedDNSHTTPSConnection(host, port, timeout, self.dns, self.ssl_context)
+        else:
+            connection = CachedDNSHTTPConnection(host, port, timeout, self.dns)
+        self.stats.count("connections")
+        return connection, False
+
+    def checkin(self, key, connection):
+        with self.lock:
+            connections = self.idle.setdefault(key, [])
+            if len(connections) < self.max_idle_per_host:
+                connections.append((connection, time.monotonic()))
+                return
+        connection.close()
+
+    def request_once(self, method, url, headers, timeout):
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        proxy = self.proxy_for(parts.scheme, parts.hostname)
+        key = (parts.scheme, parts.hostname, port, proxy)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        if proxy and parts.scheme == "http":
+            # A plain HTTP proxy takes the absolute URL
+            path = url.split("#")[0]
+            headers = dict(headers, **proxy_auth_headers(proxy))
+
+        while True:
+            connection, reused = self.checkout(key, timeout)
+            try:
+                connection.request(method, path, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+            except STALE_CONNECTION_ERRORS:
+                connection.close()
+                if reused:
+                    # The server closed it while it sat idle; try again on a fresh one
+                    continue
+                raise
+            except Exception:
+                connection.close()
+                raise
+            if response.will_close:
+                connection.close()
+            else:
+                self.checkin(key, connection)
+            return Response(url, response.status, response.getheaders(), body)
+
+    def request(self, method, url, headers=None, timeout=30):
+        for _ in range(MAX_REDIRECTS + 1):
+            self.stats.count("requests")
+            response = self.request_once(method, url, headers or {}, timeout)
+            location = response.headers.get("location")
+            if response.status not in REDIRECT_STATUSES or not location:
+                return response
+            url = urljoin(url, location)
+        raise HTTPStatusError(url, response.status, response.headers)
+
+class HttpxPool:
+    """httpx client with HTTP/2 when available: one multiplexed connection per host.
+
+    Opt-in (TSD_HTTP_BACKEND): addresses are resolved per new connection, not cached.
+    """
+
+    name = "httpx"
+
+    def __init__(self, max_idle_per_host=MAX_IDLE_PER_HOST, idle_timeout=IDLE_TIMEOUT_SECONDS):
+        import httpx
+
+        try:
+            import h2
+            http2 = True
+        except ImportError:
+            http2 = False
+        if http2:
+            self.name = "httpx (HTTP/2)"
+        self.stats = PoolStats()
+        self.client = httpx.Client(
+            http2=http2,
+            follow_redirects=True,
+            max_redirects=MAX_REDIRECTS,
+            limits=httpx.Limits(max_keepalive_connections=max_idle_per_host * 4,
+                                keepalive_expiry=idle_timeout),
+        )
+
+    def trace(self, event, info):
+        # httpcore reports each new TCP connection; reused ones skip this step
+        if event == "connection.connect_tcp.started":
+            self.stats.count("connections")
+
+    def request(self, method, url, headers=None, timeout=30):
+        self.stats.count("requests")
+        response = self.client.request(method, url, headers=headers, timeout=timeout,
+                                       extensions={"trace": self.trace})
+        return Response(str(response.url), response.status_code, response.headers.items(), response.content)
+
+def create_pool(backend=HTTP_BACKEND):
+    if backend in ("auto", "httpx"):
+        try:
+            return HttpxPool()
+        except ImportError:
+            if backend == "httpx":
+                raise RuntimeError("The httpx backend needs httpx - install it with: pip install httpx[http2]")
+    return StdlibPool()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """The process-wide pool, shared by playlist, probe and segment requests of every job"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = create_pool()
+        return _pool
+
+def request(method, url, headers=None, timeout=30):
+    """Make a request through the shared pool; raises HTTPStatusError for 4xx/5xx"""
+    response = get_pool().request(method, url, headers, timeout)
+    if response.status >= 400:
+        raise HTTPStatusError(url, response.status, response.headers)
+    return response
+
+def stats():
+    """Connection reuse so far: requests, connections opened, reuse_ratio, DNS lookups/hits"""
+    pool = get_pool()
+    return pool.stats.snapshot(pool.name)
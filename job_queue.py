@@ -0,0 +1,282 @@
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+QUEUE_NAME = "jobs.db"
+
+# A worker renews its jobs' leases every HEARTBEAT_SECONDS; jobs whose lease ran
+# out (the worker crashed or was redeployed) go back to pending
+LEASE_SECONDS = 120
+HEARTBEAT_SECONDS = 30
+
+# A job interrupted this many times is given up on instead of crash-looping a worker
+MAX_ATTEMPTS = 3
+
+FINISHED_STATES = ["done", "failed", "refused", "cancelled"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    url TEXT NOT NULL,
+    spec TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    checkpoint TEXT,
+    worker TEXT,
+    lease_until REAL,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_state ON jobs (kind, state, priority DESC, id);
+CREATE TABLE IF NOT EXISTS transitions (
+    job_id INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    at REAL NOT NULL,
+    detail TEXT
+);
+CREATE INDEX IF NOT EXISTS transitions_by_job ON transitions (job_id);
+"""
+
+class QueuedJob:
+    """One row of the queue"""
+
+    def __init__(self, row):
+        self.id = row["id"]
+        self.kind = row["kind"]
+        self.url = row["url"]
+        self.spec = json.loads(row["spec"])
+        self.priority = row["priority"]
+        self.state = row["state"]
+        self.attempts = row["attempts"]
+        self.checkpoint = json.loads(row["checkpoint"]) if row["checkpoint"] else {}
+        self.error = row["error"]
+
+def worker_id():
+    """host:pid:random - unique per process, even when a restarted container reuses the host name and pid"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+def worker_alive(worker):
+    """False if a worker on this host is certainly gone (its pid is free), else None.
+
+    A running pid proves nothing - it may have been reused - so only the lease can say a worker is alive.
+    """
+    host, pid = (worker.split(":") + ["", ""])[:2]
+    if host != socket.gethostname() or not pid.isdigit() or sys.platform == "win32":
+        # os.kill(pid, 0) would terminate the process on Windows
+        return None
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return None
+
+class JobQueue:
+    """Download jobs in an SQLite database (WAL mode), so none is lost to a crash.
+
+    Each job keeps its spec, state, attempt count and a checkpoint (whatever
+    the runner needs to resume, e.g. its file prefix), and every state change
+    is logged in transitions. Workers claim jobs under a lease they renew;
+    jobs of a worker that died go back to pending for the next one. Several
+    processes can share one file. Thread-safe (one connection per thread).
+    """
+
+    def __init__(self, path, lease=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        self.path = Path(path)
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.worker = worker_id()
+        self.local = threading.local()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db.executescript(SCHEMA)
+
+    @property
+    def db(self):
+        db = getattr(self.local, "db", None)
+        if db is None:
+            # Transactions are managed explicitly (BEGIN IMMEDIATE) in transaction()
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            # WAL + NORMAL: a commit survives a process crash; only a power cut can lose the last ones
+            db.execute("PRAGMA synchronous=NORMAL")
+            self.local.db = db
+        return db
+
+    @contextmanager
+    def transaction(self):
+        """BEGIN IMMEDIATE ... COMMIT: writers queue up on the lock instead of failing mid-way"""
+        db = self.db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def log(self, db, job_ids, state, detail=None, now=None):
+        now = now or time.time()
+        db.executemany("INSERT INTO transitions (job_id, state, at, detail) VALUES (?, ?, ?, ?)",
+                       [(job_id, state, now, detail) for job_id in job_ids])
+
+    def enqueue(self, url, spec=None, kind="cli", priority=0, claim=False):
+        """Add a job and return its id; with claim it's taken by this worker straight away"""
+        return self.enqueue_many([(url, spec)], kind, priority, claim)[0]
+
+    def enqueue_many(self, items, kind="cli", priority=0, claim=False):
+        """Add (url, spec) pairs in one transaction; returns their ids"""
+        now = time.time()
+        state = "claimed" if claim else "pending"
+        worker, lease_until = (self.worker, now + self.lease) if claim else (None, None)
+        ids = []
+        with self.transaction() as db:
+            for url, spec in items:
+                spec = spec or {}
+                cursor = db.execute(
+                    "INSERT INTO jobs (kind, url, spec, priority, state, max_attempts, worker, lease_until,"
+                    " created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (kind, url, json.dumps(spec), spec.get("priority", priority), state, self.max_attempts,
+                     worker, lease_until, now, now))
+                ids.append(cursor.lastrowid)
+            self.log(db, ids, state, now=now)
+        return ids
+
+    def recover(self, kind=None):
+        """Put jobs of dead workers back to pending; returns how many.
+
+        A worker is dead once its lease has run out, or sooner if its pid is gone.
+        """
+        now = time.time()
+        with self.transaction() as db:
+            placeholders = ",".join("?" * (len(FINISHED_STATES) + 1))
+            query = f"SELECT id, worker, lease_until, attempts FROM jobs WHERE state NOT IN ({placeholders})"
+            params = FINISHED_STATES + ["pending"]
+            if kind:
+                query += " AND kind = ?"
+                params.append(kind)
+            lost, exhausted = [], []
+            for row in db.execute(query, params):
+                if row["worker"] == self.worker:
+                    continue
+                expired = not row["worker"] or (row["lease_until"] or 0) <= now
+                if not expired and worker_alive(row["worker"]) is not False:
+                    continue
+                (exhausted if row["attempts"] >= self.max_attempts else lost).append(row["id"])
+            if lost:
+                db.executemany("UPDATE jobs SET state = 'pending', worker = NULL, lease_until = NULL,"
+                               " updated_at = ? WHERE id = ?", [(now, job_id) for job_id in lost])
+                self.log(db, lost, "pending", "interrupted", now)
+            if exhausted:
+                error = f"Interrupted {self.max_attempts} times - giving up"
+                db.executemany("UPDATE jobs SET state = 'failed', error = ?, worker = NULL, updated_at = ?"
+                               " WHERE id = ?", [(error, now, job_id) for job_id in exhausted])
+                self.log(db, exhausted, "failed", error, now)
+        return len(lost)
+
+    def claim(self, kind="cli", limit=None):
+        """Take pending jobs (highest priority, then oldest first) for this worker"""
+        self.recover(kind)
+        now = time.time()
+        with self.transaction() as db:
+            rows = db.execute("SELECT * FROM jobs WHERE kind = ? AND state = 'pending'"
+                              " ORDER BY priority DESC, id LIMIT ?", (kind, limit or -1)).fetchall()
+            ids = [row["id"] for row in rows]
+            db.executemany("UPDATE jobs SET state = 'claimed', worker = ?, lease_until = ?, updated_at = ?"
+                           " WHERE id = ?", [(self.worker, now + self.lease, now, job_id) for job_id in ids])
+            self.log(db, ids, "claimed", now=now)
+        jobs = [QueuedJob(row) for row in rows]
+        for job in jobs:
+            job.state = "claimed"
+        return jobs
+
+    def set_state(self, job_id, state, error=None, attempt=None):
+        """Record a state change (and its error, or none); "running" counts as a new
+        attempt unless attempt says otherwise"""
+        attempt = state == "running" if attempt is None else attempt
+        now = time.time()
+        finished = state in FINISHED_STATES or state == "pending"
+        with self.transaction() as db:
+            db.execute(
+                "UPDATE jobs SET state = ?, error = ?, updated_at = ?,"
+                " attempts = attempts + ?, worker = ?, lease_until = ? WHERE id = ?",
+                (state, error, now, 1 if attempt else 0,
+                 None if finished else self.worker, None if finished else now + self.lease, job_id))
+            self.log(db, [job_id], state, error, now)
+
+    def release(self, job_id, detail="interrupted"):
+        """Hand a job back to the queue unfinished (the next worker resumes it)"""
+        self.set_state(job_id, "pending", detail)
+
+    def checkpoint(self, job_id, **values):
+        """Merge values into the job's checkpoint"""
+        with self.transaction() as db:
+            row = db.execute("SELECT checkpoint FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            checkpoint = json.loads(row["checkpoint"]) if row and row["checkpoint"] else {}
+            checkpoint.update(values)
+            db.execute("UPDATE jobs SET checkpoint = ?, updated_at = ? WHERE id = ?",
+                       (json.dumps(checkpoint), time.time(), job_id))
+
+    def heartbeat(self):
+        """Renew the lease on every unfinished job this worker holds"""
+        placeholders = ",".join("?" * (len(FINISHED_STATES) + 1))
+        with self.transaction() as db:
+            db.execute(f"UPDATE jobs SET lease_until = ? WHERE worker = ? AND state NOT IN ({placeholders})",
+                       [time.time() + self.lease, self.worker] + FINISHED_STATES + ["pending"])
+
+    def get(self, job_id):
+        row = self.db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return QueuedJob(row) if row else None
+
+    def transitions(self, job_id):
+        """[(state, at, detail)] for a job, oldest first"""
+        rows = self.db.execute("SELECT state, at, detail FROM transitions WHERE job_id = ? ORDER BY rowid",
+                               (job_id,))
+        return [tuple(row) for row in rows]
+
+    def counts(self, kind=None):
+        """{state: number of jobs}"""
+        query = "SELECT state, COUNT(*) FROM jobs" + (" WHERE kind = ?" if kind else "") + " GROUP BY state"
+        return dict(self.db.execute(query, (kind,) if kind else ()).fetchall())
+
+    def run(self):
+        while not self.stop_event.wait(HEARTBEAT_SECONDS):
+            try:
+                self.heartbeat()
+            except sqlite3.Error:
+                pass
+
+    def start(self):
+        """Keep this worker's leases alive on a daemon thread"""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+def get_queue(path):
+    """The process-wide JobQueue for a database file"""
+    key = str(Path(path).resolve())
+    with _queues_lock:
+        if key not in _queues:
+            _queues[key] = JobQueue(path)
+        return _queues[key]
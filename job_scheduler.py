@@ -0,0 +1,444 @@
+import asyncio
+import datetime
+import itertools
+import os
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from disk_preflight import (
+    DEFAULT_AUDIO_BITRATE,
+    LIVE_ESTIMATE_SECONDS,
+    InsufficientSpace,
+    estimate_job_bytes,
+    estimate_source_bytes,
+    pick_playlist_url,
+    reservations,
+)
+from hls_playlist import load_media_playlist
+from spaces_api import (
+    DownloadResult,
+    download_async,
+    has_valid_cookies,
+    new_prefix,
+    normalize_space_url,
+    validate_space_url,
+)
+from credentials import get_credential_manager
+from space_metadata import fetch_metadata, metadata_cache
+from space_url import space_key
+from tool_registry import get_app_dir
+
+# Jobs resolved ahead of the ones running (metadata, size estimate, native playlist)
+PREFETCH_LOOKAHEAD = 2
+
+# A prefetched playlist older than this is fetched again (its segment URLs are signed)
+PREFETCH_MAX_AGE = 10 * 60
+
+# Conversions and speech analysis running at once (ffmpeg uses several cores each)
+TRANSCODE_CONCURRENCY = max(1, (os.cpu_count() or 2) // 2)
+
+# Every second a job waits counts as this many seconds off its length, so long
+# Spaces aren't starved by a stream of short ones
+AGING_FACTOR = 60
+
+# Assumed length of a Space nothing is known about yet
+UNKNOWN_DURATION_SECONDS = 3600
+
+# Least time between progress checkpoints written to the job queue
+CHECKPOINT_INTERVAL_SECONDS = 5
+
+_scheduled_ids = itertools.count(1)
+
+def estimate_seconds(info, source_bytes=None):
+    """A Space's expected length from its metadata, else from its estimated size"""
+    if info and info.get("is_live"):
+        return LIVE_ESTIMATE_SECONDS
+    if info and info.get("duration"):
+        return float(info["duration"])
+    if source_bytes:
+        return source_bytes * 8 / DEFAULT_AUDIO_BITRATE
+    return None
+
+def latency_summary(values):
+    """Count, mean and tail of a list of latencies in seconds"""
+    values = sorted(values)
+    if not values:
+        return {"jobs": 0}
+
+    def percentile(share):
+        return values[min(len(values) - 1, int(share * len(values)))]
+
+    return {
+        "jobs": len(values),
+        "mean": sum(values) / len(values),
+        "p50": percentile(0.5),
+        "p95": percentile(0.95),
+        "max": values[-1],
+    }
+
+class Lane:
+    """Slots for one kind of work (network-bound transfer, CPU-bound transcode).
+
+    Waiting jobs get a free slot by priority first, then shortest expected
+    length, where each second spent waiting takes AGING_FACTOR seconds off.
+    The time from queueing for the lane to leaving it is kept per job.
+    """
+
+    def __init__(self, name, capacity):
+        self.name = name
+        self.capacity = capacity
+        self.running = {}       # job id -> when it queued for the lane
+        self.waiters = []       # [(job, future, when it queued)]
+        self.latencies = []
+        self.grant_scheduled = False
+
+    def rank(self, job, queued_at, now):
+        return (-job.priority, job.expected_seconds - (now - queued_at) * AGING_FACTOR, queued_at)
+
+    async def acquire(self, job):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.waiters.append((job, future, time.monotonic()))
+        if not self.grant_scheduled:
+            # Granted on the next loop pass, so jobs submitted together are ranked together
+            self.grant_scheduled = True
+            loop.call_soon(self.grant)
+        try:
+            await future
+        except asyncio.CancelledError:
+            self.waiters = [waiter for waiter in self.waiters if waiter[1] is not future]
+            self.release(job)
+            raise
+
+    def release(self, job):
+        """Give a job's slot to the best waiter; does nothing if the job has none"""
+        queued_at = self.running.pop(job.id, None)
+        if queued_at is None:
+            return
+        self.latencies.append(time.monotonic() - queued_at)
+        self.grant()
+
+    def grant(self):
+        self.grant_scheduled = False
+        now = time.monotonic()
+        while self.waiters and len(self.running) < self.capacity:
+            best = min(self.waiters, key=lambda waiter: self.rank(waiter[0], waiter[2], now))
+            self.waiters.remove(best)
+            waiting_job, future, waiting_since = best
+            if not future.done():
+                self.running[waiting_job.id] = waiting_since
+                future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, job):
+        await self.acquire(job)
+        try:
+            yield
+        finally:
+            self.release(job)
+
+    def stats(self):
+        return latency_summary(self.latencies)
+
+class ScheduledJob:
+    """A Space queued for download, with its estimate and outcome"""
+
+    def __init__(self, url, formats=("m4a",), out_dir=None, cookies=None, keep_partial=False,
+                 packaging_factor=1.0, native=False, speech_index=False, trim_silence=False, priority=0,
+                 prefix=None):
+        app_dir = get_app_dir()
+        self.id = next(_scheduled_ids)
+        self.url = url
+        self.formats = [formats] if isinstance(formats, str) else list(formats)
+        self.out_dir = Path(out_dir) if out_dir else app_dir / "Downloads"
+        self.cookies = Path(cookies) if cookies else app_dir / "cookies.txt"
+        # Without explicit cookies a scheduler with a credential pool picks the account
+        self.pooled = cookies is None
+        self.account = None
+        self.keep_partial = keep_partial
+        self.packaging_factor = packaging_factor
+        self.native = native
+        self.speech_index = speech_index
+        self.trim_silence = trim_silence
+        # Higher runs first; equal priorities go shortest Space first
+        self.priority = priority
+        self.estimated_seconds = None
+        # Output file prefix, kept across restarts so partial files are resumed
+        self.prefix = prefix
+        self.queue_id = None
+        self.checkpointed_at = 0
+
+        self.state = "queued"
+        self.estimated_bytes = None
+        self.playlist = None
+        self.playlist_fetched_at = None
+        self.result = None
+        self.task = None
+        self.submitted_at = datetime.datetime.now()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def expected_seconds(self):
+        return self.estimated_seconds or UNKNOWN_DURATION_SECONDS
+
+    def spec(self):
+        """What it takes to recreate this job after a restart (see JobScheduler.resume)"""
+        return {
+            "formats": self.formats,
+            "out_dir": str(self.out_dir),
+            "cookies": None if self.pooled else str(self.cookies),
+            "keep_partial": self.keep_partial,
+            "packaging_factor": self.packaging_factor,
+            "native": self.native,
+            "speech_index": self.speech_index,
+            "trim_silence": self.trim_silence,
+            "priority": self.priority,
+        }
+
+class JobScheduler:
+    """Queues Space downloads, reserving disk space for each before it starts.
+
+    A job whose estimated peak disk use doesn't fit waits until running jobs
+    release their reservations; one that could never fit is refused. At most
+    max_concurrent jobs download at once.
+
+    The next lookahead jobs in the queue are resolved while those run: their
+    metadata is looked up, their size estimated and, for native jobs, the
+    playlist fetched. A freed slot goes straight to transferring.
+
+    Transfers and transcodes run in separate lanes (max_concurrent and
+    transcode_concurrency slots): a job converting its download has already
+    handed its transfer slot to the next job. Every lane, and the lookahead
+    window, serves higher priorities first and then shorter Spaces, with
+    aging (see Lane). Lengths come from cached metadata until a job is
+    resolved.
+
+    With a queue (job_queue.JobQueue) every job is also written to disk with
+    its state changes and file prefix; resume() picks up the jobs a crashed
+    or stopped run left unfinished.
+
+    With a credential pool, each job runs on the least-loaded healthy account;
+    a job that gets throttled moves on to the next account while the
+    throttled one cools down.
+    """
+
+    def __init__(self, max_concurrent=2, runner=None, on_state=None, disk=None, credentials=None,
+                 lookahead=PREFETCH_LOOKAHEAD, transcode_concurrency=TRANSCODE_CONCURRENCY, queue=None):
+        self.max_concurrent = max_concurrent
+        self.queue = queue
+        self.lookahead = lookahead
+        self.window = Lane("lookahead", max_concurrent + lookahead)
+        self.download_lane = Lane("download", max_concurrent)
+        self.transcode_lane = Lane("transcode", transcode_concurrency)
+        self.credentials = credentials
+        self.runner = runner or self.default_runner
+        self.on_state = on_state
+        self.disk = disk or reservations
+        self.jobs = []
+        self.by_key = {}
+
+    @asynccontextmanager
+    async def transcode_phase(self, job):
+        """Hand the job's transfer slot to the next job while it converts"""
+        self.download_lane.release(job)
+        async with self.transcode_lane.slot(job):
+            self.set_state(job, "transcoding")
+            yield
+
+    async def default_runner(self, job):
+        fresh = job.playlist_fetched_at and time.monotonic() - job.playlist_fetched_at < PREFETCH_MAX_AGE
+        return await download_async(job.url, job.formats, job.out_dir, job.cookies,
+                                    keep_partial=job.keep_partial, check_space=False,
+                                    native=job.native, speech_index=job.speech_index,
+                                    trim_silence=job.trim_silence,
+                                    playlist=job.playlist if fresh else None,
+                                    transcode_slot=lambda: self.transcode_phase(job),
+                                    prefix=job.prefix,
+                                    on_progress=lambda _, progress: self.checkpoint(job, progress))
+
+    def checkpoint(self, job, progress):
+        """Note a running job's progress in the queue, every few seconds at most"""
+        now = time.monotonic()
+        if self.queue and job.queue_id and now - job.checkpointed_at >= CHECKPOINT_INTERVAL_SECONDS:
+            job.checkpointed_at = now
+            # yt-dlp's progress also carries its whole info_dict - keep the counters only
+            keep = ("status", "downloaded_bytes", "total_bytes", "fragment_index", "fragment_count")
+            self.queue.checkpoint(job.queue_id, progress={key: progress.get(key) for key in keep if key in progress})
+
+    def set_state(self, job, state, attempt=None):
+        job.state = state
+        if self.queue and job.queue_id:
+            self.queue.set_state(job.queue_id, state, job.result.error if job.result else None, attempt)
+        if self.on_state:
+            self.on_state(job)
+
+    def estimate_cookies(self, job):
+        # Any healthy account will do for a metadata lookup
+        account = self.credentials.pick() if job.pooled and self.credentials else None
+        return account.path if account else job.cookies
+
+    async def run_with_account(self, job):
+        """Run a job on a pooled account, trying the next one if the account is to blame.
+
+        A rejected login first gets a session refresh - shared with every other
+        job that hit the same account - and the job retries with it.
+        """
+        if not (job.pooled and self.credentials):
+            result = await self.runner(job)
+            if result.failure == "auth" and await get_credential_manager(job.cookies).refresh_async():
+                result = await self.runner(job)
+            return result
+
+        result = None
+        for _ in range(max(1, len(self.credentials))):
+            account = await self.credentials.acquire_async(
+                on_wait=lambda seconds: self.set_state(job, "waiting_for_account"))
+            if account is None:
+                break
+            if job.state == "waiting_for_account":
+                self.set_state(job, "running", attempt=False)
+            job.cookies, job.account = account.path, account.name
+            failure = None
+            try:
+                result = await self.runner(job)
+                failure = None if result.success else result.failure
+            finally:
+                self.credentials.release(account, failure)
+            if failure is None:
+                return result
+            if failure == "auth":
+                # Back in rotation once its cookies file is rewritten
+                await get_credential_manager(account.path).refresh_async()
+
+        if result is None:
+            # Never fall back to the default cookies: they're one of the pool's
+            # accounts and may be the one sitting out a cooldown
+            return DownloadResult(url=job.url, error="No usable account", failure="throttled",
+                                  hint=self.credentials.unavailable_hint())
+        return result
+
+    def submit(self, url, formats=("m4a",), out_dir=None, cookies=None, queue_id=None, **options):
+        """Queue a download and return its ScheduledJob (call from a running loop).
+
+        Submitting the same Space again (by any URL spelling) with the same
+        formats and folder returns the job already queued, unless it failed.
+        queue_id is the job's row in the queue if it's already there (resume()).
+        """
+        job = ScheduledJob(url, formats, out_dir, cookies, **options)
+        if validate_space_url(url):
+            # Only what's already cached - the lookup itself happens in the lookahead window
+            job.estimated_seconds = estimate_seconds(metadata_cache.get(normalize_space_url(url)))
+        key = (space_key(url) or url.strip(), tuple(job.formats), job.out_dir)
+        existing = self.by_key.get(key)
+        if existing and existing.state not in ("failed", "refused", "cancelled"):
+            return existing
+        self.by_key[key] = job
+        self.jobs.append(job)
+        if self.queue:
+            job.queue_id = queue_id or self.queue.enqueue(url, job.spec(), claim=True)
+        job.task = asyncio.ensure_future(self._run(job))
+        return job
+
+    async def prefetch(self, job):
+        """Resolve what a job needs before it gets a slot; returns the source size estimate"""
+        cookies = self.estimate_cookies(job)
+        if not (validate_space_url(job.url) and has_valid_cookies(cookies)):
+            return None
+        url = normalize_space_url(job.url)
+        source_bytes = await estimate_source_bytes(url, cookies)
+        # Served from the metadata cache the estimate just filled
+        info = await fetch_metadata(url, cookies)
+        job.estimated_seconds = estimate_seconds(info, source_bytes)
+        if job.native:
+            playlist_url = pick_playlist_url(info) if info else None
+            if playlist_url:
+                try:
+                    job.playlist = await asyncio.get_running_loop().run_in_executor(
+                        None, load_media_playlist, playlist_url)
+                    job.playlist_fetched_at = time.monotonic()
+                except Exception:
+                    job.playlist = None
+        return source_bytes
+
+    async def _run(self, job):
+        try:
+            async with self.window.slot(job):
+                source_bytes = await self.prefetch(job)
+                outputs = job.formats + job.formats[:1] if job.trim_silence else job.formats
+                job.estimated_bytes = estimate_job_bytes(source_bytes, outputs, job.packaging_factor)
+                self.set_state(job, "ready")
+
+                async with self.disk.hold(job.out_dir, job.estimated_bytes,
+                                          on_wait=lambda nbytes: self.set_state(job, "waiting_for_space")):
+                    async with self.download_lane.slot(job):
+                        if not job.prefix:
+                            job.prefix = new_prefix()
+                            if self.queue and job.queue_id:
+                                self.queue.checkpoint(job.queue_id, prefix=job.prefix)
+                        job.started_at = datetime.datetime.now()
+                        self.set_state(job, "running")
+                        job.result = await self.run_with_account(job)
+                        job.playlist = None
+            self.set_state(job, "done" if job.result.success else "failed")
+        except InsufficientSpace as e:
+            job.result = DownloadResult(url=job.url, error=str(e),
+                                        hint="Free up disk space or choose another output folder.")
+            self.set_state(job, "refused")
+        except Exception as e:
+            # Whatever went wrong, the job ends with a result (callers read job.result.success)
+            job.result = DownloadResult(url=job.url, error=f"Unexpected error: {e}")
+            self.set_state(job, "failed")
+        except asyncio.CancelledError:
+            job.result = DownloadResult(url=job.url, error="Cancelled")
+            if self.queue and job.queue_id:
+                # Stopped, not given up on - the next run resumes it
+                self.queue.release(job.queue_id)
+                job.state = "cancelled"
+                if self.on_state:
+                    self.on_state(job)
+            else:
+                self.set_state(job, "cancelled")
+            raise
+        finally:
+            job.finished_at = datetime.datetime.now()
+        return job
+
+    def resume(self):
+        """Claim the queue's unfinished jobs (from an earlier run) and schedule them"""
+        jobs = []
+        for queued in self.queue.claim():
+            spec = dict(queued.spec)
+            formats = spec.pop("formats", ["m4a"])
+            out_dir = spec.pop("out_dir", None)
+            cookies = spec.pop("cookies", None)
+            prefix = queued.checkpoint.get("prefix")
+            job = self.submit(queued.url, formats, out_dir, cookies, queue_id=queued.id, prefix=prefix, **spec)
+            if job.queue_id != queued.id:
+                # The same Space was queued twice - it runs once
+                self.queue.set_state(queued.id, "cancelled", "Duplicate")
+            jobs.append(job)
+        return jobs
+
+    def latency_stats(self):
+        """Latency summaries (seconds) per lane, and of whole jobs from submission to finish"""
+        finished = [job for job in self.jobs if job.finished_at]
+        return {
+            "download": self.download_lane.stats(),
+            "transcode": self.transcode_lane.stats(),
+            "job": latency_summary([(job.finished_at - job.submitted_at).total_seconds() for job in finished]),
+        }
+
+    async def run_batch(self, urls, priorities=None, resume=False, **options):
+        """Queue every URL and wait for all of them; returns the ScheduledJobs in order.
+
+        priorities optionally maps URLs to a priority other than options' (default 0).
+        With resume the queue's unfinished jobs are run too, ahead of the new ones.
+        """
+        priorities = priorities or {}
+        default = options.pop("priority", 0)
+        jobs = self.resume() if resume else []
+        jobs += [self.submit(url, priority=priorities.get(url, default), **options) for url in urls]
+        await asyncio.gather(*(job.task for job in jobs))
+        return jobs
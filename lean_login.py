@@ -0,0 +1,245 @@
+import os
+import sys
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+LOGIN_URL = os.environ.get("TSD_LOGIN_URL", "https://x.com/i/flow/login")
+
+# Loaded to refresh a restored session; logged-out sessions get redirected to the login flow
+HOME_URL = os.environ.get("TSD_HOME_URL", "https://x.com/home")
+
+# Set TSD_LOGIN_BLOCKING=0 to load the login page in full (e.g. when X changes something)
+LOGIN_BLOCKING = os.environ.get("TSD_LOGIN_BLOCKING", "1") != "0"
+
+# Nothing the login form needs to work
+BLOCKED_RESOURCE_TYPES = ["image", "media", "font", "texttrack", "manifest"]
+
+# Hosts the login flow needs (subdomains included): X, its script CDN and the
+# Arkose captcha. Everything else - analytics, ads, other third parties - is
+# blocked. Add hosts with TSD_LOGIN_ALLOW_HOSTS=host1,host2
+ALLOWED_HOSTS = ["x.com", "twitter.com", "twimg.com", "arkoselabs.com", "funcaptcha.com"]
+ALLOWED_HOSTS += [host.strip() for host in os.environ.get("TSD_LOGIN_ALLOW_HOSTS", "").split(",") if host.strip()]
+
+# Subdomains of allowed hosts that are only telemetry
+BLOCKED_HOSTS = ["analytics.x.com", "analytics.twitter.com", "ads-api.x.com", "ads-api.twitter.com"]
+
+# Chromium switches for a short-lived, headless login on a small container
+LEAN_CHROMIUM_ARGS = [
+    "--disable-dev-shm-usage",
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--mute-audio",
+    "--no-first-run",
+    "--blink-settings=imagesEnabled=false",
+]
+
+def host_matches(host, patterns):
+    return any(host == pattern or host.endswith("." + pattern) for pattern in patterns)
+
+def browser_memory_bytes():
+    """Resident memory of the Chromium processes we started (Linux only, else None).
+
+    Shared pages are counted once per process, so this overstates a little -
+    fine for comparing runs.
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    parents = {}
+    names = {}
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f"/proc/{pid}/stat", 'r') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The name is in parentheses and may itself contain spaces
+        names[int(pid)] = stat[stat.index("(") + 1:stat.rindex(")")]
+        parents[int(pid)] = int(stat[stat.rindex(")") + 2:].split()[1])
+
+    def descends_from_us(pid):
+        while pid > 1:
+            pid = parents.get(pid, 0)
+            if pid == os.getpid():
+                return True
+        return False
+
+    total = 0
+    for pid, name in names.items():
+        if ("chrom" in name or "headless" in name) and descends_from_us(pid):
+            try:
+                with open(f"/proc/{pid}/statm", 'r') as f:
+                    total += int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+            except OSError:
+                pass
+    return total
+
+class LeanLogin:
+    """Opens a Chromium page that loads only what the X login flow needs.
+
+    Requests are intercepted: images, media and fonts are dropped, as is
+    every host outside the allowlist. Counts of requests made and blocked, bytes received, time and browser memory are kept so each login
+    can report what it cost.
+    """
+
+    def __init__(self, login_url=LOGIN_URL, blocking=LOGIN_BLOCKING, allowed_hosts=None):
+        self.login_url = login_url
+        self.blocking = blocking
+        # The login page's own host is always allowed (a mock page, a proxy)
+        self.allowed_hosts = list(allowed_hosts or ALLOWED_HOSTS) + [urlsplit(login_url).hostname or ""]
+        self.started = None
+        self.requests = 0
+        self.blocked = 0
+        self.bytes_received = 0
+        self.page = None
+        self.cdp = None
+
+    async def open(self, playwright, headless=True, args=(), **context_options):
+        """Launch Chromium and return (browser, context, page), ready for page.goto(self.login_url)"""
+        self.started = time.perf_counter()
+        launch_args = (LEAN_CHROMIUM_ARGS if self.blocking else []) + list(args)
+        browser = await playwright.chromium.launch(headless=headless, args=launch_args)
+        # Service workers would fetch behind the route handler's back
+        context = await browser.new_context(service_workers="block", **context_options)
+        context.on("request", self.count_request)
+        if self.blocking:
+            await context.route("**/*", self.handle_route)
+        self.page = await context.new_page()
+        try:
+            # Exact transfer sizes come from the DevTools protocol
+            self.cdp = await context.new_cdp_session(self.page)
+            await self.cdp.send("Network.enable")
+            self.cdp.on("Network.loadingFinished", self.count_bytes)
+        except Exception:
+            self.cdp = None
+        return browser, context, self.page
+
+    def is_allowed(self, request):
+        host = urlsplit(request.url).hostname or ""
+        if request.resource_type in BLOCKED_RESOURCE_TYPES:
+            return False
+        return host_matches(host, self.allowed_hosts) and not host_matches(host, BLOCKED_HOSTS)
+
+    async def handle_route(self, route):
+        if self.is_allowed(route.request):
+            await route.continue_()
+        else:
+            self.blocked += 1
+            await route.abort("blockedbyclient")
+
+    def count_request(self, request):
+        self.requests += 1
+
+    def count_bytes(self, event):
+        self.bytes_received += event.get("encodedDataLength", 0)
+
+    async def measure(self):
+        """What the login cost so far: seconds, requests, bytes, JS heap and browser memory"""
+        stats = {
+            "seconds": time.perf_counter() - self.started if self.started else None,
+            "requests": self.requests,
+            "blocked": self.blocked,
+            "bytes_received": self.bytes_received if self.cdp else None,
+            "js_heap_bytes": None,
+            "browser_bytes": browser_memory_bytes(),
+        }
+        if self.cdp:
+            try:
+                await self.cdp.send("Performance.enable")
+                metrics = await self.cdp.send("Performance.getMetrics")
+                values = {metric["name"]: metric["value"] for metric in metrics["metrics"]}
+                stats["js_heap_bytes"] = values.get("JSHeapUsedSize")
+            except Exception:
+                pass
+        return stats
+
+def describe_stats(stats):
+    """One line for the console or the page"""
+    parts = [f"login took {stats['seconds']:.1f}s", f"{stats['requests']} requests ({stats['blocked']} blocked)"]
+    if stats["bytes_received"] is not None:
+        parts.append(f"{stats['bytes_received'] / (1024 * 1024):.1f} MB received")
+    if stats["js_heap_bytes"]:
+        parts.append(f"JS heap {stats['js_heap_bytes'] / (1024 * 1024):.0f} MB")
+    if stats["browser_bytes"]:
+        parts.append(f"browser {stats['browser_bytes'] / (1024 * 1024):.0f} MB")
+    return ", ".join(parts)
+
+def storage_state_path(cookies_file):
+    """Saved browser session (cookies + local storage) for a cookies file: cookies.state.json"""
+    path = Path(cookies_file)
+    return path.with_name(f"{path.stem}.state.json")
+
+def has_storage_state(cookies_file):
+    return storage_state_path(cookies_file).exists()
+
+async def save_storage_state(context, cookies_file):
+    """Persist the context's full storage state next to the cookies, readable by us only"""
+    path = storage_state_path(cookies_file)
+    tmp_path = path.with_suffix(".tmp")
+    await context.storage_state(path=str(tmp_path))
+    try:
+        os.chmod(tmp_path, 0o600)
+    except OSError:
+        pass
+    os.replace(tmp_path, path)
+
+def write_netscape_cookies(cookies, cookies_file, comments=()):
+    """Write Playwright cookies in the Netscape format yt-dlp reads.
+
+    The file is replaced atomically, so a download reading it never sees a
+    half-written jar, whoever else is writing.
+    """
+    cookies_file = Path(cookies_file)
+    tmp_path = cookies_file.with_name(f".{cookies_file.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding='utf-8') as f:
+        f.write("# Netscape HTTP Cookie File\n")
+        for comment in comments:
+            f.write(f"# {comment}\n")
+        for cookie in cookies:
+            f.write(
+                f"{cookie['domain']}\t"
+                f"{'TRUE' if cookie['domain'].startswith('.') else 'FALSE'}\t"
+                f"{cookie['path']}\t"
+                f"{'TRUE' if cookie.get('secure', False) else 'FALSE'}\t"
+                f"{int(cookie['expires']) if cookie.get('expires') and cookie['expires'] > 0 else 0}\t"
+                f"{cookie['name']}\t"
+                f"{cookie['value']}\n"
+            )
+    os.replace(tmp_path, cookies_file)
+
+async def refresh_session(cookies_file, home_url=HOME_URL, timeout=20000):
+    """Restore the saved browser session and refresh cookies_file with one page load.
+
+    Returns False (leaving the cookies alone) when there is no saved session
+    or X no longer accepts it - then a full login is needed.
+    """
+    from playwright.async_api import async_playwright
+
+    state_path = storage_state_path(cookies_file)
+    if not state_path.exists():
+        return False
+    async with async_playwright() as p:
+        login = LeanLogin(login_url=home_url)
+        browser, context, page = await login.open(p, storage_state=str(state_path))
+        try:
+            await page.goto(home_url, wait_until="domcontentloaded", timeout=timeout)
+            try:
+                await page.wait_for_load_state("networkidle", timeout=timeout)
+            except Exception:
+                pass
+            if "login" in page.url or "/flow/" in page.url:
+                return False
+            cookies = await context.cookies()
+            if not any(cookie["name"] == "auth_token" for cookie in cookies):
+                return False
+            write_netscape_cookies(cookies, cookies_file)
+            # Rolled session tokens go back into the saved state too
+            await save_storage_state(context, cookies_file)
+            return True
+        finally:
+            await browser.close()
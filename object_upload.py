@@ -0,0 +1,268 @@
+import datetime
+import json
+import os
+import queue
+import threading
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from retention import pinned
+
+# S3 parts must be at least 5 MiB (all but the last); files smaller than one
+# part go up in a single request
+PART_SIZE = 16 * 1024 * 1024
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+# Parts of one file uploaded at once
+UPLOAD_WORKERS = 4
+
+# Where finished uploads are recorded, in the download folder
+UPLOAD_INDEX_NAME = "uploads.json"
+
+# A file's own metadata (yt-dlp's info JSON, the speech index), which also
+# gets the object URLs of the file's uploads
+METADATA_SUFFIXES = (".info.json", ".speech.json")
+
+# S3-compatible endpoint (MinIO, R2, ...); unset means AWS itself
+S3_ENDPOINT_URL = os.environ.get("TSD_S3_ENDPOINT_URL")
+
+def load_boto3():
+    """boto3 is only needed for uploads, so it is imported on first use"""
+    try:
+        import boto3
+    except ImportError:
+        raise RuntimeError("Uploading needs boto3 - install it with: pip install boto3")
+    return boto3
+
+def parse_target(target):
+    """(bucket, key prefix) for an s3://bucket/prefix target"""
+    parts = urlsplit(target)
+    if parts.scheme != "s3" or not parts.netloc:
+        raise ValueError(f"Upload target must look like s3://bucket/prefix, not {target}")
+    prefix = parts.path.strip("/")
+    return parts.netloc, prefix + "/" if prefix else ""
+
+def state_path_for(path):
+    """Resume state of a multipart upload: .<name>.upload.json next to the file
+    (same download group, so retention keeps or evicts it with the file)"""
+    path = Path(path)
+    return path.with_name(f".{path.name}.upload.json")
+
+class ObjectUploader:
+    """Uploads files to S3-compatible storage in concurrent multipart chunks.
+
+    Each part finished is recorded in a state file next to the upload, so an
+    interrupted upload resumes with the parts still missing instead of from
+    the start. The state is only trusted while the file is unchanged and the
+    storage still knows the upload.
+    """
+
+    def __init__(self, target, endpoint_url=S3_ENDPOINT_URL, part_size=PART_SIZE,
+                 workers=UPLOAD_WORKERS, client=None):
+        self.bucket, self.prefix = parse_target(target)
+        self.endpoint_url = endpoint_url
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.workers = workers
+        self._client = client
+        self.lock = threading.Lock()
+
+    @property
+    def client(self):
+        # boto3 clients are thread-safe, so the part workers share one
+        with self.lock:
+            if self._client is None:
+                self._client = load_boto3().client("s3", endpoint_url=self.endpoint_url)
+            return self._client
+
+    def object_key(self, path):
+        return self.prefix + Path(path).name
+
+    def object_url(self, key):
+        return f"s3://{self.bucket}/{key}"
+
+    def upload(self, path, on_progress=None):
+        """Upload one file; returns its record (bucket, key, url, etag, size).
+
+        on_progress(bytes_done, total) is called from the worker threads.
+        """
+        path = Path(path)
+        stat = path.stat()
+        key = self.object_key(path)
+        if stat.st_size <= self.part_size:
+            with open(path, 'rb') as f:
+                response = self.client.put_object(Bucket=self.bucket, Key=key, Body=f)
+            if on_progress:
+                on_progress(stat.st_size, stat.st_size)
+            etag = response.get("ETag")
+        else:
+            etag = self.upload_multipart(path, key, stat, on_progress)
+        return {
+            "bucket": self.bucket,
+            "key": key,
+            "url": self.object_url(key),
+            "etag": etag,
+            "size": stat.st_size,
+            "uploaded_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        }
+
+    def load_state(self, path, key, stat):
+        """The saved state of an earlier attempt at this exact upload, or None"""
+        try:
+            with open(state_path_for(path), 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except Exception:
+            return None
+        expected = {"bucket": self.bucket, "key": key, "size": stat.st_size,
+                    "mtime_ns": stat.st_mtime_ns, "part_size": self.part_size}
+        if any(state.get(name) != value for name, value in expected.items()):
+            return None
+        # The storage is the authority on which parts it has
+        try:
+            paginator = self.client.get_paginator("list_parts")
+            parts = {}
+            for page in paginator.paginate(Bucket=self.bucket, Key=key, UploadId=state["upload_id"]):
+                for part in page.get("Parts", []):
+                    parts[str(part["PartNumber"])] = part["ETag"]
+        except Exception:
+            return None
+        state["parts"] = parts
+        return state
+
+    def save_state(self, path, state):
+        state_path = state_path_for(path)
+        tmp_path = state_path.with_suffix(".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, state_path)
+
+    def upload_multipart(self, path, key, stat, on_progress=None):
+        state = self.load_state(path, key, stat)
+        if state is None:
+            response = self.client.create_multipart_upload(Bucket=self.bucket, Key=key)
+            state = {"bucket": self.bucket, "key": key, "upload_id": response["UploadId"],
+                     "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                     "part_size": self.part_size, "parts": {}}
+            self.save_state(path, state)
+
+        part_count = (stat.st_size + self.part_size - 1) // self.part_size
+        pending = [number for number in range(1, part_count + 1) if str(number) not in state["parts"]]
+        done_bytes = [stat.st_size - sum(self.part_length(number, stat.st_size) for number in pending)]
+        state_lock = threading.Lock()
+
+        def upload_part(number):
+            offset = (number - 1) * self.part_size
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                data = f.read(self.part_length(number, stat.st_size))
+            response = self.client.upload_part(Bucket=self.bucket, Key=key, UploadId=state["upload_id"],
+                                               PartNumber=number, Body=data)
+            with state_lock:
+                state["parts"][str(number)] = response["ETag"]
+                self.save_state(path, state)
+                done_bytes[0] += len(data)
+                if on_progress:
+                    on_progress(done_bytes[0], stat.st_size)
+
+        pool = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            futures = [pool.submit(upload_part, number) for number in pending]
+            done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+            for future in done:
+                # The first failed part ends the upload; the parts not started are
+                # dropped and the state keeps the finished ones for the next run
+                future.result()
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+        parts = [{"PartNumber": int(number), "ETag": etag}
+                 for number, etag in sorted(state["parts"].items(), key=lambda item: int(item[0]))]
+        response = self.client.complete_multipart_upload(Bucket=self.bucket, Key=key,
+                                                         UploadId=state["upload_id"],
+                                                         MultipartUpload={"Parts": parts})
+        try:
+            state_path_for(path).unlink()
+        except OSError:
+            pass
+        return response.get("ETag")
+
+    def part_length(self, number, size):
+        return min(self.part_size, size - (number - 1) * self.part_size)
+
+def metadata_paths_for(path):
+    """The metadata files next to path that describe it (<stem>.info.json, ...)"""
+    path = Path(path)
+    candidates = [path.with_name(path.stem + suffix) for suffix in METADATA_SUFFIXES]
+    return [candidate for candidate in candidates if candidate != path and candidate.exists()]
+
+def write_json(path, data, **options):
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, **options)
+    os.replace(tmp_path, path)
+
+def record_upload(path, record):
+    """Note where a file ended up: in the download folder's uploads.json and
+    under "uploads" in the file's own metadata files"""
+    path = Path(path)
+    index_path = path.parent / UPLOAD_INDEX_NAME
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+    except Exception:
+        index = {}
+    index[path.name] = record
+    write_json(index_path, index, indent=1)
+
+    for metadata_path in metadata_paths_for(path):
+        try:
+            with open(metadata_path, 'r', encoding='utf-8') as f:
+                metadata = json.load(f)
+        except Exception:
+            continue
+        if isinstance(metadata, dict):
+            metadata.setdefault("uploads", {})[path.name] = record["url"]
+            write_json(metadata_path, metadata)
+
+class UploadQueue:
+    """Uploads finished files on a background thread, so each upload overlaps
+    with the next download instead of running after the whole batch.
+
+    on_done(path, record, error) is called from that thread for every file.
+    """
+
+    def __init__(self, uploader, on_done=None):
+        self.uploader = uploader
+        self.on_done = on_done
+        self.queue = queue.Queue()
+        self.results = []
+        self.index_lock = threading.Lock()
+        self.thread = None
+
+    def submit(self, path):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        self.queue.put(Path(path))
+
+    def run(self):
+        while True:
+            path = self.queue.get()
+            record, error = None, None
+            try:
+                # Pinned so the retention sweep can't remove the file mid-upload
+                with pinned(path.parent, path.name):
+                    record = self.uploader.upload(path)
+                with self.index_lock:
+                    record_upload(path, record)
+            except Exception as e:
+                error = str(e)
+            self.results.append((path, record, error))
+            if self.on_done:
+                self.on_done(path, record, error)
+            self.queue.task_done()
+
+    def join(self):
+        """Wait for every submitted upload; returns [(path, record, error), ...]"""
+        self.queue.join()
+        return self.results
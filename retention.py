@@ -0,0 +1,203 @@
+import fnmatch
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# Never evict anything modified this recently - another process may still be writing it
+RECENT_GRACE_SECONDS = 10 * 60
+
+# How often the background sweep runs
+SWEEP_INTERVAL_SECONDS = 10 * 60
+
+def group_key(name):
+    """Files of one download share the part of their name before the first dot
+    (space_..._id.m4a, space_..._id.speech.json, .space_id.segments, ...)"""
+    return name.lstrip(".").split(".")[0]
+
+def entry_size(path):
+    if not path.is_dir():
+        return path.stat().st_size
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+class RetentionManager:
+    """Evicts old downloads from one folder by age, then least-recently-used
+    first until the folder fits its size quota.
+
+    A download's files (audio, sidecars, zip, segment folder) are evicted
+    together. Anything pinned with in_use() - a running download, a file
+    being served - is skipped, as is anything modified in the last few
+    minutes. Sweeps run on a background thread, never on a request.
+    """
+
+    def __init__(self, directory, patterns, max_age=None, max_bytes=None,
+                 min_age=RECENT_GRACE_SECONDS, interval=SWEEP_INTERVAL_SECONDS):
+        self.directory = Path(directory)
+        self.patterns = list(patterns)
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.min_age = min_age
+        self.interval = interval
+
+        self.pins = {}          # group key -> reference count
+        self.last_used = {}     # group key -> time of last access
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def acquire(self, name):
+        key = group_key(Path(name).name)
+        with self.lock:
+            self.pins[key] = self.pins.get(key, 0) + 1
+
+    def release(self, name):
+        key = group_key(Path(name).name)
+        with self.lock:
+            count = self.pins.get(key, 0) - 1
+            if count > 0:
+                self.pins[key] = count
+            else:
+                self.pins.pop(key, None)
+
+    @contextmanager
+    def in_use(self, name):
+        """Keep a download's files (by path or filename prefix) from being evicted"""
+        self.acquire(name)
+        try:
+            yield
+        finally:
+            self.touch(name)
+            self.release(name)
+
+    def touch(self, name):
+        """Record an access, for least-recently-used eviction"""
+        with self.lock:
+            self.last_used[group_key(Path(name).name)] = time.time()
+
+    def is_pinned(self, key):
+        # A pin may be a prefix of the group's key (e.g. space_20250101_120000)
+        return any(key.startswith(pin) for pin in self.pins)
+
+    def scan(self):
+        """{group key: {"paths", "size", "last_used"}} for every matching entry"""
+        groups = {}
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return groups
+        for entry in entries:
+            if not any(fnmatch.fnmatch(entry.name, pattern) for pattern in self.patterns):
+                continue
+            path = Path(entry.path)
+            try:
+                size = entry_size(path)
+                modified = entry.stat().st_mtime
+            except OSError:
+                continue
+            group = groups.setdefault(group_key(entry.name), {"paths": [], "size": 0, "last_used": 0})
+            group["paths"].append(path)
+            group["size"] += size
+            group["last_used"] = max(group["last_used"], modified)
+        return groups
+
+    def remove(self, group):
+        removed = []
+        for path in group["paths"]:
+            try:
+                if path.is_dir():
+                    shutil.rmtree(path)
+                else:
+                    path.unlink()
+                removed.append(path)
+            except OSError:
+                pass
+        return removed
+
+    def sweep(self):
+        """Evict what the policy allows; returns the paths removed"""
+        now = time.time()
+        groups = self.scan()
+        with self.lock:
+            for key, group in groups.items():
+                group["last_used"] = max(group["last_used"], self.last_used.get(key, 0))
+            evictable = sorted(
+                (key for key, group in groups.items()
+                 if not self.is_pinned(key) and now - group["last_used"] > self.min_age),
+                key=lambda key: groups[key]["last_used"]
+            )
+
+        removed = []
+        total = sum(group["size"] for group in groups.values())
+        for key in evictable:
+            group = groups[key]
+            expired = self.max_age is not None and now - group["last_used"] > self.max_age
+            over_quota = self.max_bytes is not None and total > self.max_bytes
+            if not expired and not over_quota:
+                continue
+            # Re-check under the lock: a download may have started since the scan
+            with self.lock:
+                if self.is_pinned(key):
+                    continue
+            removed.extend(self.remove(group))
+            total -= group["size"]
+            with self.lock:
+                self.last_used.pop(key, None)
+        return removed
+
+    def run(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception:
+                pass
+            if self.stop_event.wait(self.interval):
+                return
+
+    def start(self):
+        """Sweep now and then every interval, on a daemon thread"""
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+def get_manager(directory, patterns, **policy):
+    """The process-wide manager for a folder, created (not started) on first use.
+
+    Streamlit reruns the page script constantly, so managers live here rather
+    than in the script.
+    """
+    key = str(Path(directory).resolve())
+    with _managers_lock:
+        if key not in _managers:
+            _managers[key] = RetentionManager(directory, patterns, **policy)
+        return _managers[key]
+
+@contextmanager
+def pinned(directory, name):
+    """Pin name in directory's manager, if that folder has one (no-op otherwise)"""
+    if directory is None or name is None:
+        yield
+        return
+    with _managers_lock:
+        manager = _managers.get(str(Path(directory).resolve()))
+    if manager is None:
+        yield
+        return
+    with manager.in_use(name):
+        yield
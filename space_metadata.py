@@ -0,0 +1,80 @@
+import hashlib
+import json
+import time
+
+from download_engine import engine
+from tool_registry import get_cache_dir, registry
+
+# Subset of yt-dlp's info dict worth keeping between runs
+METADATA_FIELDS = [
+    "id", "title", "uploader", "upload_date", "duration", "live_status", "is_live",
+    "webpage_url", "filesize", "filesize_approx", "tbr", "abr", "url", "protocol",
+]
+FORMAT_FIELDS = ["format_id", "url", "protocol", "ext", "tbr", "abr", "filesize", "filesize_approx"]
+
+# Seconds before a live Space's metadata is considered stale (replays never change)
+LIVE_METADATA_MAX_AGE = 300
+
+class MetadataCache:
+    """yt-dlp metadata on disk, one small JSON file per Space"""
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir or get_cache_dir() / "metadata"
+
+    def path_for(self, key):
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:20]
+        return self.cache_dir / f"{digest}.json"
+
+    def get(self, key):
+        """Cached metadata for a key, or None if missing or stale"""
+        try:
+            with open(self.path_for(key), 'r', encoding='utf-8') as f:
+                info = json.load(f)
+        except Exception:
+            return None
+        if info.get("is_live") and time.time() - info.get("fetched_at", 0) > LIVE_METADATA_MAX_AGE:
+            return None
+        return info
+
+    def put(self, key, info):
+        """Store metadata, ignoring errors (the cache is only an optimisation)"""
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            with open(self.path_for(key), 'w', encoding='utf-8') as f:
+                json.dump(info, f, indent=2)
+        except Exception:
+            pass
+
+def slim_info(info):
+    """Keep only the fields we reuse, so cache files stay a few KB"""
+    slim = {name: info.get(name) for name in METADATA_FIELDS if info.get(name) is not None}
+    slim["formats"] = [
+        {name: fmt.get(name) for name in FORMAT_FIELDS if fmt.get(name) is not None}
+        for fmt in info.get("formats") or []
+    ]
+    slim["fetched_at"] = time.time()
+    return slim
+
+async def fetch_metadata(url, cookies_file, cache=None, timeout=120):
+    """Metadata for a Space from the cache, or from yt-dlp without downloading media"""
+    cache = cache or metadata_cache
+    info = cache.get(url)
+    if info:
+        return info
+
+    command = [
+        registry.path("yt-dlp"),
+        "--dump-single-json", "--skip-download", "--no-warnings",
+        "--cookies", str(cookies_file),
+        url
+    ]
+    # In-process when the engine runs yt-dlp that way
+    info = await engine.extract_info(command, timeout)
+    if not info:
+        return None
+    info = slim_info(info)
+    cache.put(url, info)
+    return info
+
+# Shared cache used by the preflight and the scheduler
+metadata_cache = MetadataCache()
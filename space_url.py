@@ -0,0 +1,120 @@
+import json
+import os
+import re
+import threading
+from collections import namedtuple
+from functools import lru_cache
+
+from space_metadata import fetch_metadata
+from tool_registry import get_cache_dir
+
+# Every URL form we accept, in one pass: x.com or twitter.com (www./mobile.
+# too), /i/spaces/<id>, /i/broadcasts/<id> or /<user>/status/<id>, with any
+# trailing path, query string or fragment
+SPACE_URL_PATTERN = re.compile(
+    r"^(?:https?://)?(?:www\.|mobile\.)?(?:x|twitter)\.com/"
+    r"(?:i/(?P<kind>spaces|broadcasts)/(?P<id>[A-Za-z0-9_-]+)"
+    r"|(?:i/web|[A-Za-z0-9_]{1,15})/status(?:es)?/(?P<status>[0-9]+))"
+    r"(?:[/?#].*)?$",
+    re.IGNORECASE
+)
+
+CANONICAL_URLS = {
+    "space": "https://x.com/i/spaces/{}",
+    "broadcast": "https://x.com/i/broadcasts/{}",
+    "status": "https://x.com/i/status/{}",
+}
+
+# What a URL points at: kind is "space", "broadcast" or "status" (a post that
+# embeds a Space, until resolve_space_key() maps it to the Space itself)
+SpaceKey = namedtuple("SpaceKey", ["kind", "id"])
+
+@lru_cache(maxsize=1024)
+def parse_space_url(url):
+    """The SpaceKey for a URL, or None if it isn't a Space/broadcast/status URL"""
+    match = SPACE_URL_PATTERN.match(url.strip())
+    if not match:
+        return None
+    if match.group("status"):
+        return SpaceKey("status", match.group("status"))
+    kind = "space" if match.group("kind").lower() == "spaces" else "broadcast"
+    return SpaceKey(kind, match.group("id"))
+
+def canonical_url(key):
+    return CANONICAL_URLS[key.kind].format(key.id)
+
+def validate_space_url(url):
+    """Whether url is a Space, broadcast or status URL we can download"""
+    return parse_space_url(url) is not None
+
+def normalize_space_url(url):
+    """One spelling per Space: https://x.com/i/spaces/<id> (and likewise for the other kinds)"""
+    key = parse_space_url(url)
+    return canonical_url(key) if key else url.strip()
+
+def space_key(url):
+    """Key for deduplicating and caching, without any network access.
+
+    Status URLs keep their own key here; resolve_space_key() maps them to the Space.
+    """
+    return parse_space_url(url)
+
+class StatusIndex:
+    """Status ID -> (kind, id) of the Space it embeds, learned once from yt-dlp and kept on disk"""
+
+    def __init__(self, index_file=None):
+        self.index_file = index_file or get_cache_dir() / "status_index.json"
+        self.lock = threading.Lock()
+        self.entries = None
+
+    def load(self):
+        if self.entries is None:
+            try:
+                with open(self.index_file, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except Exception:
+                self.entries = {}
+        return self.entries
+
+    def get(self, status_id):
+        with self.lock:
+            entry = self.load().get(status_id)
+        return SpaceKey(*entry) if entry else None
+
+    def put(self, status_id, key):
+        with self.lock:
+            self.load()[status_id] = list(key)
+            try:
+                self.index_file.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = self.index_file.with_suffix(".tmp")
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(self.entries, f)
+                os.replace(tmp_path, self.index_file)
+            except Exception:
+                pass
+
+async def resolve_space_key(url, cookies_file, index=None):
+    """The SpaceKey of the Space a URL points at, following status URLs.
+
+    A status URL costs one yt-dlp metadata lookup the first time; after that
+    the mapping comes from the index. Returns the status key itself if it
+    can't be resolved, and None for URLs that aren't Space URLs at all.
+    """
+    key = parse_space_url(url)
+    if not key or key.kind != "status":
+        return key
+
+    index = index or status_index
+    resolved = index.get(key.id)
+    if resolved:
+        return resolved
+
+    info = await fetch_metadata(canonical_url(key), cookies_file)
+    resolved = parse_space_url(info.get("webpage_url") or "") if info else None
+    if not resolved or resolved.kind == "status":
+        return key
+    index.put(key.id, resolved)
+    return resolved
+
+# Shared by everything that resolves status URLs
+status_index = StatusIndex()
@@ -0,0 +1,338 @@
+import asyncio
+import datetime
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from disk_preflight import (
+    InsufficientSpace,
+    estimate_job_bytes,
+    estimate_source_bytes,
+    pick_playlist_url,
+    reservations,
+)
+from audio_analysis import analyze_audio, index_path_for, load_numpy, trimmed_path_for
+from credential_pool import classify_failure
+from download_engine import CONVERT_ARGS, DownloadJob, build_convert_command, engine, new_prefix
+from hls_download import SegmentDownloader, SourceChanged, duration_matches, probe_duration
+from retention import pinned
+from space_metadata import fetch_metadata, metadata_cache
+from space_url import normalize_space_url, validate_space_url
+from tool_registry import ToolError, get_app_dir, registry
+
+SUPPORTED_FORMATS = ["m4a", "mp3", "mp4", "opus"]
+MEDIA_SUFFIXES = ['.mp4', '.m4a', '.mp3', '.opus']
+
+@dataclass
+class DownloadResult:
+    """Outcome of one download() call"""
+    url: str
+    success: bool = False
+    files: list = field(default_factory=list)
+    subtitles: list = field(default_factory=list)
+    error: str = None
+    hint: str = None
+    returncode: int = None
+    warnings: list = field(default_factory=list)
+    speech_index: Path = None
+    trimmed: Path = None
+    failure: str = None     # "throttled" or "auth" when the account is to blame
+
+@asynccontextmanager
+async def no_slot():
+    """Default transcode_slot: convert straight away"""
+    yield
+
+def has_valid_cookies(cookies_file):
+    """Check if a cookies file exists and contains an x.com auth_token"""
+    try:
+        with open(cookies_file, "r", encoding='utf-8') as f:
+            content = f.read()
+        return "auth_token" in content and "x.com" in content
+    except Exception:
+        return False
+
+def describe_error(stderr, format_ext):
+    """Turn yt-dlp stderr into a short hint for the user"""
+    error_output = stderr.lower()
+    if "ffmpeg" in error_output:
+        return "FFmpeg issue detected. FFmpeg may not be properly bundled."
+    elif classify_failure(stderr) == "throttled":
+        return "Rate limited by X - wait a while or add another account."
+    elif "auth" in error_output or "forbidden" in error_output:
+        return "Authentication issue - your cookies may have expired."
+    elif "not found" in error_output or "unavailable" in error_output:
+        return "Space not found or no longer available."
+    elif "private" in error_output:
+        return "This appears to be a private Space."
+    elif "format" in error_output:
+        return f"The requested {format_ext.upper()} format may not be available."
+    return "Check the error log for details."
+
+def write_error_log(error_log, url, format_ext, command, stdout, stderr):
+    """Save the full yt-dlp output of a failed download"""
+    with open(error_log, "w", encoding='utf-8') as log_file:
+        log_file.write(f"Error Log - {datetime.datetime.now()}\n")
+        log_file.write("=" * 50 + "\n")
+        log_file.write(f"URL: {url}\n")
+        log_file.write(f"Format: {format_ext}\n")
+        log_file.write(f"Command: {' '.join(command)}\n\n")
+        log_file.write("STDOUT:\n")
+        log_file.write(stdout + "\n\n")
+        log_file.write("STDERR:\n")
+        log_file.write(stderr)
+
+async def download_async(url, formats=("m4a",), out_dir=None, cookies=None, error_log=None,
+                         on_progress=None, keep_partial=False, check_space=True, native=False,
+                         speech_index=False, trim_silence=False, playlist=None, transcode_slot=no_slot,
+                         prefix=None):
+    """Coroutine version of download() for callers that already run an event loop.
+
+    With check_space the job's peak disk use is estimated from metadata or the
+    playlist and reserved up front; it fails right away if it won't fit.
+    Schedulers that reserve space themselves pass check_space=False.
+
+    native fetches the HLS segments directly instead of through yt-dlp, verifying
+    each one and re-fetching only damaged segments (ended Spaces only).
+
+    speech_index writes <output>.speech.json listing the speech segments of the
+    first output; trim_silence also writes a copy without long silences.
+
+    playlist is the Space's media playlist if the caller already fetched it
+    (native only), so the segment transfer starts right away.
+
+    transcode_slot() is entered around the CPU-bound part (conversion, speech
+    analysis), so a scheduler can let the next transfer start meanwhile.
+
+    prefix names the output files; passing the prefix of an interrupted run
+    lets yt-dlp resume its .part files.
+    """
+    result = DownloadResult(url=url)
+    if isinstance(formats, str):
+        formats = [formats]
+
+    if not validate_space_url(url):
+        result.error = "Invalid Twitter Space/Broadcast URL format"
+        return result
+
+    unknown = [f for f in formats if f not in SUPPORTED_FORMATS]
+    if unknown:
+        result.error = f"Unsupported format(s): {', '.join(unknown)}"
+        return result
+
+    if speech_index or trim_silence:
+        try:
+            load_numpy()
+        except RuntimeError as e:
+            result.error = str(e)
+            return result
+
+    app_dir = get_app_dir()
+    out_dir = Path(out_dir) if out_dir else app_dir / "Downloads"
+    cookies = Path(cookies) if cookies else app_dir / "cookies.txt"
+    error_log = Path(error_log) if error_log else app_dir / "error.log"
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    if not has_valid_cookies(cookies):
+        result.error = f"No valid authentication in {cookies}"
+        result.hint = "Run the downloader interactively once to set up cookies."
+        return result
+
+    normalized_url = normalize_space_url(url)
+    prefix = prefix or new_prefix()
+    jobs = [
+        engine.create_job(normalized_url, format_ext, out_dir, cookies, prefix=prefix,
+                          keep_partial=keep_partial)
+        for format_ext in formats
+    ]
+
+    try:
+        for job in jobs:
+            registry.preflight(job.command, job.format_ext, ytdlp=not engine.in_process)
+    except ToolError as e:
+        result.error = str(e)
+        return result
+
+    if native:
+        run = run_native_download(normalized_url, formats, out_dir, cookies, prefix, result, on_progress,
+                                  speech_index or trim_silence, trim_silence, playlist, transcode_slot)
+    else:
+        run = run_download_jobs(jobs, result, error_log, on_progress)
+
+    async def finish():
+        # Pinned until the post-processing is done, not just the yt-dlp run
+        with pinned(out_dir, prefix):
+            await verify_outputs(await run, normalized_url)
+            if (speech_index or trim_silence) and result.success and not result.speech_index:
+                async with transcode_slot():
+                    await add_speech_index(result, trim_silence)
+        return result
+
+    if not check_space:
+        return await finish()
+
+    # The trimmed copy is one more output of at most the first format's size
+    outputs = formats + formats[:1] if trim_silence else formats
+    needed = estimate_job_bytes(await estimate_source_bytes(normalized_url, cookies), outputs)
+    try:
+        async with reservations.hold(out_dir, needed, wait=False):
+            return await finish()
+    except InsufficientSpace as e:
+        run.close()
+        result.error = str(e)
+        result.hint = "Free up disk space or choose another output folder."
+        return result
+
+async def verify_outputs(result, url):
+    """Warn about outputs whose duration doesn't match the Space's metadata"""
+    info = metadata_cache.get(url)
+    expected = info.get("duration") if info and not info.get("is_live") else None
+    if not result.success or not expected:
+        return result
+    loop = asyncio.get_running_loop()
+    for path in result.files:
+        actual = await loop.run_in_executor(None, probe_duration, path)
+        if not duration_matches(actual, expected):
+            result.warnings.append(
+                f"{path.name} is {actual:.0f}s long but the Space is {expected:.0f}s - it may be truncated"
+            )
+    return result
+
+async def add_speech_index(result, trim_silence=False):
+    """Index speech in the first output (and trim it) unless that was done during conversion.
+
+    This is optional post-processing, so a failure is a warning, not a failed download.
+    """
+    if not result.success or result.speech_index or not result.files:
+        return result
+    source = result.files[0]
+    trim_path = trimmed_path_for(source) if trim_silence else None
+    try:
+        await analyze_audio(source, index_path_for(source), trim_path)
+    except RuntimeError as e:
+        result.warnings.append(f"Speech analysis failed: {e}")
+        return result
+    result.speech_index = index_path_for(source)
+    result.trimmed = trim_path
+    return result
+
+async def run_native_download(url, formats, out_dir, cookies, prefix, result, on_progress=None,
+                              speech_index=False, trim_silence=False, playlist=None, transcode_slot=no_slot):
+    """Fetch, verify and assemble the Space's segments, then convert to each format.
+
+    Segments are kept in a per-Space work folder, so a rerun after a failure
+    only re-fetches what is missing or damaged. A changed playlist (the source
+    itself changed) discards them and starts over. With speech_index every
+    conversion, the analysis and the trimming share one decode of the source.
+    """
+    info = await fetch_metadata(url, cookies)
+    playlist_url = pick_playlist_url(info) if info else None
+    if not playlist_url:
+        result.error = "No HLS playlist found for this Space"
+        result.hint = "Try again without --native to let yt-dlp handle it."
+        return result
+
+    stem = f"{prefix}_{info.get('uploader', 'NA')}_{info.get('upload_date', 'NA')}_{info.get('id', 'NA')}"
+    work_dir = out_dir / f".space_{info.get('id', prefix)}.segments"
+    downloader = SegmentDownloader(playlist_url, work_dir)
+    loop = asyncio.get_running_loop()
+
+    try:
+        await loop.run_in_executor(None, downloader.open, playlist)
+    except SourceChanged:
+        downloader.reset()
+        await loop.run_in_executor(None, downloader.open)
+
+    if not downloader.playlist.ended:
+        result.error = "This Space is still live - native mode only handles recordings"
+        result.hint = "Try again without --native to let yt-dlp follow the live stream."
+        return result
+
+    def segment_progress(done, total):
+        if on_progress:
+            on_progress(None, {"fragment_index": done, "fragment_count": total})
+
+    assembled = out_dir / f"{stem}.aac"
+    # Pinned so the retention sweep leaves the segment folder alone while it's in use
+    with pinned(out_dir, work_dir.name):
+        try:
+            problems = await downloader.download(on_progress=segment_progress)
+            if problems:
+                result.error = f"{len(problems)} segment(s) could not be fetched intact"
+                result.hint = "Run the same download again - only the bad segments are re-fetched."
+                return result
+
+            await loop.run_in_executor(None, downloader.assemble, assembled)
+            async with transcode_slot():
+                expected = downloader.playlist.duration
+                targets = {format_ext: out_dir / f"{stem}.{format_ext}" for format_ext in formats}
+                if speech_index:
+                    first = targets[formats[0]]
+                    trim_path = trimmed_path_for(first) if trim_silence else None
+                    outputs = [(target, CONVERT_ARGS[format_ext]) for format_ext, target in targets.items()]
+                    try:
+                        await analyze_audio(assembled, index_path_for(first), trim_path, outputs)
+                    except RuntimeError as e:
+                        result.error = str(e)
+                        result.hint = describe_error(str(e), formats[0])
+                        return result
+                    result.speech_index = index_path_for(first)
+                    result.trimmed = trim_path
+
+                for format_ext, target in targets.items():
+                    if not speech_index:
+                        job = DownloadJob(build_convert_command(assembled, target, CONVERT_ARGS[format_ext]),
+                                          out_dir=out_dir, prefix=prefix, url=url, format_ext=format_ext)
+                        await engine.run_job(job)
+                        result.returncode = job.returncode
+                        if not job.success:
+                            result.error = f"FFmpeg exited with code {job.returncode}"
+                            result.hint = describe_error(job.stderr, format_ext)
+                            return result
+
+                    actual = await loop.run_in_executor(None, probe_duration, target)
+                    if not duration_matches(actual, expected):
+                        result.error = f"{target.name} is {actual:.0f}s long but the playlist is {expected:.0f}s"
+                        return result
+                    result.files.append(target)
+        finally:
+            # Verified segments are kept after a failure whatever keep_partial says:
+            # they are what lets the next run repair instead of re-download
+            assembled.unlink(missing_ok=True)
+            if result.files and not result.error:
+                downloader.reset()
+
+    result.success = True
+    return result
+
+async def run_download_jobs(jobs, result, error_log, on_progress=None):
+    """Run one Space's per-format jobs in order, filling in result"""
+    for job in jobs:
+        await engine.run_job(job, on_progress=on_progress)
+        result.returncode = job.returncode
+        if not job.success:
+            result.error = f"yt-dlp exited with code {job.returncode}"
+            result.hint = describe_error(job.stderr, job.format_ext)
+            result.failure = classify_failure(job.stderr)
+            write_error_log(error_log, result.url, job.format_ext, job.command, job.stdout, job.stderr)
+            return result
+
+        result.files.extend(job.output_files(f"*.{job.format_ext}"))
+
+    result.subtitles = jobs[0].output_files("*.srt")
+    result.success = True
+    return result
+
+def download(url, formats=("m4a",), out_dir=None, cookies=None, error_log=None, keep_partial=False,
+             native=False, speech_index=False, trim_silence=False):
+    """Download a Space without any prompts and return a DownloadResult.
+
+    formats is a list of SUPPORTED_FORMATS; out_dir and cookies default to the
+    app's Downloads folder and cookies.txt. Safe to call from cron jobs,
+    containers or other Python code - nothing here reads stdin or prints.
+    Interrupting it stops the whole yt-dlp/ffmpeg process tree and removes
+    partial files unless keep_partial is set.
+    """
+    return asyncio.run(download_async(url, formats, out_dir, cookies, error_log,
+                                      keep_partial=keep_partial, native=native,
+                                      speech_index=speech_index, trim_silence=trim_silence))
@@ -0,0 +1,105 @@
+from types import SimpleNamespace
+
+import pytest
+
+import adaptive_concurrency
+from adaptive_concurrency import AIMDLimiter, MAX_RETRY_AFTER_SECONDS
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class HTTPError(Exception):
+    def __init__(self, status, headers=None):
+        self.status = status
+        self.headers = headers or {}
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(adaptive_concurrency, "time", SimpleNamespace(monotonic=clock))
+    return clock
+
+def run_window(limiter, clock, seconds, nbytes=1000):
+    """One full window of requests that each took seconds"""
+    started = clock.now
+    clock.now += seconds
+    for _ in range(limiter.current):
+        limiter.record(nbytes, started)
+
+def test_steady_latency_doubles_during_slow_start(clock):
+    limiter = AIMDLimiter(initial=2, maximum=16)
+    run_window(limiter, clock, 1.0)
+    assert limiter.current == 4
+    run_window(limiter, clock, 1.0)
+    assert limiter.current == 8
+
+def test_limit_stays_within_maximum(clock):
+    limiter = AIMDLimiter(initial=4, maximum=6)
+    for _ in range(3):
+        run_window(limiter, clock, 1.0)
+    assert limiter.current == 6
+
+def test_queueing_shrinks_then_grows_by_one(clock):
+    limiter = AIMDLimiter(initial=4, maximum=16)
+    run_window(limiter, clock, 1.0)
+    assert limiter.current == 8
+    # Twice as slow per byte: half of every request's time was spent queued
+    run_window(limiter, clock, 2.0)
+    assert limiter.current == 7
+    # Fast again, but past slow start: additive increase
+    run_window(limiter, clock, 1.0)
+    assert limiter.current == 8
+
+def test_429_halves_at_once(clock):
+    limiter = AIMDLimiter(initial=8, maximum=16)
+    wait = limiter.record_failure(clock.now, HTTPError(429))
+    assert limiter.current == 4
+    assert wait == adaptive_concurrency.THROTTLE_BACKOFF_SECONDS
+    # No more doubling after a decrease
+    run_window(limiter, clock, 1.0)
+    assert limiter.current == 5
+
+def test_429_never_goes_below_minimum(clock):
+    limiter = AIMDLimiter(initial=2, minimum=2, maximum=16)
+    limiter.record_failure(clock.now, HTTPError(429))
+    assert limiter.current == 2
+
+def test_retry_after_is_honoured_and_capped(clock):
+    limiter = AIMDLimiter()
+    assert limiter.record_failure(clock.now, HTTPError(429, {"retry-after": "7"})) == 7
+    assert limiter.record_failure(clock.now, HTTPError(429, {"retry-after": "3600"})) == MAX_RETRY_AFTER_SECONDS
+
+def test_requests_from_before_a_change_are_ignored(clock):
+    limiter = AIMDLimiter(initial=8, maximum=16)
+    started = clock.now
+    clock.now += 1
+    limiter.record_failure(clock.now, HTTPError(429))
+    assert limiter.current == 4
+    # Started under the old limit: neither another halving nor a window
+    limiter.record_failure(started, HTTPError(429))
+    for _ in range(8):
+        limiter.record(1000, started)
+    assert limiter.current == 4
+
+def test_odd_server_error_is_tolerated(clock):
+    limiter = AIMDLimiter(initial=4, maximum=16)
+    limiter.record_failure(clock.now, HTTPError(503))
+    assert limiter.current == 4
+    limiter.record_failure(clock.now, HTTPError(503))
+    assert limiter.current == 2
+
+def test_client_errors_dont_count(clock):
+    limiter = AIMDLimiter(initial=4, maximum=16)
+    assert limiter.record_failure(clock.now, HTTPError(404)) == 0
+    assert limiter.current == 4
+
+def test_fixed_limiter_never_changes(clock):
+    limiter = AIMDLimiter(initial=3, minimum=3, maximum=3)
+    assert not limiter.adaptive
+    run_window(limiter, clock, 1.0)
+    limiter.record_failure(clock.now, HTTPError(429))
+    assert limiter.current == 3
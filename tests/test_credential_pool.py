@@ -0,0 +1,120 @@
+import asyncio
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import credential_pool
+from credential_pool import MAX_COOLDOWN_SECONDS, CredentialPool, classify_failure
+
+COOLDOWN = 60
+
+class Clock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(credential_pool, "time", SimpleNamespace(time=clock))
+    return clock
+
+def write_jar(path, token="secret", expires=0, mtime=None):
+    path.write_text("# Netscape HTTP Cookie File\n"
+                    f".x.com\tTRUE\t/\tTRUE\t{expires}\tauth_token\t{token}\n", encoding="utf-8")
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+    return path
+
+@pytest.fixture
+def pool(tmp_path, clock):
+    return CredentialPool([write_jar(tmp_path / "a.txt"), write_jar(tmp_path / "b.txt")], cooldown=COOLDOWN)
+
+def test_acquire_spreads_jobs_over_accounts(pool):
+    first, second, third = pool.acquire(), pool.acquire(), pool.acquire()
+    assert first is not second
+    assert third is first
+    assert (first.active, second.active) == (2, 1)
+
+def test_throttle_cooldown_doubles_with_each_strike(tmp_path, clock):
+    pool = CredentialPool([write_jar(tmp_path / "a.txt")], cooldown=COOLDOWN)
+    for strike in range(1, 4):
+        account = pool.acquire()
+        pool.release(account, "throttled")
+        assert account.cooldown_until - clock.now == COOLDOWN * 2 ** (strike - 1)
+        assert pool.acquire() is None
+        assert pool.next_available_at() == account.cooldown_until
+        clock.now = account.cooldown_until
+    assert pool.acquire() is account
+
+def test_cooldown_is_capped(tmp_path, clock):
+    pool = CredentialPool([write_jar(tmp_path / "a.txt")], cooldown=COOLDOWN)
+    account = pool.acquire()
+    account.strikes = 20
+    pool.release(account, "throttled")
+    assert account.cooldown_until - clock.now == MAX_COOLDOWN_SECONDS
+
+def test_success_clears_the_strikes(tmp_path, clock):
+    pool = CredentialPool([write_jar(tmp_path / "a.txt")], cooldown=COOLDOWN)
+    pool.release(pool.acquire(), "throttled")
+    clock.now += COOLDOWN
+    account = pool.acquire()
+    pool.release(account)
+    assert account.strikes == 0
+    assert account.completed == 1
+    pool.release(pool.acquire(), "throttled")
+    assert account.cooldown_until - clock.now == COOLDOWN
+
+def test_throttled_account_is_skipped(pool):
+    throttled = pool.acquire()
+    pool.release(throttled, "throttled")
+    assert {pool.acquire() for _ in range(3)} == {account for account in pool.healthy()}
+    assert throttled not in pool.healthy()
+
+def test_auth_failure_expires_the_account_until_its_jar_is_rewritten(tmp_path, clock):
+    jar = write_jar(tmp_path / "a.txt", mtime=clock.now - 100)
+    pool = CredentialPool([jar], cooldown=COOLDOWN)
+    account = pool.acquire()
+    pool.release(account, "auth")
+    assert account.state == "expired"
+    clock.now += 24 * 3600
+    assert pool.acquire() is None
+    # Expired isn't throttled: there is nothing to wait for
+    assert pool.next_available_at() is None
+    assert "log in again" in pool.unavailable_hint()
+
+    write_jar(jar, token="fresh", mtime=clock.now)
+    assert pool.acquire() is account
+    assert account.state == "healthy"
+
+def test_expired_cookie_is_never_handed_out(tmp_path, clock):
+    pool = CredentialPool([write_jar(tmp_path / "a.txt", expires=int(clock.now) - 1)])
+    assert pool.acquire() is None
+    assert pool.accounts[str((tmp_path / "a.txt").resolve())].state == "expired"
+
+def test_jar_without_auth_token_is_invalid(tmp_path, clock):
+    jar = tmp_path / "a.txt"
+    jar.write_text("# Netscape HTTP Cookie File\n", encoding="utf-8")
+    assert CredentialPool([jar]).acquire() is None
+
+def test_acquire_async_gives_up_when_the_cooldown_outlasts_the_wait(tmp_path, clock):
+    pool = CredentialPool([write_jar(tmp_path / "a.txt")], cooldown=COOLDOWN)
+    pool.release(pool.acquire(), "throttled")
+    waits = []
+    account = asyncio.run(pool.acquire_async(max_wait=COOLDOWN / 2, on_wait=waits.append))
+    assert account is None
+    assert waits == []
+    assert "throttled" in pool.unavailable_hint()
+
+@pytest.mark.parametrize("stderr, verdict", [
+    ("ERROR: HTTP Error 429: Too Many Requests", "throttled"),
+    ("ERROR: [twitter] 1YqJDqWqWbWJV: HTTP Error 403: Forbidden", "auth"),
+    ("ERROR: Unable to download: status code 401", "auth"),
+    ("ERROR: [twitter:broadcast] 1OdJrXWaPVPJX429: Space ended", None),
+    ("ERROR: unable to write data: No space left on device", None),
+])
+def test_classify_failure(stderr, verdict):
+    assert classify_failure(stderr) == verdict
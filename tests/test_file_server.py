@@ -0,0 +1,46 @@
+import pytest
+
+from file_server import parse_range
+
+SIZE = 1000
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-499", (0, 499)),
+    ("bytes=500-", (500, 999)),
+    ("bytes=0-", (0, 999)),
+    ("bytes=999-999", (999, 999)),
+    # An end past the file is clamped
+    ("bytes=900-5000", (900, 999)),
+    # Suffix ranges: the last N bytes, or the whole file if N is larger
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    (" bytes=10-20 ", (10, 20)),
+])
+def test_satisfiable_ranges(header, expected):
+    assert parse_range(header, SIZE) == expected
+
+@pytest.mark.parametrize("header", [
+    None,
+    "",
+    "bytes=-",
+    "items=0-10",
+    # Several ranges: answered with the whole file
+    "bytes=0-10,20-30",
+    "bytes=abc-def",
+])
+def test_whole_file(header):
+    assert parse_range(header, SIZE) is None
+
+@pytest.mark.parametrize("header", [
+    "bytes=1000-",
+    "bytes=5000-6000",
+    "bytes=500-100",
+    "bytes=-0",
+])
+def test_unsatisfiable_ranges(header):
+    with pytest.raises(ValueError):
+        parse_range(header, SIZE)
+
+def test_empty_file():
+    with pytest.raises(ValueError):
+        parse_range("bytes=0-", 0)
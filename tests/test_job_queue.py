@@ -0,0 +1,111 @@
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+from job_queue import JobQueue
+
+@pytest.fixture
+def db_path(tmp_path):
+    return tmp_path / "jobs.db"
+
+def hand_to(queue, job_id, worker, lease_until):
+    """Make a job look like another worker holds it"""
+    with queue.transaction() as db:
+        db.execute("UPDATE jobs SET state = 'running', worker = ?, lease_until = ? WHERE id = ?",
+                   (worker, lease_until, job_id))
+
+def dead_worker():
+    """A worker id on this host whose pid is certainly free"""
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return f"{socket.gethostname()}:{process.pid}:deadbeef"
+
+def test_claim_takes_highest_priority_then_oldest(db_path):
+    queue = JobQueue(db_path)
+    low = queue.enqueue("https://x.com/i/spaces/low")
+    high = queue.enqueue("https://x.com/i/spaces/high", priority=5)
+    later = queue.enqueue("https://x.com/i/spaces/later")
+    assert [job.id for job in queue.claim(limit=2)] == [high, low]
+    assert [job.id for job in queue.claim()] == [later]
+    assert queue.claim() == []
+
+def test_claimed_jobs_are_not_handed_out_twice(db_path):
+    first, second = JobQueue(db_path), JobQueue(db_path)
+    job_id = first.enqueue("https://x.com/i/spaces/a")
+    assert [job.id for job in first.claim()] == [job_id]
+    assert second.claim() == []
+    assert first.get(job_id).state == "claimed"
+
+def test_claim_only_takes_its_kind(db_path):
+    queue = JobQueue(db_path)
+    queue.enqueue("https://x.com/i/spaces/a", kind="web")
+    assert queue.claim("cli") == []
+    assert len(queue.claim("web")) == 1
+
+def test_expired_lease_goes_back_to_pending(db_path):
+    crashed, survivor = JobQueue(db_path), JobQueue(db_path)
+    job_id = crashed.enqueue("https://x.com/i/spaces/a", claim=True)
+    hand_to(crashed, job_id, "elsewhere:1:abcdef12", time.time() - 1)
+
+    assert survivor.recover() == 1
+    job = survivor.get(job_id)
+    assert job.state == "pending"
+    assert job.error is None
+    assert ("pending", "interrupted") in [(state, detail) for state, _, detail in survivor.transitions(job_id)]
+    assert [job.id for job in survivor.claim()] == [job_id]
+
+def test_live_lease_is_left_alone(db_path):
+    queue = JobQueue(db_path)
+    job_id = queue.enqueue("https://x.com/i/spaces/a")
+    hand_to(queue, job_id, "elsewhere:1:abcdef12", time.time() + 60)
+    assert queue.recover() == 0
+    assert queue.get(job_id).state == "running"
+
+@pytest.mark.skipif(sys.platform == "win32", reason="pids aren't probed on Windows")
+def test_dead_pid_is_recovered_before_its_lease_runs_out(db_path):
+    queue = JobQueue(db_path)
+    job_id = queue.enqueue("https://x.com/i/spaces/a")
+    hand_to(queue, job_id, dead_worker(), time.time() + 60)
+    assert queue.recover() == 1
+    assert queue.get(job_id).state == "pending"
+
+def test_own_jobs_are_never_recovered(db_path):
+    queue = JobQueue(db_path)
+    job_id = queue.enqueue("https://x.com/i/spaces/a", claim=True)
+    hand_to(queue, job_id, queue.worker, time.time() - 1)
+    assert queue.recover() == 0
+    assert queue.get(job_id).state == "running"
+
+def test_job_interrupted_too_often_fails(db_path):
+    queue = JobQueue(db_path, max_attempts=2)
+    job_id = queue.enqueue("https://x.com/i/spaces/a")
+    for _ in range(2):
+        queue.claim()
+        queue.set_state(job_id, "running")
+        hand_to(queue, job_id, "elsewhere:1:abcdef12", time.time() - 1)
+        queue.recover()
+    job = queue.get(job_id)
+    assert job.state == "failed"
+    assert job.attempts == 2
+    assert "giving up" in job.error
+    assert queue.claim() == []
+
+def test_waiting_for_an_account_is_not_a_new_attempt(db_path):
+    queue = JobQueue(db_path)
+    job_id = queue.enqueue("https://x.com/i/spaces/a", claim=True)
+    queue.set_state(job_id, "running")
+    queue.set_state(job_id, "waiting_for_account")
+    queue.set_state(job_id, "running", attempt=False)
+    assert queue.get(job_id).attempts == 1
+
+def test_release_hands_the_job_to_the_next_worker(db_path):
+    first, second = JobQueue(db_path), JobQueue(db_path)
+    job_id = first.enqueue("https://x.com/i/spaces/a", claim=True)
+    first.checkpoint(job_id, prefix="abc")
+    first.release(job_id)
+    [job] = second.claim()
+    assert job.id == job_id
+    assert job.checkpoint == {"prefix": "abc"}
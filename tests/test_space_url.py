@@ -0,0 +1,44 @@
+import pytest
+
+from space_url import SpaceKey, canonical_url, normalize_space_url, parse_space_url
+
+@pytest.mark.parametrize("url, key", [
+    ("https://x.com/i/spaces/1eaKbrPAqbwKX", SpaceKey("space", "1eaKbrPAqbwKX")),
+    ("https://twitter.com/i/spaces/1eaKbrPAqbwKX", SpaceKey("space", "1eaKbrPAqbwKX")),
+    ("http://www.x.com/i/spaces/1eaKbrPAqbwKX/peek", SpaceKey("space", "1eaKbrPAqbwKX")),
+    ("mobile.twitter.com/i/spaces/1eaKbrPAqbwKX?s=20#top", SpaceKey("space", "1eaKbrPAqbwKX")),
+    ("  https://X.COM/I/SPACES/1eaKbrPAqbwKX  ", SpaceKey("space", "1eaKbrPAqbwKX")),
+    ("https://x.com/i/broadcasts/1OdJrXWaPVPJX", SpaceKey("broadcast", "1OdJrXWaPVPJX")),
+    ("https://x.com/someone/status/1790000000000000000", SpaceKey("status", "1790000000000000000")),
+    ("https://twitter.com/someone/statuses/1790000000000000000/", SpaceKey("status", "1790000000000000000")),
+    ("https://x.com/i/web/status/1790000000000000000?s=46", SpaceKey("status", "1790000000000000000")),
+])
+def test_accepted_urls(url, key):
+    assert parse_space_url(url) == key
+
+@pytest.mark.parametrize("url", [
+    "",
+    "https://example.com/i/spaces/1eaKbrPAqbwKX",
+    "https://x.com.evil.com/i/spaces/1eaKbrPAqbwKX",
+    "https://x.com/i/spaces/",
+    "https://x.com/someone",
+    "https://x.com/someone/status/not-a-number",
+    "https://x.com/a_name_that_is_far_too_long/status/1790000000000000000",
+])
+def test_rejected_urls(url):
+    assert parse_space_url(url) is None
+
+def test_every_spelling_normalizes_to_one_url():
+    spellings = [
+        "https://twitter.com/i/spaces/1eaKbrPAqbwKX",
+        "www.x.com/i/spaces/1eaKbrPAqbwKX?s=20",
+        "https://mobile.x.com/i/spaces/1eaKbrPAqbwKX/peek",
+    ]
+    assert {normalize_space_url(url) for url in spellings} == {"https://x.com/i/spaces/1eaKbrPAqbwKX"}
+
+def test_other_urls_are_only_stripped():
+    assert normalize_space_url(" https://example.com/video ") == "https://example.com/video"
+
+def test_canonical_url_round_trips():
+    for key in [SpaceKey("space", "abc"), SpaceKey("broadcast", "def"), SpaceKey("status", "123")]:
+        assert parse_space_url(canonical_url(key)) == key
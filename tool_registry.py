@@ -0,0 +1,215 @@
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+# Version flag for each external tool we shell out to
+VERSION_FLAGS = {
+    "yt-dlp": "--version",
+    "ffmpeg": "-version",
+    "ffprobe": "-version",
+}
+
+# ffmpeg encoder each output format needs
+FORMAT_ENCODERS = {
+    "mp3": ["libmp3lame"],
+    "m4a": ["aac"],
+    "opus": ["libopus"],
+    "mp4": [],
+}
+
+class ToolError(Exception):
+    """Raised when a required tool is missing, broken or lacks a capability"""
+
+def get_bundled_path(filename):
+    """Get path to bundled file in PyInstaller exe"""
+    if getattr(sys, 'frozen', False):
+        # Running as compiled exe
+        return os.path.join(sys._MEIPASS, filename)
+    else:
+        # Running as script - look in current directory
+        return filename
+
+def get_app_dir():
+    """Directory holding cookies, settings, caches and the Downloads folder"""
+    if getattr(sys, 'frozen', False):
+        return Path.home() / "TwitterSpacesDownloader"
+    return Path(__file__).parent
+
+def get_cache_dir():
+    """Directory for caches that can be rebuilt at any time (kept out of a source checkout)"""
+    if getattr(sys, 'frozen', False):
+        return get_app_dir()
+    base = os.environ.get("LOCALAPPDATA") if sys.platform == "win32" else os.environ.get("XDG_CACHE_HOME")
+    return Path(base or Path.home() / ".cache") / "TwitterSpacesDownloader"
+
+def get_cache_file():
+    """Location of the on-disk tool discovery cache"""
+    return get_cache_dir() / "tool_cache.json"
+
+def load_tool_cache():
+    """Load cached discovery results - {name: {path, version, mtime}}"""
+    try:
+        with open(get_cache_file(), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def save_tool_cache(cache):
+    """Save discovery results, ignoring errors (the cache is only an optimisation)"""
+    try:
+        cache_file = get_cache_file()
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(cache_file, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, indent=2)
+    except Exception:
+        pass
+
+def get_mtime(path):
+    """Modification time of a file, or None if it does not exist"""
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+def probe_version(path, name):
+    """Run the tool's version flag once and return the first output line"""
+    flag = VERSION_FLAGS.get(name, "--version")
+    try:
+        result = subprocess.run([path, flag], capture_output=True, text=True, timeout=15)
+        if result.returncode == 0 and result.stdout:
+            return result.stdout.splitlines()[0].strip()
+    except Exception:
+        pass
+    return None
+
+def discover_tool(name):
+    """Locate a tool without consulting the cache - bundled exe first, then PATH"""
+    bundled = get_bundled_path(f"{name}.exe")
+    if os.path.exists(bundled):
+        return os.path.abspath(bundled)
+    return shutil.which(name)
+
+def find_tool(name, probe=True):
+    """Return cached discovery info for a tool: {path, version, mtime, capabilities}.
+
+    A cache entry is reused as long as the binary it points to still exists with
+    the same mtime, so repeat launches never shell out. Returns None when the
+    tool cannot be found.
+    """
+    cache = load_tool_cache()
+    entry = cache.get(name)
+    if entry and entry.get("path") and get_mtime(entry["path"]) == entry.get("mtime"):
+        if probe and not entry.get("version"):
+            entry["version"] = probe_version(entry["path"], name)
+            save_tool_cache(cache)
+        return entry
+
+    path = discover_tool(name)
+    if not path:
+        return None
+
+    entry = {
+        "path": path,
+        "version": probe_version(path, name) if probe else None,
+        "mtime": get_mtime(path),
+        "capabilities": None,
+    }
+    cache[name] = entry
+    save_tool_cache(cache)
+    return entry
+
+def find_tool_path(name):
+    """Path to a tool, falling back to the bare name and hoping it is on PATH"""
+    entry = registry.get(name)
+    if entry:
+        return entry["path"]
+    return name
+
+def probe_capabilities(path, name):
+    """List what a tool supports: long flags for yt-dlp, encoders for ffmpeg"""
+    if name == "yt-dlp":
+        args, pattern = [path, "--help"], re.compile(r"(--[a-z0-9][a-z0-9-]*)")
+    elif name == "ffmpeg":
+        args, pattern = [path, "-hide_banner", "-encoders"], re.compile(r"^ [A-Z.]{6} (\S+)", re.M)
+    else:
+        return []
+    try:
+        result = subprocess.run(args, capture_output=True, text=True, timeout=15)
+    except Exception:
+        return []
+    return sorted(set(pattern.findall(result.stdout)))
+
+class ToolRegistry:
+    """Per-session view of the external tools.
+
+    Each tool is discovered (and its version probed) at most once per session;
+    capabilities are probed lazily and stored in the on-disk cache next to the
+    discovery result, so they are only re-probed when the binary changes.
+    """
+
+    def __init__(self):
+        self.tools = {}
+        self.lock = threading.Lock()
+
+    def get(self, name):
+        """Discovery info for a tool, or None if it is not installed"""
+        with self.lock:
+            if name not in self.tools:
+                self.tools[name] = find_tool(name)
+            return self.tools[name]
+
+    def path(self, name):
+        """Resolved path to a tool, or the bare name if discovery failed"""
+        entry = self.get(name)
+        return entry["path"] if entry else name
+
+    def capabilities(self, name):
+        """Set of flags/encoders the tool supports, probed once per binary"""
+        entry = self.get(name)
+        if not entry:
+            return set()
+        with self.lock:
+            if entry.get("capabilities") is None:
+                entry["capabilities"] = probe_capabilities(entry["path"], name)
+                cache = load_tool_cache()
+                cache[name] = entry
+                save_tool_cache(cache)
+            return set(entry["capabilities"])
+
+    def require(self, name, flags=(), encoders=()):
+        """Raise ToolError unless the tool exists, runs, and supports what we pass it"""
+        entry = self.get(name)
+        if not entry:
+            raise ToolError(f"{name} not found (bundled or on PATH)")
+        if not entry.get("version"):
+            raise ToolError(f"{name} at {entry['path']} did not respond to its version flag")
+
+        wanted = list(flags) + list(encoders)
+        if not wanted:
+            return entry
+        supported = self.capabilities(name)
+        if not supported:
+            raise ToolError(f"Could not list capabilities of {name} at {entry['path']}")
+        missing = [item for item in wanted if item not in supported]
+        if missing:
+            raise ToolError(f"{name} {entry['version']} does not support: {', '.join(missing)}")
+        return entry
+
+    def preflight(self, command, format_ext, ytdlp=True):
+        """Check a yt-dlp command line and its output format before starting a job.
+
+        Pass ytdlp=False when the command runs through the yt_dlp module
+        instead of the executable.
+        """
+        if ytdlp:
+            flags = [arg for arg in command[1:] if arg.startswith("--")]
+            self.require("yt-dlp", flags=flags)
+        self.require("ffmpeg", encoders=FORMAT_ENCODERS.get(format_ext, []))
+
+# Shared by every downloader in the process
+registry = ToolRegistry()